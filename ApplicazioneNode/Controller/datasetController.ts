@@ -8,6 +8,7 @@ import { updateToken } from '../Utils/utils';
 import { User } from '../init_database';
 import { inferenceQueue } from '../Config/inferenceQueue_config';
 import '../Worker/inferenceWorker'; // Assuming this imports a worker for inference processing
+import { InferenceProgress } from '../Worker/inferenceWorker';
 import ErrorFactory, { ErrorType } from '../Errors/errorFactory';
 import db from '../Config/db_config';
 
@@ -210,7 +211,19 @@ export const datasetController = {
             res.status(500).json({ status: 'Failed', failedReason: job.failedReason });
           }
         } else if (await job.isActive()) {
-          res.json({ status: 'Running' });
+          // While the worker streams the results, report progress and partial predictions
+          // (the batches appended to the job log up to the current progress)
+          const progress = job.progress as InferenceProgress | number;
+          if (typeof progress === 'object' && progress !== null) {
+            // with no batches yet skip the request: getJobLogs with end -1 would return every row
+            const { logs } = progress.chunks > 0
+              ? await inferenceQueue.getJobLogs(jobId, 0, progress.chunks - 1)
+              : { logs: [] as string[] };
+            const partialResult = logs.flatMap(row => JSON.parse(row) as object[]);
+            res.json({ status: 'Running', processed: progress.processed, total: progress.total, partialResult });
+          } else {
+            res.json({ status: 'Running' });
+          }
         } else if (await job.isWaiting()) {
           res.json({ status: 'Pending' });
         } else if (await job.isDelayed()) {
@@ -0,0 +1,52 @@
+/**
+ * Content-Type of the binary inference payload understood by the Flask service (see DeepLearning/transport.py).
+ */
+export const FRAMES_CONTENT_TYPE = 'application/x-spectrogram-frames';
+
+const MAGIC = Buffer.from('SPF1', 'ascii');
+
+/**
+ * Spectrogram as stored in the job data: `data` is a Buffer or, once the job has been
+ * serialised to Redis, its JSON form `{ type: 'Buffer', data: number[] }`.
+ */
+export interface FrameSpectrogram {
+  name: string;
+  data: Buffer | { type: 'Buffer'; data: number[] };
+}
+
+/**
+ * Converts the spectrogram data back to a Buffer, whatever form it was stored in.
+ * @param data - Buffer or its JSON serialisation.
+ * @returns The raw PNG bytes.
+ */
+function toBuffer(data: FrameSpectrogram['data']): Buffer {
+  return Buffer.isBuffer(data) ? data : Buffer.from(data.data);
+}
+
+/**
+ * Encodes the model id and the spectrograms as length-prefixed raw PNG frames (big-endian):
+ * 'SPF1' | uint16 modelId length | modelId | uint32 count | (uint16 name length | name | uint32 png length | png)*
+ * @param modelId - Id of the model to use for inference.
+ * @param spectrograms - Spectrograms to send.
+ * @returns The request body to POST with FRAMES_CONTENT_TYPE.
+ */
+export function encodeSpectrogramFrames(modelId: string, spectrograms: FrameSpectrogram[]): Buffer {
+  const modelIdBytes = Buffer.from(modelId, 'utf8');
+  const header = Buffer.alloc(2 + modelIdBytes.length + 4);
+  header.writeUInt16BE(modelIdBytes.length, 0);
+  modelIdBytes.copy(header, 2);
+  header.writeUInt32BE(spectrograms.length, 2 + modelIdBytes.length);
+
+  const parts: Buffer[] = [MAGIC, header];
+  for (const spectrogram of spectrograms) {
+    const name = Buffer.from(spectrogram.name, 'utf8');
+    const png = toBuffer(spectrogram.data);
+    const frameHeader = Buffer.alloc(2 + name.length + 4);
+    frameHeader.writeUInt16BE(name.length, 0);
+    name.copy(frameHeader, 2);
+    frameHeader.writeUInt32BE(png.length, 2 + name.length);
+    parts.push(frameHeader, png);
+  }
+
+  return Buffer.concat(parts);
+}
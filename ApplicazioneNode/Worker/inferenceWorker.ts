@@ -1,6 +1,19 @@
 import { Worker, ConnectionOptions } from 'bullmq';
 import { redisOptions } from '../Config/redis_config';
 import axios from 'axios';
+import { encodeSpectrogramFrames, FRAMES_CONTENT_TYPE } from '../Utils/frame_utils';
+
+/**
+ * Progress stored on the job while the Flask server streams the results back.
+ * Each batch of predictions is appended to the job log (one JSON row per batch), so every
+ * update only carries the counts and the latest batch instead of all the results so far.
+ */
+export interface InferenceProgress {
+  processed: number; // Spectrograms processed so far
+  total: number; // Spectrograms in the job
+  chunks: number; // Batches of predictions appended to the job log so far
+  latestResults: object[]; // Predictions of the latest batch
+}
 
 /**
  * Worker instance responsible for performing inference tasks.
@@ -8,16 +21,62 @@ import axios from 'axios';
  */
 const inferenceWorker = new Worker('inferenceQueue', async job => {
   try {
+    if (job.name === 'Aborted') {
+      // Placeholder job for a request rejected for insufficient tokens: nothing to run
+      throw new Error('Job aborted');
+    }
     const { modelId, spectrograms } = job.data;
 
-    // Send POST request to Flask server for inference
-    const response = await axios.post('http://flask_app:5000/inference', { modelId, spectrograms });
+    // A retried job starts from scratch: drop the batches logged by the previous attempt
+    await job.clearLogs();
+    const initialProgress: InferenceProgress = { processed: 0, total: spectrograms.length, chunks: 0, latestResults: [] };
+    await job.updateProgress(initialProgress);
+
+    // Send POST request to Flask server for inference, with the PNGs as raw binary frames.
+    // Results are streamed back as NDJSON, one line per processed batch.
+    const body = encodeSpectrogramFrames(modelId, spectrograms);
+    const response = await axios.post('http://flask_app:5000/inference?stream=1', body, {
+      headers: { 'Content-Type': FRAMES_CONTENT_TYPE },
+      maxBodyLength: Infinity,
+      responseType: 'stream',
+    });
+    response.data.setEncoding('utf8');
+
+    const results: object[] = [];
+    let chunks = 0;
+    let pending = '';
+    for await (const chunk of response.data) {
+      pending += chunk;
+      let newline = pending.indexOf('\n');
+      while (newline >= 0) {
+        const line = pending.slice(0, newline).trim();
+        pending = pending.slice(newline + 1);
+        newline = pending.indexOf('\n');
+        if (!line) {
+          continue;
+        }
+
+        const message = JSON.parse(line);
+        if (message.error) {
+          throw new Error(message.error);
+        }
+
+        // Append the batch to the job log and store the progress so the status endpoint can report them
+        results.push(...message.predictions);
+        chunks = await job.log(JSON.stringify(message.predictions));
+        const progress: InferenceProgress = {
+          processed: message.processed, total: message.total, chunks, latestResults: message.predictions,
+        };
+        await job.updateProgress(progress);
+      }
+    }
 
     // Return response data to indicate successful completion of job
-    return response.data;
+    return results;
   } catch (error) {
-    // Handle errors that occur during inference processing
+    // Log and rethrow, so that BullMQ marks the job as failed (and retries it if configured)
     console.error('Error processing inference job:', error);
+    throw error;
   }
 }, {
   // Worker configuration options
@@ -1,36 +1,280 @@
 import json
-from flask import Flask, request, jsonify
-from image_utils import decode_image_from_buffer
+import os
+import shutil
+import tempfile
+import time
+import torch
+from flask import Flask, Response, request, jsonify
+from image_utils import decode_images_to_batch
 from basic_test import Inference
+from model_registry import UnknownModelError, registry
+from batch_scheduler import MicroBatchScheduler
+from prediction_cache import PredictionCache, redis_from_env
+from transport import FRAMES_MIMETYPE, FrameFormatError, decode_frames
+from audio_inference import (DEFAULT_THRESHOLD, audio_timeline, count_windows, events_from_probabilities,
+                             order_sources, predict_windows, recording_samples)
+from audio_stream import SR
+from spectrogram_engine import CONTEXT_S
+from postprocessing import PostProcessing
+from ensemble import ensemble_result
+from cascade import cascade_predict, cascade_result
 
 app = Flask(__name__)
 
+# numero massimo di spettrogrammi per singola forward di CRNN_2
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", 32))
+# thread usati per decodificare i PNG (0 = decodifica nel thread della richiesta)
+DECODE_THREADS = int(os.environ.get("DECODE_THREADS", 0))
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+if os.environ.get("PRELOAD_MODELS") == "1":
+    registry.preload()
+
+# micro-batching: gli spettrogrammi di richieste concorrenti per lo stesso modello
+# vengono eseguiti in batch condivisi (MICROBATCH_MAX_WAIT_MS=0 per disattivarlo)
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 5))
+scheduler = MicroBatchScheduler(registry, INFERENCE_BATCH_SIZE, MICROBATCH_MAX_WAIT_MS) if MICROBATCH_MAX_WAIT_MS > 0 else None
+
+# cache delle predizioni per (hash PNG, modelId, versione checkpoint); PREDICTION_CACHE_SIZE=0 la disattiva
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 100000))
+cache = PredictionCache(PREDICTION_CACHE_SIZE, redis_from_env()) if PREDICTION_CACHE_SIZE > 0 else None
+if cache is not None:
+    registry.add_listener(cache.invalidate_model)
+
+def run_inference(inferenceObj, batch):
+    if inferenceObj.stages is not None:
+        # cascata: ogni stadio passa dal proprio micro-batching, il secondo solo con i casi incerti
+        first, second = inferenceObj.stages
+        return cascade_predict(batch, lambda data: first.probabilities(run_inference(first, data)),
+                               lambda data: second.probabilities(run_inference(second, data)), *inferenceObj.band)
+    if scheduler is not None:
+        return scheduler.submit(inferenceObj.modelId, batch).result()
+
+    return inferenceObj.inference_batch(batch, INFERENCE_BATCH_SIZE)
+
+def model_from_args(model_id, args):
+    # cascade_low / cascade_high cambiano la banda di incertezza di una cascata per questa richiesta
+    return Inference(model_id, band=(args.get('cascade_low'), args.get('cascade_high')))
+
+def predict_frames(inferenceObj, frames):
+    # solo gli spettrogrammi non presenti in cache vengono decodificati e inferiti
+    if cache is not None:
+        keys = [cache.key(buffer, inferenceObj.modelId, inferenceObj.version) for _, buffer in frames]
+        cached = cache.get_many(keys)
+    else:
+        keys = None
+        cached = [None] * len(frames)
+    misses = [i for i, prediction in enumerate(cached) if prediction is None]
+
+    batch, errors = decode_images_to_batch([frames[i][1] for i in misses], DECODE_THREADS)
+    predictions = iter(run_inference(inferenceObj, batch).tolist())
+
+    # le immagini non decodificabili non fanno fallire la richiesta: riportano il proprio errore
+    computed = {}
+    for i, error in zip(misses, errors):
+        cached[i] = error if error is not None else next(predictions)
+        if error is None:
+            computed[i] = cached[i]
+    if cache is not None:
+        cache.put_many({keys[i]: prediction for i, prediction in computed.items()})
+
+    results = []
+    for i, (name, _) in enumerate(frames):
+        if isinstance(cached[i], str):
+            result_item = {
+            "name": name,
+            "error": cached[i]
+            }
+        elif inferenceObj.stages is not None:
+            # cascata: probabilita' finale e stadio che l'ha decisa (1 = primo modello, 2 = modello completo)
+            result_item = {
+            "name": name,
+            **cascade_result(cached[i])
+            }
+        elif inferenceObj.members:
+            # ensemble: probabilita' combinata in "prediction" e dei singoli modelli in "predictions"
+            result_item = {
+            "name": name,
+            **ensemble_result(inferenceObj.members, cached[i])
+            }
+        else:
+            result_item = {
+            "name": name,
+            "prediction": cached[i]
+            }
+        results.append(result_item)
+
+    return results
+
+def postprocessing_from_args(args):
+    # ?postprocess=1: etichette 0/1 post-processate sulle predizioni nell'ordine della richiesta;
+    # i default dei parametri sono la regola storica di test.py (1 isolato tra almeno 2 zeri -> 0)
+    if args.get('postprocess') not in ('1', 'true'):
+        return None
+
+    return PostProcessing(spike_max_len=int(args.get('spike_max_len', 1)),
+                          spike_min_gap=int(args.get('spike_min_gap', 2)),
+                          merge_gap=int(args.get('merge_gap', 0)),
+                          min_event_len=int(args.get('min_event_len', 1)),
+                          threshold=float(args.get('threshold', 0.5)))
+
+def stream_predictions(inferenceObj, frames, postprocessing=None):
+    # una riga NDJSON per ogni batch: {"processed", "total", "predictions"}; con il post-processing
+    # anche "labels", le etichette diventate definitive (possono riferirsi a batch precedenti)
+    total = len(frames)
+    stream = postprocessing.stream() if postprocessing is not None else None
+    names = []
+    try:
+        for start in range(0, total, INFERENCE_BATCH_SIZE):
+            chunk = frames[start:start + INFERENCE_BATCH_SIZE]
+            results = predict_frames(inferenceObj, chunk)
+            line = {"processed": start + len(chunk), "total": total, "predictions": results}
+            if stream is not None:
+                valid = [item for item in results if "prediction" in item]
+                names.extend(item["name"] for item in valid)
+                labels = stream.push([item["prediction"] for item in valid]).tolist()
+                if start + len(chunk) == total:
+                    labels += stream.flush().tolist()
+                line["labels"] = [{"name": name, "label": label} for name, label in zip(names, labels)]
+                names = names[len(labels):]
+            yield json.dumps(line) + '\n'
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + '\n'
+
 @app.route('/inference', methods=['POST'])
 def inference():
-    all_predictions=[]
-
-    data = request.json
-    model_id = data['modelId']
-    spectrograms = data['spectrograms']
-    inferenceObj = Inference(model_id)
-
-    for spectrogram in spectrograms:
-        buffer = spectrogram["data"]
-        name = spectrogram["name"]
-        torch_tensor = decode_image_from_buffer(buffer)
-
-        prediction_tensor = inferenceObj.inference_data(torch_tensor)
-        prediction = prediction_tensor.item()
-
-        result_item = {
-        "name": name,
-        "prediction": prediction
-        }
-        all_predictions.append(result_item)
-    
+    if request.mimetype == FRAMES_MIMETYPE:
+        # formato binario: i PNG arrivano come memoryview sul corpo della richiesta
+        try:
+            model_id, frames = decode_frames(request.get_data())
+        except FrameFormatError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        # formato JSON originale, mantenuto per compatibilita'
+        data = request.json
+        model_id = data.get('modelId')
+        frames = [(spectrogram["name"], bytearray(spectrogram["data"]['data'])) for spectrogram in data.get('spectrograms', [])]
+
+    try:
+        inferenceObj = model_from_args(model_id, request.args)
+        postprocessing = postprocessing_from_args(request.args)
+    except (UnknownModelError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('stream') in ('1', 'true'):
+        # risultati inviati batch per batch, per dataset grandi senza timeout HTTP
+        return Response(stream_predictions(inferenceObj, frames, postprocessing), mimetype=NDJSON_MIMETYPE)
+
+    all_predictions = predict_frames(inferenceObj, frames)
+    if postprocessing is not None:
+        # la risposta resta la lista originale, ogni elemento valido riceve anche "label";
+        # le immagini con errore sono escluse dalla sequenza
+        valid = [item for item in all_predictions if "prediction" in item]
+        for item, label in zip(valid, postprocessing.apply([item["prediction"] for item in valid]).tolist()):
+            item["label"] = label
     json_result = json.dumps(all_predictions)
 
     return json_result
 
+def spool(stream):
+    # copia a blocchi su un file temporaneo (in memoria solo se piccolo): a differenza di request.files
+    # resta aperto anche dopo la fine della view, mentre la risposta in streaming viene generata
+    spooled = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+
+    return spooled
+
+def stream_audio_predictions(inferenceObj, sources, hop_s, threshold, n_samples):
+    # una riga NDJSON per ogni blocco di finestre: {"processed", "total", "probabilities"},
+    # poi una riga finale con gli eventi {"done", "windows", "events"}
+    total = count_windows(n_samples, hop_s)
+    window_probabilities = []
+    try:
+        for indices, block in predict_windows(sources, lambda batch: inferenceObj.probabilities(run_inference(inferenceObj, batch)), hop_s,
+                                              INFERENCE_BATCH_SIZE, n_samples):
+            window_probabilities.extend(block)
+            yield json.dumps({"processed": int(indices[-1]) + 1, "total": total,
+                              "probabilities": [round(p, 4) for p in block]}) + '\n'
+        yield json.dumps({"done": True, "windows": len(window_probabilities),
+                          "events": events_from_probabilities(window_probabilities, hop_s, CONTEXT_S, threshold)}) + '\n'
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + '\n'
+    finally:
+        for source in sources:
+            source.close()
+
+@app.route('/inference/audio', methods=['POST'])
+def inference_audio():
+    # uno o piu' file WAV orari (multipart, campo "files") oppure un singolo file come corpo audio/*;
+    # parametri: modelId, hop_s (passo tra finestre, default CONTEXT_S), threshold, stream
+    stream = request.args.get('stream') in ('1', 'true')
+    files = request.files.getlist('files')
+    if files:
+        sources = [spool(f.stream) if stream else f.stream for f in files]
+        sources, names = order_sources(sources, [f.filename or '' for f in files])
+    elif request.mimetype.startswith('audio/'):
+        sources, names = [spool(request.stream)], ['body']
+    else:
+        return jsonify({"error": "Expected multipart 'files' or an audio/* body"}), 400
+
+    model_id = request.args.get('modelId') or request.form.get('modelId')
+    try:
+        hop_s = float(request.args.get('hop_s', CONTEXT_S))
+        threshold = float(request.args.get('threshold', DEFAULT_THRESHOLD))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not 0 < hop_s <= CONTEXT_S:
+        return jsonify({"error": f"hop_s must be in (0, {CONTEXT_S}]"}), 400
+
+    try:
+        inferenceObj = model_from_args(model_id, request.args)
+    except (UnknownModelError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        n_samples = recording_samples(sources)
+    except RuntimeError as e:
+        # soundfile solleva LibsndfileError (RuntimeError) per file non audio o corrotti
+        return jsonify({"error": f"Unreadable audio: {e}"}), 400
+
+    if stream:
+        return Response(stream_audio_predictions(inferenceObj, sources, hop_s, threshold, n_samples),
+                        mimetype=NDJSON_MIMETYPE)
+
+    timeline = audio_timeline(sources, lambda batch: inferenceObj.probabilities(run_inference(inferenceObj, batch)), hop_s,
+                              INFERENCE_BATCH_SIZE, threshold, n_samples)
+
+    return jsonify({"modelId": model_id, "version": inferenceObj.version, "files": names,
+                    "duration_s": n_samples / SR, **timeline})
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # esegue una forward di warm-up per ogni modello nel processo che risponde
+    models = {}
+    try:
+        for model_id in registry.model_ids():
+            inferenceObj = Inference(model_id)
+            start = time.perf_counter()
+            inferenceObj.inference_batch(torch.zeros(1, 1, 64, 519))
+            models[model_id] = {
+            "version": inferenceObj.version,
+            "warmup_ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+    except Exception as e:
+        return jsonify({"status": "error", "error": str(e), "models": models}), 503
+
+    return jsonify({"status": "ok", "pid": os.getpid(), "torch_threads": torch.get_num_threads(), "models": models})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    result = {"pid": os.getpid(), "loaded_models": registry.loaded_models()}
+    if scheduler is not None:
+        result["scheduler"] = scheduler.metrics()
+    if cache is not None:
+        result["prediction_cache"] = cache.metrics()
+
+    return jsonify(result)
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,96 @@
+import numpy as np
+import torch
+from audio_stream import SR, duration_s, recording_order, stream_windows
+from spectrogram_engine import CONTEXT_S, melspectrogram_batch, to_image_scale
+
+# Dall'audio alla timeline di apnea: i file orari vengono letti a flusso (audio_stream), ogni finestra
+# di CONTEXT_S secondi diventa uno spettrogramma MEL (spectrogram_engine) portato sulla stessa scala dei
+# PNG che il servizio riceve oggi, e le finestre sono inferite a blocchi. La memoria dipende solo dalla
+# dimensione dei blocchi, non dalla durata della notte.
+
+DEFAULT_THRESHOLD = 0.5
+
+
+def order_sources(sources, names=None):
+    """
+    Ordina i file (percorsi o file aperti con i rispettivi nomi) per indice orario [NNN].
+    """
+    names = names or [str(source) for source in sources]
+    order = sorted(range(len(sources)), key=lambda i: recording_order(names[i]))
+
+    return [sources[i] for i in order], [names[i] for i in order]
+
+
+def recording_samples(sources):
+    """
+    Campioni a SR della registrazione (somma delle durate dei file, come in preprocessing).
+    """
+    return int(sum(duration_s(source) for source in sources) * SR)
+
+
+def count_windows(n_samples, hop_s=None):
+    # una finestra per ogni inizio in range(0, n_samples, hop), comprese le ultime completate con zeri
+    # (vedi audio_stream.stream_windows)
+    window = CONTEXT_S * SR
+    hop = int(round(hop_s * SR)) if hop_s else window
+
+    return 0 if n_samples <= 0 else (n_samples - 1) // hop + 1
+
+
+def predict_windows(sources, predict, hop_s=None, batch_size=64, n_samples=None):
+    """
+    Genera (indici, probabilita') per blocchi di al massimo batch_size finestre.
+    predict: funzione batch [k, 1, 64, 519] -> probabilita' [k], una per finestra
+    (es. Inference.probabilities applicato all'uscita di Inference.inference_batch).
+    I file sono allineati su un'ora ciascuno come in preprocessing; le ultime finestre, che superano la
+    durata reale della registrazione, sono completate con zeri.
+    """
+    window = CONTEXT_S * SR
+    hop = int(round(hop_s * SR)) if hop_s else window
+    n_samples = recording_samples(sources) if n_samples is None else n_samples
+    for indices, windows in stream_windows(sources, window, hop, sr=SR, max_samples=n_samples, batch_size=batch_size):
+        batch = torch.from_numpy(to_image_scale(melspectrogram_batch(windows, SR))).unsqueeze(1)
+        probabilities = predict(batch)
+        if probabilities.dim() != 1:
+            # es. [k, M] di un ensemble o [k, 2] di una cascata non ancora ridotti a una probabilita'
+            raise ValueError(f"predict must return one probability per window, got shape {tuple(probabilities.shape)}")
+        yield indices, probabilities.tolist()
+
+
+def events_from_probabilities(probabilities, hop_s, window_s=CONTEXT_S, threshold=DEFAULT_THRESHOLD):
+    """
+    Eventi come sequenze consecutive di finestre con probabilita' >= threshold:
+    [{'start_s', 'end_s', 'windows', 'max_probability'}].
+    """
+    positive = np.asarray(probabilities) >= threshold
+    if not positive.any():
+        return []
+    edges = np.diff(np.concatenate(([0], positive.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    return [{
+        'start_s': round(float(start * hop_s), 3),
+        'end_s': round(float((end - 1) * hop_s + window_s), 3),
+        'windows': int(end - start),
+        'max_probability': float(np.max(probabilities[start:end])),
+    } for start, end in zip(starts, ends)]
+
+
+def audio_timeline(sources, predict, hop_s=None, batch_size=64, threshold=DEFAULT_THRESHOLD, n_samples=None):
+    """
+    Timeline completa: {'window_s', 'hop_s', 'windows', 'probabilities', 'events'}.
+    """
+    hop_s = hop_s or CONTEXT_S
+    probabilities = []
+    for _, block in predict_windows(sources, predict, hop_s, batch_size, n_samples):
+        probabilities.extend(block)
+
+    return {
+        'window_s': CONTEXT_S,
+        'hop_s': hop_s,
+        'threshold': threshold,
+        'windows': len(probabilities),
+        'probabilities': [round(p, 4) for p in probabilities],
+        'events': events_from_probabilities(probabilities, hop_s, CONTEXT_S, threshold),
+    }
@@ -0,0 +1,145 @@
+import os
+import re
+import numpy as np
+import soundfile as sf
+import soxr
+
+# Lettura a flusso delle registrazioni notturne (un file wav per ogni ora, es. 00001014-100507[001].wav).
+# Invece di allocare y_block = np.zeros((n_file, 3600*SR)) in float64, i file vengono letti a blocchi
+# in float32 e le finestre di context_s secondi sono generate attraverso i confini tra i file con un
+# buffer limitato: la memoria non dipende dalla durata della registrazione.
+# Con pad_to (default un'ora) ogni file viene completato con zeri come nella matrice y_block originale,
+# cosi' gli istanti delle finestre restano allineati agli Start di meta.csv.
+# Le ultime finestre, che iniziano prima della fine della registrazione ma la superano, vengono
+# completate con zeri (come le finestre di y_all oltre la fine dell'audio nel preprocessing originale):
+# cosi' anche la fine della notte viene valutata, e gli indici coincidono con classify_windows.
+
+SR = 16000
+HOUR_SAMPLES = 3600 * SR
+BLOCK_SAMPLES = 60 * SR
+WINDOW_BATCH = 64
+
+_FILE_INDEX = re.compile(r'\[(\d+)\]')
+
+
+def recording_order(name):
+    """
+    Chiave di ordinamento dei file orari: indice [NNN] numerico (quindi [010] dopo [009]), poi il nome.
+    """
+    match = _FILE_INDEX.search(os.path.basename(name))
+    return (0, int(match.group(1)), name) if match else (1, 0, name)
+
+
+def recording_files(folder):
+    """
+    File wav di una registrazione ordinati per indice [NNN].
+    """
+    names = [name for name in os.listdir(folder) if name.lower().endswith('.wav')]
+
+    return [os.path.join(folder, name) for name in sorted(names, key=recording_order)]
+
+
+def duration_s(source):
+    """
+    Durata in secondi di un file audio (percorso o file aperto, che viene riportato all'inizio).
+    """
+    with sf.SoundFile(source) as f:
+        duration = f.frames / f.samplerate
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+    return duration
+
+
+def read_blocks(path, sr=SR, block_samples=BLOCK_SAMPLES):
+    """
+    Genera blocchi mono float32 del file (percorso o file aperto) alla frequenza sr
+    (media dei canali e ricampionamento soxr a flusso, come librosa.load).
+    """
+    with sf.SoundFile(path) as f:
+        resampler = None
+        if f.samplerate != sr:
+            resampler = soxr.ResampleStream(f.samplerate, sr, 1, dtype='float32', quality='HQ')
+        read_size = max(1, int(block_samples * f.samplerate / sr))
+        while True:
+            block = f.read(read_size, dtype='float32', always_2d=True)
+            last = block.shape[0] < read_size
+            y = block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0]
+            if resampler is not None:
+                y = resampler.resample_chunk(y, last=last)
+            if y.shape[0]:
+                yield y
+            if last:
+                break
+
+
+def stream_samples(paths, sr=SR, pad_to=HOUR_SAMPLES, block_samples=BLOCK_SAMPLES):
+    """
+    Concatena a blocchi i file di paths; con pad_to ogni file occupa esattamente pad_to campioni
+    (completato con zeri o troncato), come una riga di y_block.
+    """
+    for path in paths:
+        written = 0
+        for y in read_blocks(path, sr, block_samples):
+            if pad_to is not None:
+                y = y[:pad_to - written]
+            if y.shape[0]:
+                written += y.shape[0]
+                yield y
+        if pad_to is not None:
+            while written < pad_to:
+                n = min(block_samples, pad_to - written)
+                written += n
+                yield np.zeros(n, dtype=np.float32)
+
+
+def stream_windows(paths, window, hop=None, sr=SR, pad_to=HOUR_SAMPLES, max_samples=None,
+                   batch_size=WINDOW_BATCH, block_samples=BLOCK_SAMPLES, pad_last=True):
+    """
+    Genera (indici, finestre [k, window] float32) a blocchi di al massimo batch_size finestre,
+    con passo hop (< window per finestre sovrapposte). L'indice n corrisponde alla finestra che
+    inizia al campione n*hop, come y_all[n*hop : n*hop + window].
+    Con max_samples si ignorano i campioni oltre quella posizione. Con pad_last (default) vengono
+    generate anche le finestre finali incomplete, completate con zeri: una per ogni inizio in
+    range(0, campioni, hop); con pad_last=False solo le finestre complete.
+    """
+    hop = hop or window
+    if not 0 < hop <= window:
+        raise ValueError(f'hop must be in (0, {window}], got {hop}')
+
+    buf = np.empty(0, dtype=np.float32)
+    next_index = 0
+    total = 0
+
+    def complete(buf):
+        return 0 if buf.shape[0] < window else (buf.shape[0] - window) // hop + 1
+
+    for y in stream_samples(paths, sr, pad_to, block_samples):
+        if max_samples is not None:
+            y = y[:max(0, max_samples - total)]
+        total += y.shape[0]
+        # il buffer non viene mai modificato sul posto: le finestre gia' restituite restano valide
+        buf = np.concatenate((buf, y))
+        while complete(buf) >= batch_size:
+            frames = np.lib.stride_tricks.sliding_window_view(buf, window)[::hop][:batch_size]
+            yield np.arange(next_index, next_index + batch_size), frames
+            next_index += batch_size
+            buf = buf[batch_size * hop:]
+        if max_samples is not None and total >= max_samples:
+            break
+
+    n = complete(buf)
+    if n:
+        frames = np.lib.stride_tricks.sliding_window_view(buf, window)[::hop][:n]
+        yield np.arange(next_index, next_index + n), frames
+        next_index += n
+        buf = buf[n * hop:]
+
+    if pad_last and buf.shape[0]:
+        starts = np.arange(0, buf.shape[0], hop)
+        padded = np.zeros(starts[-1] + window, dtype=np.float32)
+        padded[:buf.shape[0]] = buf
+        frames = np.lib.stride_tricks.sliding_window_view(padded, window)[::hop]
+        for start in range(0, starts.size, batch_size):
+            chunk = frames[start:start + batch_size]
+            yield np.arange(next_index + start, next_index + start + chunk.shape[0]), chunk
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import torch
+
+# Backend di esecuzione dei modelli. Tutti espongono predict(batch): batch e' un tensore CPU
+# float32 [N, 1, 64, 519] e il risultato un tensore [N] con le probabilita' di apnea
+# ([N, M] per un ensemble di M modelli, vedi ensemble.py).
+# Il backend si sceglie con INFERENCE_BACKEND (torch | onnxruntime).
+
+BACKENDS = ["torch", "onnxruntime"]
+
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "onnx")
+
+
+class InferenceBackend:
+    name = None
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+
+    def __init__(self, net, device=None):
+        self.net = net
+        self.device = device or torch.device('cpu')
+
+    def predict(self, batch):
+        with torch.inference_mode():
+            return self.net(batch.to(self.device)).flatten(1).squeeze(1).cpu()
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = "onnxruntime"
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort  # dipendenza opzionale, serve solo con questo backend
+
+        options = ort.SessionOptions()
+        if num_threads is None:
+            num_threads = torch.get_num_threads()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        inputs = np.ascontiguousarray(batch.numpy(), dtype=np.float32)
+        outputs = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(outputs.reshape(-1))
+
+
+def onnx_path(model_id, onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, f"{model_id}.onnx")
+
+
+def export_onnx(net, path, opset=17):
+    """
+    Esporta una rete CRNN_2 (in eval) in ONNX con asse batch dinamico.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    example = torch.zeros(2, 1, 64, 519)
+    torch.onnx.export(
+        net, (example,), path,
+        input_names=["input"], output_names=["prediction"],
+        dynamic_axes={"input": {0: "batch"}, "prediction": {0: "batch"}},
+        opset_version=opset, dynamo=False,
+    )
@@ -1,28 +1,65 @@
 import os, sys
 import torch
-from networks import CRNN_2
+from model_registry import registry as default_registry
+from cascade import cascade_predict, parse_band
+from ensemble import combined_probability
 
 class Inference: 
-    def __init__(self, modelId):
+    def __init__(self, modelId, registry=None, band=None):
         super(Inference, self).__init__()
         self.device = torch.device('cpu')
         self.modelId=modelId
+        self.registry = registry or default_registry
+        self.band = band
+        self.stages = None
         self.net = self.load_model(self.device)
 
     def load_model(self, device):
-        net = CRNN_2()
-        if self.modelId == "10_patients_model":
-            net.load_state_dict(torch.load("./model/checkpoints/10_patients_model.pth", map_location=device))
-        elif self.modelId == "20_patients_model":
-            net.load_state_dict(torch.load("./model/checkpoints/20_patients_model.pth", map_location=device))
-        net = net.to(device)
-        net.eval()
+        if self.modelId in self.registry.cascades:
+            # cascata: uno Inference per stadio; la banda fa parte della versione (e quindi della chiave di cache)
+            self.stages = [Inference(stage, self.registry) for stage in self.registry.cascades[self.modelId]]
+            self.band = parse_band(*(self.band or (None, None)))
+            self.version = "+".join(stage.version for stage in self.stages) + "@{}-{}".format(*self.band)
+            self.backend = None
+            self.members = None
+            return None
 
-        return net
+        # il registry carica il checkpoint una sola volta per processo e
+        # solleva UnknownModelError se il modelId non esiste
+        # il backend (torch o onnxruntime) e' scelto dalla configurazione del registry
+        loaded = self.registry.get(self.modelId)
+        self.version = loaded.version
+        self.backend = loaded.backend
+        self.members = loaded.members
+        return loaded.net
+
+    def probabilities(self, outputs):
+        # probabilita' di apnea [N] dall'uscita di inference_batch: media dei membri per un ensemble ([N, M]),
+        # prima colonna per una cascata ([N, 2], la seconda e' lo stadio), invariata per un modello singolo
+        if self.stages is not None:
+            return outputs[:, 0]
+
+        return combined_probability(outputs)
 
     def inference_data(self, data):
         data = data.to(self.device)
-        with torch.no_grad():
-            prediction = self.net(data)
+        prediction = self.probabilities(self.inference_batch(data, max(data.shape[0], 1))).view(-1, 1)
+
+        return prediction
+
+    def inference_batch(self, data, batch_size=32):
+        # data: [N, 1, 64, 519]; una sola forward di CRNN_2 per ogni blocco di batch_size elementi,
+        # eseguita dal backend sotto torch.inference_mode (o con ONNX Runtime)
+        if self.stages is not None:
+            first, second = self.stages
+            return cascade_predict(data, lambda batch: first.probabilities(first.inference_batch(batch, batch_size)),
+                                   lambda batch: second.probabilities(second.inference_batch(batch, batch_size)),
+                                   *self.band)
+        predictions = []
+        for start in range(0, data.shape[0], batch_size):
+            batch = data[start:start + batch_size].to(self.device)
+            predictions.append(self.backend.predict(batch))
+        if not predictions:
+            return torch.empty(0)
 
-        return prediction
\ No newline at end of file
+        return torch.cat(predictions)
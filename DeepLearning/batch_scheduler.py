@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import torch
+
+
+class Histogram:
+    """
+    Istogramma a bucket fissi (limite superiore incluso), piu' un bucket '+Inf'.
+    """
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        buckets = [[str(b), c] for b, c in zip(self.bounds, self.counts)] + [['+Inf', self.counts[-1]]]
+        mean = self.total / self.count if self.count else 0.0
+
+        return {"count": self.count, "mean": mean, "buckets": buckets}
+
+
+class _Pending:
+    # richiesta in coda: le sue righe possono finire in piu' batch condivisi
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        self.parts = []
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """
+    Raccoglie gli spettrogrammi di richieste concorrenti per lo stesso modelId in batch
+    condivisi (al massimo max_batch_size righe, attesa massima max_wait_ms dalla richiesta
+    piu' vecchia) e li esegue su un thread di inferenza dedicato. Ogni richiesta riceve,
+    tramite un Future, solo le proprie predizioni.
+    """
+    def __init__(self, registry, max_batch_size=32, max_wait_ms=5.0):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queues = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+
+    def _ensure_thread(self):
+        # il thread va (ri)avviato nel processo corrente: dopo un fork (worker gunicorn) non esiste
+        if self._thread is None or self._pid != os.getpid():
+            self._queues = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._thread.start()
+
+    def submit(self, model_id, data):
+        """
+        data: tensore [N, 1, 64, 519]; restituisce un Future con le N predizioni ([N]).
+        """
+        pending = _Pending(data)
+        if data.shape[0] == 0:
+            pending.future.set_result(torch.empty(0))
+            return pending.future
+
+        with self._cond:
+            self._ensure_thread()
+            self._queues.setdefault(model_id, deque()).append(pending)
+            self._cond.notify()
+
+        return pending.future
+
+    def _pending_rows(self, queue):
+        return sum(p.data.shape[0] - p.offset for p in queue)
+
+    def _next_batch(self):
+        # chiamato con il lock acquisito: sceglie il modello con la richiesta piu' vecchia
+        # e attende finche' il batch e' pieno o e' scaduto max_wait
+        while True:
+            queues = [(q[0].enqueued, model_id) for model_id, q in self._queues.items() if q]
+            if not queues:
+                self._cond.wait()
+                continue
+
+            oldest, model_id = min(queues)
+            queue = self._queues[model_id]
+            rows = self._pending_rows(queue)
+            remaining = oldest + self.max_wait - time.perf_counter()
+            if rows < self.max_batch_size and remaining > 0:
+                self._cond.wait(remaining)
+                continue
+
+            self.queue_depth.observe(rows)
+            slices = []
+            size = 0
+            while queue and size < self.max_batch_size:
+                pending = queue[0]
+                take = min(pending.data.shape[0] - pending.offset, self.max_batch_size - size)
+                slices.append((pending, pending.offset, pending.offset + take))
+                pending.offset += take
+                size += take
+                if pending.offset == pending.data.shape[0]:
+                    queue.popleft()
+
+            return model_id, slices
+
+    def _run(self):
+        while True:
+            with self._cond:
+                model_id, slices = self._next_batch()
+
+            self.batch_size.observe(sum(end - start for _, start, end in slices))
+            try:
+                backend = self.registry.get(model_id).backend
+                batch = torch.cat([pending.data[start:end] for pending, start, end in slices])
+                outputs = backend.predict(batch)
+            except Exception as e:
+                for pending, _, _ in slices:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            offset = 0
+            for pending, start, end in slices:
+                pending.parts.append(outputs[offset:offset + end - start])
+                offset += end - start
+                if end == pending.data.shape[0] and not pending.future.done():
+                    pending.future.set_result(torch.cat(pending.parts))
+
+    def metrics(self):
+        with self._cond:
+            queued = {model_id: self._pending_rows(q) for model_id, q in self._queues.items()}
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": queued,
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
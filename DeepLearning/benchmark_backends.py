@@ -0,0 +1,69 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+import warnings
+import torch
+from backends import OnnxRuntimeBackend, export_onnx
+from image_utils import decode_images_to_batch
+from model_registry import MODELS, ModelRegistry
+
+# Confronta il throughput dei backend torch e onnxruntime per dimensione del batch, riportando anche lo
+# scostamento massimo tra le uscite su spettrogrammi reali e casuali (la parita' e' verificata da
+# tests/test_backends.py).
+# Esempio: python benchmark_backends.py --batch-sizes 1 16 64
+
+def load_samples(folder):
+    buffers = []
+    for path in sorted(glob.glob(os.path.join(folder, '**', '*.png'), recursive=True)):
+        with open(path, 'rb') as f:
+            buffers.append(f.read())
+    batch, _ = decode_images_to_batch(buffers)
+
+    return batch
+
+
+def throughput(backend, data, batch_size, repeats):
+    backend.predict(data[:batch_size])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, data.shape[0], batch_size):
+            backend.predict(data[i:i + batch_size])
+
+    return data.shape[0] * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=list(MODELS))
+    parser.add_argument('--samples', default=os.path.join('..', 'ApplicazioneNode', 'Data'))
+    parser.add_argument('--n', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    torch.manual_seed(0)
+    random_data = torch.rand(args.n, 1, 64, 519) * 255
+    parity_data = torch.cat([load_samples(args.samples), random_data[:16]])
+
+    registry = ModelRegistry(variants={}, backend='torch')
+    with tempfile.TemporaryDirectory() as tmp:
+        for model_id in args.models:
+            torch_backend = registry.get(model_id).backend
+            path = os.path.join(tmp, f'{model_id}.onnx')
+            export_onnx(registry.get(model_id).net, path)
+            ort_backend = OnnxRuntimeBackend(path)
+
+            delta = (torch_backend.predict(parity_data) - ort_backend.predict(parity_data)).abs().max().item()
+            print(f'{model_id}: max|d|={delta:.2e} su {parity_data.shape[0]} input')
+
+            for batch_size in args.batch_sizes:
+                t = throughput(torch_backend, random_data, batch_size, args.repeats)
+                o = throughput(ort_backend, random_data, batch_size, args.repeats)
+                print(f'  batch {batch_size:>4}: torch {t:8.1f} spec/s  onnxruntime {o:8.1f} spec/s  x{o / t:.2f}')
+
+
+if __name__ == '__main__':
+    main()
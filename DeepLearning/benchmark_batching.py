@@ -0,0 +1,47 @@
+import argparse
+import time
+import torch
+from basic_test import Inference
+
+# Confronta il throughput (spettrogrammi/s) di CRNN_2 su CPU al variare della dimensione del batch.
+# Esempio: python benchmark_batching.py --model 20_patients_model --n 256 --batch-sizes 1 8 16 32 64
+
+def run(inferenceObj, data, batch_size, repeats):
+    inferenceObj.inference_batch(data[:batch_size], batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        inferenceObj.inference_batch(data, batch_size)
+    elapsed = (time.perf_counter() - start) / repeats
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='20_patients_model')
+    parser.add_argument('--n', type=int, default=256, help='numero di spettrogrammi per ripetizione')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16, 32, 64, 128])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    torch.manual_seed(0)
+    inferenceObj = Inference(args.model)
+    data = torch.rand(args.n, 1, 64, 519) * 255
+
+    print(f'model={args.model} n={args.n} threads={torch.get_num_threads()}')
+    print(f'{"batch":>6} {"s/run":>10} {"spec/s":>10} {"speedup":>8}')
+    baseline = None
+    for batch_size in args.batch_sizes:
+        elapsed = run(inferenceObj, data, batch_size, args.repeats)
+        throughput = args.n / elapsed
+        if baseline is None:
+            baseline = throughput
+        print(f'{batch_size:>6} {elapsed:>10.3f} {throughput:>10.1f} {throughput / baseline:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
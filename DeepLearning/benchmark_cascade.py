@@ -0,0 +1,84 @@
+import argparse
+import os
+import time
+import numpy as np
+import torch
+from basic_test import Inference
+from evaluate import cached_windows, confusion, scores
+from model_registry import ModelRegistry
+
+# Compromesso latenza/accuratezza dell'inferenza a cascata su un insieme di validazione etichettato
+# (cartelle P<n> prodotte da make_spectrograms.py, con shard se presente). Per ogni configurazione:
+# tempo per 1000 finestre, quota di finestre passate al secondo stadio, precision/recall/F1 rispetto
+# alle etichette e accordo con il solo modello completo.
+# La cascata conviene solo se il primo stadio costa meno di (1 - quota al secondo stadio) volte il secondo:
+# il rapporto dei tempi dei due stadi da soli e il punto di pareggio vengono stampati alla fine.
+# Esempio: python benchmark_cascade.py --data-path /disks/disk1/adanna/MELSP_6S --patients 1120 1106 --limit 2000 \
+#          --stages 10_patients_model 20_patients_model
+
+
+def load_windows(data_path, patients, limit, batch_size):
+    specs, labels = [], []
+    for P_n in patients:
+        for _, batch_labels, batch_specs in cached_windows(os.path.join(data_path, f'P{P_n}'), batch_size):
+            specs.append(np.asarray(batch_specs, dtype=np.float32))
+            labels.append(batch_labels)
+            if limit and sum(len(l) for l in labels) >= limit:
+                break
+    data = torch.from_numpy(np.concatenate(specs)[:limit or None]).unsqueeze(1)
+
+    return data, np.concatenate(labels)[:limit or None]
+
+
+def timed_predict(inferenceObj, data, batch_size):
+    inferenceObj.inference_batch(data[:batch_size], batch_size)  # warm-up
+    start = time.perf_counter()
+    outputs = inferenceObj.inference_batch(data, batch_size)
+
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', required=True, help='cartella di output di make_spectrograms.py')
+    parser.add_argument('--patients', type=int, nargs='+', required=True)
+    parser.add_argument('--stages', nargs=2, metavar=('FIRST', 'SECOND'),
+                        default=['10_patients_model', '20_patients_model'])
+    parser.add_argument('--bands', nargs='+', default=['0.05,0.95', '0.1,0.9', '0.2,0.8', '0.3,0.7'])
+    parser.add_argument('--limit', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args()
+
+    data, labels = load_windows(args.data_path, args.patients, args.limit, args.batch_size)
+    first_id, second_id = args.stages
+    cascade_id = f'{first_id}>{second_id}'
+    registry = ModelRegistry(cascades={cascade_id: args.stages})
+    print(f'{len(labels)} finestre ({int(labels.sum())} apnea), batch {args.batch_size}, '
+          f'{torch.get_num_threads()} thread')
+
+    rows = []
+    full, second_elapsed = timed_predict(Inference(second_id, registry), data, args.batch_size)
+    full = full.numpy() >= args.threshold
+    rows.append((second_id, second_elapsed, 1.0, full))
+    first, first_elapsed = timed_predict(Inference(first_id, registry), data, args.batch_size)
+    rows.append((first_id, first_elapsed, 0.0, first.numpy() >= args.threshold))
+    for band in args.bands:
+        low, high = (float(value) for value in band.split(','))
+        outputs, elapsed = timed_predict(Inference(cascade_id, registry, band=(low, high)), data, args.batch_size)
+        escalated = float((outputs[:, 1] == 2).float().mean())
+        rows.append((f'cascata [{low}, {high}]', elapsed, escalated, outputs[:, 0].numpy() >= args.threshold))
+
+    print(f'{"configurazione":<36} {"s/1000":>8} {"stadio 2":>9} {"precision":>10} {"recall":>8} {"f1":>7} {"accordo":>8}')
+    for name, elapsed, escalated, predictions in rows:
+        result = scores(confusion(labels, predictions))
+        agreement = float(np.mean(predictions == full))
+        print(f'{name:<36} {elapsed / len(labels) * 1000:8.2f} {escalated * 100:8.1f}% {result["precision"]:10.4f} '
+              f'{result["recall"]:8.4f} {result["f1"]:7.4f} {agreement * 100:7.1f}%')
+    ratio = first_elapsed / second_elapsed
+    print(f'costo del primo stadio: {ratio * 100:.1f}% del secondo; la cascata e\' piu\' veloce solo se meno del '
+          f'{max(1 - ratio, 0) * 100:.1f}% delle finestre passa al secondo stadio')
+
+
+if __name__ == '__main__':
+    main()
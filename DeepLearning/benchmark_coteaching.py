@@ -0,0 +1,95 @@
+import argparse
+import copy
+import sys
+import time
+import torch
+import torch.nn.functional as F
+from networks import CRNN_2
+from coteaching_loss import coteaching_step, loss_coteaching
+
+# Confronta il passo di Co-Teaching di main.training (loss_coteaching + nuova forward sui campioni scelti)
+# con coteaching_step (una forward per modello): verifica che i gradienti coincidano e misura i tempi.
+# L'equivalenza e' esatta con statistiche di BatchNorm fisse (eval); in train mode la BatchNorm del percorso
+# originale usa le statistiche del sottoinsieme, quindi lo scostamento viene solo riportato.
+# Termina con codice 1 se i gradienti differiscono oltre la tolleranza.
+# Esempio: python benchmark_coteaching.py --batch-size 64 --repeats 5
+
+
+def reference_step(model_1, optimizer_1, model_2, optimizer_2, data, target, forget_rate):
+    output_1 = model_1(data)
+    output_2 = model_2(data)
+    ind_1_update, ind_2_update = loss_coteaching(output_1, output_2, target, forget_rate, 0, verbose=False)
+
+    optimizer_1.zero_grad()
+    loss1_selected = F.binary_cross_entropy(model_1(data[ind_2_update]), target[ind_2_update])
+    loss1_selected.backward()
+    optimizer_1.step()
+
+    optimizer_2.zero_grad()
+    loss2_selected = F.binary_cross_entropy(model_2(data[ind_1_update]), target[ind_1_update])
+    loss2_selected.backward()
+    optimizer_2.step()
+
+    return loss1_selected.detach(), loss2_selected.detach()
+
+
+def make_models(seed):
+    torch.manual_seed(seed)
+    model_1, model_2 = CRNN_2(), CRNN_2()
+    # lr=0: gli step non modificano i pesi, i gradienti restano disponibili per il confronto
+    return model_1, torch.optim.SGD(model_1.parameters(), lr=0.0), model_2, torch.optim.SGD(model_2.parameters(), lr=0.0)
+
+
+def run(step, models, data, target, forget_rate, train):
+    model_1, optimizer_1, model_2, optimizer_2 = models
+    model_1.train(train)
+    model_2.train(train)
+    losses = step(model_1, optimizer_1, model_2, optimizer_2, data, target, forget_rate)
+    grads = [p.grad.clone() for p in list(model_1.parameters()) + list(model_2.parameters())]
+
+    return torch.stack(losses), grads
+
+
+def max_delta(a, b):
+    return max((x - y).abs().max().item() for x, y in zip(a, b))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--forget-rate', type=float, default=0.3)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    data = torch.randn(args.batch_size, 1, 64, 519)
+    target = torch.randint(0, 2, (args.batch_size, 1)).float()
+    models = make_models(128)
+    reference_models = copy.deepcopy(models)
+
+    failed = False
+    for train in (False, True):
+        ref_losses, ref_grads = run(reference_step, reference_models, data, target, args.forget_rate, train)
+        losses, grads = run(coteaching_step, models, data, target, args.forget_rate, train)
+        loss_delta = (losses - ref_losses).abs().max().item()
+        grad_delta = max_delta(grads, ref_grads)
+        mode = 'train (BatchNorm sul batch)' if train else 'eval (BatchNorm fissa)'
+        ok = train or (loss_delta <= args.tolerance and grad_delta <= args.tolerance)
+        failed = failed or not ok
+        print(f'{mode:<28} max|d loss|={loss_delta:.2e}  max|d grad|={grad_delta:.2e}'
+              + ('' if train else f'  ({"ok" if ok else "FAIL"})'))
+
+    for name, step, step_models in (('originale', reference_step, reference_models), ('coteaching_step', coteaching_step, models)):
+        run(step, step_models, data, target, args.forget_rate, True)  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            run(step, step_models, data, target, args.forget_rate, True)
+        elapsed = (time.perf_counter() - start) / args.repeats
+        print(f'{name:<16} {elapsed * 1000:8.1f} ms/step')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import time
+import torch
+from basic_test import Inference
+from benchmark_transport import load_images
+from image_utils import decode_images_to_batch
+from model_registry import ENSEMBLES, registry
+
+# Confronta, per lo stesso insieme di spettrogrammi, due passaggi separati (decodifica + inferenza
+# per ciascun modello, come due job distinti) con un passaggio sul modelId di ensemble
+# (una decodifica e una forward della rete fusa). Verifica anche che le predizioni coincidano.
+# Esempio: python benchmark_ensemble.py --images ../ApplicazioneNode/Data/apnea --n 128
+
+
+def run(model_ids, buffers, batch_size):
+    outputs = []
+    for model_id in model_ids:
+        batch, _ = decode_images_to_batch(buffers)
+        outputs.append(Inference(model_id).inference_batch(batch, batch_size))
+
+    return outputs
+
+
+def timed(fn, repeats):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', default='../ApplicazioneNode/Data/apnea')
+    parser.add_argument('--n', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--ensemble', default='ensemble_model')
+    args = parser.parse_args()
+
+    buffers = [data for _, data in load_images(args.images, args.n)]
+    members = ENSEMBLES[args.ensemble]
+    separate = run(members, buffers, args.batch_size)
+    ensemble = run([args.ensemble], buffers, args.batch_size)[0]
+    for i, (member, output) in enumerate(zip(members, separate)):
+        print(f'{member}: max |diff| {(ensemble[:, i] - output).abs().max().item():.2e}')
+
+    print(f'{args.n} spettrogrammi, batch {args.batch_size}, {torch.get_num_threads()} thread')
+    t_separate = timed(lambda: run(members, buffers, args.batch_size), args.repeats)
+    t_ensemble = timed(lambda: run([args.ensemble], buffers, args.batch_size), args.repeats)
+    print(f'separati: {t_separate:.3f} s   ensemble: {t_ensemble:.3f} s   ({t_ensemble / t_separate:.2f}x)')
+    print(f'modelli caricati: {registry.loaded_models()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import sys
+import time
+import numpy as np
+import librosa
+from spectrogram_engine import CONTEXT_S, SR, HOP_LENGTH, N_MELS, frame_windows, iter_melspectrograms
+
+# Verifica che spectrogram_engine produca gli stessi spettrogrammi del percorso originale
+# (librosa per singola finestra) e confronta i tempi. Termina con codice 1 se la parita' fallisce.
+# Esempio: python benchmark_spectrograms.py --windows 600 --chunk-sizes 64 256
+# Con --wav si usa un file audio reale invece di un segnale sintetico.
+
+def synthetic_signal(n_windows, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_windows * CONTEXT_S * SR) / SR
+    # rumore di fondo + toni a frequenza variabile, per avere energia su tutte le bande MEL
+    y = 0.05 * rng.standard_normal(t.shape[0])
+    y += 0.3 * np.sin(2 * np.pi * (200 + 150 * np.sin(2 * np.pi * t / 37)) * t)
+    y *= 1 + 0.5 * np.sin(2 * np.pi * t / 11)
+
+    return y
+
+
+def reference(windows):
+    out = []
+    for y_chunk in windows:
+        S2 = librosa.feature.melspectrogram(y=y_chunk, sr=SR, hop_length=HOP_LENGTH, n_mels=N_MELS)
+        out.append(librosa.power_to_db(S2, ref=np.max).astype(np.float32))
+
+    return np.stack(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--windows', type=int, default=300)
+    parser.add_argument('--wav', default=None)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='massima differenza ammessa in dB')
+    args = parser.parse_args()
+
+    if args.wav:
+        y, _ = librosa.load(args.wav, sr=SR)
+        y = y.astype(np.float64)
+    else:
+        y = synthetic_signal(args.windows)
+    windows = frame_windows(y, CONTEXT_S * SR)
+    print(f'{windows.shape[0]} finestre da {CONTEXT_S} s')
+
+    start = time.perf_counter()
+    expected = reference(windows)
+    base = time.perf_counter() - start
+    print(f'{"librosa per finestra":>22}: {base:7.2f} s  {windows.shape[0] / base:8.1f} win/s')
+
+    failed = False
+    for chunk_size in args.chunk_sizes:
+        start = time.perf_counter()
+        result = np.concatenate([specs for _, specs in iter_melspectrograms(windows, chunk_size=chunk_size)])
+        elapsed = time.perf_counter() - start
+        delta = np.abs(result - expected).max()
+        ok = result.shape == expected.shape and delta <= args.tolerance
+        failed = failed or not ok
+        print(f'{"engine chunk " + str(chunk_size):>22}: {elapsed:7.2f} s  {windows.shape[0] / elapsed:8.1f} win/s  '
+              f'x{base / elapsed:.2f}  shape={result.shape[1:]}  max|d|={delta:.2e} dB ({"ok" if ok else "FAIL"})')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import glob
+import json
+import os
+import time
+from image_utils import decode_image_from_buffer, decode_image_from_bytes
+from transport import decode_frames, encode_frames
+
+# Confronta dimensione del payload e tempo di parsing+decodifica tra il formato JSON
+# ({type:'Buffer', data:[...]}) e il formato binario a frame di transport.py.
+# Esempio: python benchmark_transport.py --images ../ApplicazioneNode/Data/apnea --n 500
+
+def load_images(folder, n):
+    files = sorted(glob.glob(os.path.join(folder, '*.png')))
+    if not files:
+        raise SystemExit(f'No PNG found in {folder}')
+    images = []
+    for i in range(n):
+        path = files[i % len(files)]
+        with open(path, 'rb') as f:
+            images.append((f'{i}_{os.path.basename(path)}', f.read()))
+
+    return images
+
+
+def decode_json(body):
+    data = json.loads(body)
+    return [decode_image_from_buffer(s['data']) for s in data['spectrograms']]
+
+
+def decode_binary(body):
+    _, frames = decode_frames(body)
+    return [decode_image_from_bytes(buffer) for _, buffer in frames]
+
+
+def timed(fn, body, repeats):
+    fn(body)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(body)
+
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', default=os.path.join('..', 'ApplicazioneNode', 'Data', 'apnea'))
+    parser.add_argument('--n', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.n)
+    json_body = json.dumps({
+        'modelId': '20_patients_model',
+        'spectrograms': [{'name': name, 'data': {'type': 'Buffer', 'data': list(data)}} for name, data in images],
+    }).encode('utf-8')
+    binary_body = encode_frames('20_patients_model', images)
+    png_bytes = sum(len(data) for _, data in images)
+
+    print(f'{args.n} spettrogrammi, {png_bytes / 1e6:.2f} MB di PNG')
+    print(f'{"format":>8} {"payload MB":>11} {"x PNG":>7} {"decode s":>9} {"img/s":>9}')
+    for label, body, fn in (('json', json_body, decode_json), ('binary', binary_body, decode_binary)):
+        elapsed = timed(fn, body, args.repeats)
+        print(f'{label:>8} {len(body) / 1e6:>11.2f} {len(body) / png_bytes:>7.2f} {elapsed:>9.3f} {args.n / elapsed:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os
+import torch
+
+# Inferenza a cascata: il primo stadio valuta tutti gli spettrogrammi e decide da solo quelli con
+# probabilita' fuori dalla banda di incertezza [low, high]; solo gli altri passano al secondo stadio
+# (il modello completo). L'uscita e' [N, 2]: probabilita' finale e stadio che l'ha prodotta (1 o 2).
+# La banda di default si imposta con CASCADE_LOW / CASCADE_HIGH e si puo' cambiare per richiesta.
+# Nessuna cascata e' registrata di default: si abilitano con MODEL_CASCADES (vedi parse_cascades) dopo aver
+# verificato con benchmark_cascade.py che il primo stadio costi davvero meno del secondo.
+
+DEFAULT_BAND = (float(os.environ.get("CASCADE_LOW", 0.1)), float(os.environ.get("CASCADE_HIGH", 0.9)))
+
+
+def parse_band(low=None, high=None):
+    low = DEFAULT_BAND[0] if low is None else float(low)
+    high = DEFAULT_BAND[1] if high is None else float(high)
+    if not 0.0 <= low <= high <= 1.0:
+        raise ValueError(f"Invalid cascade band [{low}, {high}], expected 0 <= low <= high <= 1")
+
+    return low, high
+
+
+def parse_cascades(spec):
+    """
+    "cascade_model=small_model+20_patients_model" -> {"cascade_model": ["small_model", "20_patients_model"]}
+    """
+    cascades = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            model_id, stages = item.split("=", 1)
+            stages = [stage.strip() for stage in stages.split("+")]
+            if len(stages) != 2:
+                raise ValueError(f"Cascade '{model_id.strip()}' needs exactly two stages, got {stages}")
+            cascades[model_id.strip()] = stages
+
+    return cascades
+
+
+def cascade_predict(batch, first, second, low, high):
+    """
+    first, second: funzioni batch [N, 1, 64, 519] -> probabilita' [N] (es. Inference.probabilities).
+    """
+    probabilities = first(batch).reshape(-1).clone()
+    stages = torch.ones(probabilities.shape[0])
+    uncertain = (probabilities >= low) & (probabilities <= high)
+    if uncertain.any():
+        probabilities[uncertain] = second(batch[uncertain]).reshape(-1).to(probabilities.dtype)
+        stages[uncertain] = 2
+
+    return torch.stack((probabilities, stages), dim=1)
+
+
+def cascade_result(prediction):
+    """
+    Campi della risposta per uno spettrogramma: probabilita' finale e stadio che ha deciso.
+    """
+    return {"prediction": prediction[0], "stage": int(prediction[1])}
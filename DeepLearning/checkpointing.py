@@ -0,0 +1,229 @@
+import csv
+import os
+import queue
+import threading
+import pandas as pd
+import torch
+
+# Salvataggi dell'addestramento fuori dal thread di training:
+# - CheckpointManager: pesi per epoca (ultimi keep_last), migliori modelli (migliori keep_best) e uno stato
+#   completo per riprendere l'addestramento (modelli, ottimizzatori, scheduler, epoca, migliori metriche).
+#   I tensori vengono copiati su CPU nel thread chiamante, la scrittura avviene in background su un file
+#   temporaneo rinominato con os.replace, quindi un file presente e' sempre completo.
+# - MetricsLog: una riga CSV per epoca in append, scritta e flushata in background; l'export in Excel
+#   (export_excel) si fa una volta sola a fine addestramento.
+
+
+class BackgroundWriter:
+    """
+    Un thread che esegue in ordine le funzioni accodate; flush() attende che la coda sia vuota.
+    Gli errori vengono rilanciati dalla successiva flush() o submit().
+    """
+    def __init__(self, name='background-writer'):
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            fn = self._queue.get()
+            try:
+                if fn is None:
+                    return
+                fn()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, fn):
+        self._raise()
+        self._queue.put(fn)
+
+    def flush(self):
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+def snapshot(obj):
+    """
+    Copia su CPU di tutti i tensori di uno state_dict (anche annidato), da salvare mentre il training prosegue.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+
+    return obj
+
+
+def atomic_save(obj, path):
+    tmp = path + '.tmp'
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CheckpointManager:
+    def __init__(self, directory, resume_name='resume.pth', keep_last=3, keep_best=3, writer=None):
+        self.directory = directory
+        self.resume_path = os.path.join(directory, resume_name)
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.writer = writer or BackgroundWriter('checkpoint-writer')
+        self.last = []  # liste di percorsi per epoca, dalla piu' vecchia
+        self.best = []  # (score, epoch, percorso)
+        os.makedirs(directory, exist_ok=True)
+
+    def state_dict(self):
+        return {'last': [list(paths) for paths in self.last], 'best': [list(item) for item in self.best]}
+
+    def load_state_dict(self, state):
+        self.last = [list(paths) for paths in state.get('last', [])]
+        self.best = [tuple(item) for item in state.get('best', [])]
+
+    def save_epoch(self, epoch, models, resume_state=None):
+        """
+        models: {prefisso: modello}; salva P_<epoch>.pth (solo state_dict, come prima) per ciascuno
+        e, con resume_state, lo stato per riprendere l'addestramento. Restano gli ultimi keep_last.
+        """
+        files = {os.path.join(self.directory, f'{prefix}_{epoch}.pth'): snapshot(model.state_dict())
+                 for prefix, model in models.items()}
+        self.last.append(list(files))
+        expired = self.last[:-self.keep_last] if self.keep_last else []
+        self.last = self.last[-self.keep_last:] if self.keep_last else []
+        if resume_state is not None:
+            resume_state = snapshot(dict(resume_state, checkpoints=self.state_dict()))
+
+        def write():
+            for path, state in files.items():
+                atomic_save(state, path)
+            if resume_state is not None:
+                atomic_save(resume_state, self.resume_path)
+            for paths in expired:
+                for path in paths:
+                    _remove(path)
+
+        self.writer.submit(write)
+
+    def save_best(self, epoch, model, score, prefix):
+        """
+        Salva prefix_<epoch>.pth come miglior modello; restano i keep_best con score piu' alto.
+        """
+        path = os.path.join(self.directory, f'{prefix}_{epoch}.pth')
+        state = snapshot(model.state_dict())
+        # un nuovo salvataggio con lo stesso nome sostituisce il precedente
+        self.best = [item for item in self.best if item[2] != path]
+        self.best.append((score, epoch, path))
+        self.best.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        expired = [item[2] for item in self.best[self.keep_best:]] if self.keep_best else []
+        self.best = self.best[:self.keep_best] if self.keep_best else []
+
+        def write():
+            atomic_save(state, path)
+            for old in expired:
+                _remove(old)
+
+        self.writer.submit(write)
+
+    def load_resume(self, map_location=None):
+        """
+        Stato salvato da save_epoch (None se non c'e' nulla da riprendere); ripristina anche la retention.
+        """
+        if not os.path.exists(self.resume_path):
+            return None
+        state = torch.load(self.resume_path, map_location=map_location, weights_only=False)
+        self.load_state_dict(state.get('checkpoints', {}))
+
+        return state
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class MetricsLog:
+    """
+    Log CSV in append (una riga per epoca), scritto in background. Le colonne sono quelle della prima riga.
+    """
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.writer = writer or BackgroundWriter('metrics-writer')
+
+    def append(self, row):
+        row = dict(row)
+
+        def write():
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, 'a', newline='') as f:
+                csv_writer = csv.DictWriter(f, fieldnames=list(row))
+                if new_file:
+                    csv_writer.writeheader()
+                csv_writer.writerow(row)
+                f.flush()
+
+        self.writer.submit(write)
+
+    def truncate(self, epoch):
+        """
+        Rimuove le righe con epoch >= epoch: le epoche che verranno ripetute dopo una ripresa
+        (con epoch=0, all'inizio di un nuovo addestramento, tutte le righe di un'esecuzione precedente).
+        """
+        def write():
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, newline='') as f:
+                reader = csv.DictReader(f)
+                fieldnames = reader.fieldnames
+                rows = [row for row in reader if int(row['epoch']) < epoch]
+            with open(self.path + '.tmp', 'w', newline='') as f:
+                if rows:
+                    csv_writer = csv.DictWriter(f, fieldnames=fieldnames)
+                    csv_writer.writeheader()
+                    csv_writer.writerows(rows)
+            os.replace(self.path + '.tmp', self.path)
+
+        self.writer.submit(write)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+def export_excel(csv_path, xlsx_path):
+    """
+    Aggiunge le righe del CSV al report Excel esistente (lo storico delle esecuzioni precedenti), come
+    faceva il report originale; le righe gia' presenti (stesso CSV esportato di nuovo) non vengono
+    duplicate. Le epoche ripetute dopo una ripresa vanno tolte dal CSV con MetricsLog.truncate prima
+    dell'addestramento. Il file viene sostituito solo a scrittura completata.
+    """
+    df = pd.read_csv(csv_path)
+    if os.path.isfile(xlsx_path):
+        df = pd.concat([pd.read_excel(xlsx_path), df], ignore_index=True).drop_duplicates(ignore_index=True)
+    root, ext = os.path.splitext(xlsx_path)
+    tmp_path = f'{root}.tmp{ext}'
+    df.to_excel(tmp_path, index=False)
+    os.replace(tmp_path, xlsx_path)
@@ -1,9 +1,11 @@
+from contextlib import nullcontext
 import torch 
 import torch.nn.functional as F
 import numpy as np
 
 # Loss functions che prende come argomenti le predizioni dei due modelli, il tasso di dimenticanza e gli indici del batch
-def loss_coteaching(y_1, y_2, t, forget_rate, ind):
+# con verbose=False non vengono stampati i valori ad ogni batch
+def loss_coteaching(y_1, y_2, t, forget_rate, ind, verbose=True):
     t= t.float()
 
     loss_1 = F.binary_cross_entropy(y_1, t, reduction='none') # calcolo la loss per il primo modello
@@ -15,13 +17,62 @@ def loss_coteaching(y_1, y_2, t, forget_rate, ind):
     loss_2_sorted = loss_2[ind_2_sorted]
 
     remember_rate = 1 - forget_rate
-    print(f'forget_rate: {forget_rate}')
-    print(f'remember_rate: {remember_rate}')
-    num_remember = int(remember_rate * len(loss_1_sorted)) # si calcola quanti esempi ricordare
-    print(f'num_elementi: {len(loss_1_sorted)}')
-    print(f'num_remember: {num_remember}')
+    num_remember = max(int(remember_rate * len(loss_1_sorted)), 1) # si calcola quanti esempi ricordare (almeno uno)
+    if verbose:
+        print(f'forget_rate: {forget_rate}')
+        print(f'remember_rate: {remember_rate}')
+        print(f'num_elementi: {len(loss_1_sorted)}')
+        print(f'num_remember: {num_remember}')
 
     ind_1_update = ind_1_sorted[:num_remember]
     ind_2_update = ind_2_sorted[:num_remember] # indici da ricordare
 
-    return ind_1_update, ind_2_update 
+    return ind_1_update, ind_2_update
+
+
+def coteaching_step(model_1, optimizer_1, model_2, optimizer_2, data, target, forget_rate, autocast=nullcontext, scaler=None):
+    """
+    Un passo di Co-Teaching con una sola forward per modello: le loss per campione vengono calcolate
+    una volta e ogni modello viene aggiornato con la media della propria loss sui campioni a piccola
+    loss scelti dall'altro modello, sottoinsieme delle uscite gia' calcolate (indici sul device, senza .cpu()).
+    Non e' equivalente al percorso originale (loss_coteaching + nuova forward sui campioni scelti) nel modo in
+    cui viene usato, cioe' con i modelli in train mode: i campioni scelti sono normalizzati con media e varianza
+    dell'intero batch invece che del sottoinsieme, quindi loss e gradienti cambiano (lo scostamento e' riportato
+    da benchmark_coteaching.py), e running_mean / running_var di ogni modello vengono aggiornate una volta per passo
+    sull'intero batch invece che due volte (batch intero e sottoinsieme). Solo con i modelli in eval (BatchNorm
+    con statistiche fisse) selezione, loss e gradienti coincidono (tests/test_coteaching.py).
+    Almeno un campione viene sempre ricordato: con un ultimo batch piccolo e forget_rate alto la selezione
+    vuota darebbe una loss NaN, propagata nei pesi dagli step degli ottimizzatori.
+    Con autocast (es. TrainingRuntime.autocast) le forward usano la mixed precision, le loss restano in fp32;
+    con scaler (GradScaler, per fp16) la backward e gli step passano dallo scaler.
+    Restituisce le due loss (tensori staccati dal grafo).
+    """
+    target = target.float()
+    with autocast():
+        output_1 = model_1(data)
+        output_2 = model_2(data)
+
+    loss_1 = F.binary_cross_entropy(output_1.float(), target, reduction='none').view(-1)
+    loss_2 = F.binary_cross_entropy(output_2.float(), target, reduction='none').view(-1)
+    num_remember = max(int((1 - forget_rate) * loss_1.shape[0]), 1) # si calcola quanti esempi ricordare (almeno uno)
+    ind_1_update = torch.argsort(loss_1.detach())[:num_remember]
+    ind_2_update = torch.argsort(loss_2.detach())[:num_remember]
+
+    # model_1 impara dai campioni scelti da model_2 e viceversa
+    loss1_selected = loss_1[ind_2_update].mean()
+    loss2_selected = loss_2[ind_1_update].mean()
+
+    optimizer_1.zero_grad()
+    optimizer_2.zero_grad()
+    # i due grafi sono indipendenti: una sola backward calcola i gradienti di entrambi i modelli
+    if scaler is None:
+        (loss1_selected + loss2_selected).backward()
+        optimizer_1.step()
+        optimizer_2.step()
+    else:
+        scaler.scale(loss1_selected + loss2_selected).backward()
+        scaler.step(optimizer_1)
+        scaler.step(optimizer_2)
+        scaler.update()
+
+    return loss1_selected.detach(), loss2_selected.detach()
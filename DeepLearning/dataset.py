@@ -4,62 +4,126 @@ import numpy as np
 from sklearn.utils import resample
 import torch
 from torch.utils.data import Dataset, DataLoader
+from manifest import CLASSES, patient_manifest
+from shards import open_shard, read_index, write_shard
 
 class CoTeachingDataset(Dataset):
     def __init__(self, root_dir, patients, val=False):
         self.root_dir = root_dir
-        self.classes = ["nonapnea", "apnea"]
+        self.classes = CLASSES
         self.class_to_label = {class_name: i for i, class_name in enumerate(self.classes)}
-        self.file_paths = []
-        self.labels = []
+        self.class_dirs = []  # una voce per (paziente, classe)
+        self.file_names = []  # ogni file compare una sola volta, anche se sovracampionato
 
         self.patients=patients
-        
+
+        dir_ids = []
+        indices = []
+        labels = []
         for patient in self.patients:
             patient_folder = os.path.join(root_dir, patient)
-            #print(patient_folder)
-        
-            for class_name in self.classes:  # sekf.classes contiente tutte le classi presenti nella directory principale
-                #print(class_name)
-                class_dir = os.path.join(patient_folder, class_name)
-                #print(class_dir)
-                files = os.listdir(class_dir)
-                #print(files)
-
-                # Perform resampling if necessary
-                if val == False: 
-                    if class_name == "apnea":
-                        if len(files) < len(os.listdir(os.path.join(patient_folder, "nonapnea"))):
-                            files = resample(files, replace=True, n_samples=len(os.listdir(os.path.join(patient_folder, "nonapnea"))), random_state=42)
-                            #print(files)
-                            
-                    if class_name == "nonapnea":
-                        if len(files) < len(os.listdir(os.path.join(patient_folder, "apnea"))):
-                            #print(f'len vecchia {len(files)}')
-                            files = resample(files, replace=True, n_samples=len(os.listdir(os.path.join(patient_folder, "apnea"))), random_state=42)
-                            #print(f'len nuova {len(files)}')
-                    
-                for file_name in files:
-                    self.file_paths.append(os.path.join(class_dir, file_name))
-                    #print("file path:", self.file_paths)
-                    self.labels.append(self.class_to_label[class_name])
-                    #controllato viene assognato 0 a NON APNEA e 1 ad APNEA
-                    
-            
-                    
+            # elenco dei file dal manifest del paziente: nessuna os.listdir se le cartelle non sono cambiate
+            manifest = patient_manifest(patient_folder, self.classes)
+            counts = {class_name: len(manifest[class_name]['files']) for class_name in self.classes}
+
+            for class_name in self.classes:  # self.classes contiene le classi presenti nella cartella del paziente
+                files = manifest[class_name]['files']
+                first = len(self.file_names)
+                dir_ids.append(np.full(len(files), len(self.class_dirs), dtype=np.int32))
+                self.class_dirs.append(os.path.join(patient_folder, class_name))
+                self.file_names.extend(files)
+
+                # Perform resampling if necessary: la classe minoritaria viene sovracampionata fino alla
+                # dimensione dell'altra classe (stessi indici estratti da resample con random_state=42)
+                # come array di indici, senza duplicare i percorsi
+                selected = np.arange(len(files))
+                other = counts[self.classes[1 - self.class_to_label[class_name]]]
+                if val == False and len(files) < other:
+                    selected = resample(selected, replace=True, n_samples=other, random_state=42)
+
+                indices.append(first + selected)
+                labels.append(np.full(len(selected), self.class_to_label[class_name], dtype=np.int8))
+                #controllato viene assegnato 0 a NON APNEA e 1 ad APNEA
+
+        self.file_dirs = np.concatenate(dir_ids) if dir_ids else np.empty(0, dtype=np.int32)
+        self.indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+        self.labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int8)
+
+    def file_path(self, idx):
+        file_id = self.indices[idx]
+        return os.path.join(self.class_dirs[self.file_dirs[file_id]], self.file_names[file_id])
+
+    @property
+    def file_paths(self):
+        return [self.file_path(idx) for idx in range(len(self))]
 
     def __len__(self):
-        return len(self.file_paths)  # numero totale degli elementi nel dataset
+        return len(self.indices)  # numero totale degli elementi nel dataset
 
     def __getitem__(self, idx):
         """ if torch.is_tensor(idx):
             idx = idx.tolist() """
 
-        file_path = self.file_paths[idx]
+        file_path = self.file_path(idx)
         data = torch.load(file_path)
 
-        label = self.labels[idx]
+        label = int(self.labels[idx])
         data = data.unsqueeze(0)
 
         return data, label  # ritorna il dato e l'etichetta corrispondente per un dato indice.
 
+
+class ShardDataset(Dataset):
+    """
+    Stessi campioni (e stesso oversampling) di CoTeachingDataset, letti dagli shard memory-mapped
+    di shards.py invece che da un file .pth per campione. Gli shard mancanti, o scritti prima che cambiasse
+    una cartella di classe (una stat per classe, vedi shards.source_fingerprint), vengono creati dall'output
+    di make_spectrograms.py all'apertura.
+    """
+    def __init__(self, root_dir, patients, val=False, build=True):
+        self.root_dir = root_dir
+        self.classes = CLASSES
+        self.patients = patients
+        self.patient_folders = [os.path.join(root_dir, patient) for patient in patients]
+        self._shards = None  # aperti in modo pigro in ogni processo (anche nei worker del DataLoader)
+
+        shard_ids = []
+        rows = []
+        self.labels = []
+        for shard_id, patient_folder in enumerate(self.patient_folders):
+            index = write_shard(patient_folder) if build else read_index(patient_folder)
+            counts = {class_name: index['classes'][class_name]['count'] for class_name in self.classes}
+            for label, class_name in enumerate(self.classes):
+                info = index['classes'][class_name]
+                class_rows = np.arange(info['start'], info['start'] + info['count'])
+                # stesso resampling di CoTeachingDataset: sklearn estrae gli stessi indici
+                # per una lista di file o per un array di righe della stessa lunghezza
+                other = counts[self.classes[1 - label]]
+                if val == False and len(class_rows) < other:
+                    class_rows = resample(class_rows, replace=True, n_samples=other, random_state=42)
+
+                shard_ids.append(np.full(len(class_rows), shard_id))
+                rows.append(class_rows)
+                self.labels.extend([label] * len(class_rows))
+
+        self.shard_ids = np.concatenate(shard_ids) if shard_ids else np.empty(0, dtype=np.int64)
+        self.rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def __getstate__(self):
+        # le mappe non vanno serializzate (DataLoader con spawn): si riaprono nel processo di destinazione
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._shards = [open_shard(folder)[0] for folder in self.patient_folders]
+
+        data = torch.from_numpy(self._shards[self.shard_ids[idx]][self.rows[idx]])
+        label = self.labels[idx]
+        data = data.unsqueeze(0)
+
+        return data, label
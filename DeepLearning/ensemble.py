@@ -0,0 +1,101 @@
+import copy
+import torch
+import torch.nn as nn
+
+# Ensemble di piu' CRNN_2 eseguito con una sola forward. torch.func.vmap non ha una regola di batching
+# per nn.GRU, quindi i parametri non vengono impilati: la parte convolutiva viene fusa in modo esatto
+# - conv1 riceve lo stesso ingresso per tutti i membri: una sola convoluzione con i filtri concatenati
+#   (96*M canali di uscita);
+# - conv2..conv4 diventano convoluzioni a gruppi (groups=M), ogni gruppo con i pesi di un membro;
+# - BatchNorm e MaxPool lavorano per canale, quindi bastano i parametri concatenati;
+# e solo GRU e Linear (la parte leggera) restano separati per membro.
+# Inoltre, in eval, BatchNorm e' una funzione affine per canale: cambiando segno a pesi della convoluzione,
+# running_mean e peso della BatchNorm dei canali con scala negativa diventa non decrescente, quindi
+# (come ReLU) commuta con il MaxPool. Ogni blocco esegue il pooling subito dopo la convoluzione e
+# BatchNorm e ReLU su un tensore 8 volte (conv1, conv2) o 4 volte piu' piccolo, con risultati identici.
+# L'uscita e' [N, M]: la probabilita' di apnea di ogni membro, nell'ordine dato. Solo per inferenza.
+
+
+class pooled_conv_block(nn.Module):
+    """
+    conv_block in eval con il MaxPool anticipato: relu(bn(mpool(conv(x)))).
+    """
+    def __init__(self, conv, bn, pool_size):
+        super(pooled_conv_block, self).__init__()
+        self.conv = conv
+        self.mpool = nn.MaxPool2d(pool_size)
+        self.bn = bn
+        self.relu = nn.ReLU()
+
+    def forward(self, x):
+        return self.relu(self.bn(self.mpool(self.conv(x))))
+
+
+def _fuse_blocks(blocks, shared_input):
+    first = blocks[0]
+    groups = 1 if shared_input else len(blocks)
+    in_chan = first.conv.in_channels * groups
+    out_chan = first.conv.out_channels * len(blocks)
+    conv = nn.Conv2d(in_chan, out_chan, first.conv.kernel_size, first.conv.stride, padding='same',
+                     groups=groups, bias=False)
+    bn = nn.BatchNorm2d(out_chan, eps=first.bn.eps, momentum=first.bn.momentum).eval()
+    with torch.no_grad():
+        conv.weight.copy_(torch.cat([block.conv.weight for block in blocks]))
+        for name in ('weight', 'bias', 'running_mean', 'running_var'):
+            getattr(bn, name).copy_(torch.cat([getattr(block.bn, name) for block in blocks]))
+        # canali con scala negativa: (-y + mean) / std * (-w) == (y - mean) / std * w, negazioni esatte
+        negative = bn.weight < 0
+        conv.weight[negative] = -conv.weight[negative]
+        bn.running_mean[negative] = -bn.running_mean[negative]
+        bn.weight[negative] = -bn.weight[negative]
+
+    return pooled_conv_block(conv, bn, first.mpool.kernel_size)
+
+
+class CRNN_2Ensemble(nn.Module):
+    """
+    input: [Batch, 1, Frequency, Time]
+    output: [Batch, M], una colonna per ogni rete di nets
+    """
+    def __init__(self, nets):
+        super(CRNN_2Ensemble, self).__init__()
+        self.num_members = len(nets)
+        self.conv1 = _fuse_blocks([net.conv1 for net in nets], shared_input=True)
+        self.conv2 = _fuse_blocks([net.conv2 for net in nets], shared_input=False)
+        self.conv3 = _fuse_blocks([net.conv3 for net in nets], shared_input=False)
+        self.conv4 = _fuse_blocks([net.conv4 for net in nets], shared_input=False)
+        self.rnns = nn.ModuleList(copy.deepcopy(net.rnn1) for net in nets)
+        self.denses = nn.ModuleList(copy.deepcopy(net.dense) for net in nets)
+        self.sigmoid = nn.Sigmoid()
+
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.conv2(x)
+        x = self.conv3(x)
+        x = self.conv4(x)
+        x = x.squeeze(2).permute(0, 2, 1)  # [B, T, M*128]
+        outputs = []
+        for features, rnn, dense in zip(x.chunk(self.num_members, dim=2), self.rnns, self.denses):
+            features, _ = rnn(features.contiguous())
+            outputs.append(dense(features[:, -1, :]))
+
+        return self.sigmoid(torch.cat(outputs, dim=1))
+
+
+def combined_probability(predictions):
+    """
+    Probabilita' combinata (media dei membri) da un'uscita [N, M]; un'uscita [N] resta invariata.
+    """
+    predictions = torch.as_tensor(predictions)
+
+    return predictions.mean(dim=1) if predictions.dim() == 2 else predictions
+
+
+def ensemble_result(members, prediction):
+    """
+    Campi della risposta per uno spettrogramma: probabilita' combinata e dei singoli membri.
+    """
+    return {
+        "prediction": sum(prediction) / len(prediction),
+        "predictions": dict(zip(members, prediction)),
+    }
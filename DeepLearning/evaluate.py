@@ -0,0 +1,266 @@
+import argparse
+import json
+import os, sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+import librosa
+from threadpoolctl import threadpool_limits
+from networks import CRNN_2
+from labelling import classify_windows, NON_APNEA, APNEA
+from audio_stream import recording_files, stream_windows
+from spectrogram_engine import melspectrogram_batch
+from make_spectrograms import is_done, load_events
+from manifest import CLASSES, patient_manifest
+from shards import is_current, open_shard, read_index
+from postprocessing import PostProcessing
+
+# Valutazione offline di uno o piu' checkpoint sui pazienti di test (sostituisce test.py):
+# - i pazienti vengono elaborati in parallelo (un processo per paziente, --workers);
+# - gli spettrogrammi vengono letti dalla cache di make_spectrograms.py (shard o file .pth) se il
+#   paziente e' completo in --spectrograms, altrimenti calcolati a flusso dall'audio come in test.py;
+# - ogni blocco di finestre passa in un'unica forward per ogni modello e aggiorna i conteggi
+#   (tp, fp, fn, tn) per paziente e per modello;
+# - il report JSON (--out) contiene le metriche per paziente e per modello, prima e dopo il
+#   post-processing (regola storica: 1 isolato tra almeno 2 zeri -> 0, su predizioni ed etichette).
+# Esempio: python evaluate.py --checkpoints model/checkpoints/1706_model1_149.pth --workers 4 --out report.json
+
+wav_path = "/disks/disk1/adanna/PSG_Audio/EDF/" #file path alla cartella con i file audio
+checkpoint_path = "/home/adanna/Codice/apnea_detection_v3/model/checkpoints" #file path dove è salvato il modello
+meta_file = "/home/adanna/Codice/apnea_detection_v3/meta.csv" # file .csv con informazioni circa i dati a disposizione
+SR = 16000 # working sample rate
+
+context_s = 6 # secondi di contesto
+patients = [1120, 1106, 1082, 1095] # 20% - 4 pazienti
+checkpoints = [os.path.join(checkpoint_path, "1706_model1_149.pth")]
+
+_models = {}
+
+
+def load_models(paths, device):
+    """
+    CRNN_2 in eval per ogni checkpoint, caricati una sola volta per processo.
+    """
+    models = {}
+    for path in paths:
+        if path not in _models:
+            net = CRNN_2()
+            net.load_state_dict(torch.load(path, map_location=device))
+            _models[path] = net.to(device).eval()
+        models[os.path.splitext(os.path.basename(path))[0]] = _models[path]
+
+    return models
+
+
+def cached_windows(patient_folder, batch_size):
+    """
+    (indici, etichette, spettrogrammi) dalla cache del paziente in ordine di finestra:
+    dallo shard se presente e aggiornato, altrimenti dai file .pth (il nome del file e' l'indice della finestra).
+    """
+    if is_current(patient_folder):
+        index = read_index(patient_folder)
+        spectrograms, labels = open_shard(patient_folder)
+        rows, indices = [], []
+        for class_name in CLASSES:
+            info = index['classes'][class_name]
+            rows.extend(range(info['start'], info['start'] + info['count']))
+            indices.extend(int(os.path.splitext(name)[0]) for name in info['files'])
+        rows, indices = np.asarray(rows, dtype=np.int64), np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        for start in range(0, order.size, batch_size):
+            # righe ordinate: letture quasi sequenziali dalla mappa
+            chunk = order[start:start + batch_size]
+            yield indices[chunk], np.asarray(labels[rows[chunk]]), spectrograms[rows[chunk]]
+        return
+
+    manifest = patient_manifest(patient_folder)
+    entries = sorted((int(os.path.splitext(name)[0]), label, os.path.join(patient_folder, class_name, name))
+                     for label, class_name in enumerate(CLASSES) for name in manifest[class_name]['files'])
+    for start in range(0, len(entries), batch_size):
+        chunk = entries[start:start + batch_size]
+        yield (np.asarray([entry[0] for entry in chunk]), np.asarray([entry[1] for entry in chunk], dtype=np.int8),
+               np.stack([torch.load(entry[2]).numpy() for entry in chunk]))
+
+
+def audio_windows(P_n, starts, durations, wav_path, batch_size):
+    """
+    (indici, etichette, spettrogrammi) calcolati dall'audio: solo le finestre di non apnea / apnea.
+    """
+    wav_files = recording_files(os.path.join(wav_path, f"0000{P_n}"))
+    s_len = sum(librosa.get_duration(path=wf) for wf in wav_files)
+    _, window_labels = classify_windows(starts, durations, SR, int(s_len * SR), context_s * SR)
+
+    for indices, windows in stream_windows(wav_files, context_s * SR, sr=SR, max_samples=int(s_len * SR),
+                                           batch_size=batch_size):
+        keep = np.isin(window_labels[indices], (NON_APNEA, APNEA))
+        if keep.any():
+            yield indices[keep], (window_labels[indices[keep]] == APNEA).astype(np.int8), \
+                melspectrogram_batch(windows[keep], SR)
+
+
+def confusion(labels, predictions):
+    labels, predictions = np.asarray(labels, dtype=bool), np.asarray(predictions, dtype=bool)
+
+    return {
+        'tp': int(np.count_nonzero(labels & predictions)),
+        'fp': int(np.count_nonzero(~labels & predictions)),
+        'fn': int(np.count_nonzero(labels & ~predictions)),
+        'tn': int(np.count_nonzero(~labels & ~predictions)),
+    }
+
+
+def add_counts(total, counts):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+    return total
+
+
+def scores(counts):
+    """
+    Precision, recall e F1 dai conteggi (0 se indefinite, come zero_division di sklearn).
+    """
+    tp, fp, fn = counts['tp'], counts['fp'], counts['fn']
+    return dict(counts,
+                precision=tp / (tp + fp) if tp + fp else 0.0,
+                recall=tp / (tp + fn) if tp + fn else 0.0,
+                f1=2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0)
+
+
+@torch.inference_mode()
+def evaluate_patient(P_n, starts, durations, checkpoints, wav_path=wav_path, cache_path=None, batch_size=256,
+                     threshold=0.5, device=None):
+    """
+    Metriche di tutti i checkpoint su un paziente:
+    {'patient', 'pid', 'source', 'windows', 'elapsed_s', 'models': {nome: {... 'postprocessed': {...}}}}.
+    """
+    start_time = time.perf_counter()
+    device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    models = load_models(checkpoints, device)
+
+    patient_folder = os.path.join(cache_path, 'P' + str(P_n)) if cache_path else None
+    if patient_folder and is_done(P_n, cache_path):
+        source = 'shard' if is_current(patient_folder) else 'pth'
+        batches = cached_windows(patient_folder, batch_size)
+    else:
+        source = 'audio'
+        batches = audio_windows(P_n, starts, durations, wav_path, batch_size)
+
+    counts = {name: {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0} for name in models}
+    # le predizioni binarie (int8, una per finestra) servono solo al post-processing di fine sequenza
+    labels, predictions = [], {name: [] for name in models}
+    for indices, batch_labels, specs in batches:
+        data = torch.as_tensor(specs).unsqueeze(1).to(device, non_blocking=True)
+        labels.append(batch_labels)
+        for name, net in models.items():
+            batch_predictions = (net(data).reshape(-1) >= threshold).to(torch.int8).cpu().numpy()
+            add_counts(counts[name], confusion(batch_labels, batch_predictions))
+            predictions[name].append(batch_predictions)
+
+    labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int8)
+    postprocessing = PostProcessing()
+    processed_labels = postprocessing.apply(labels)
+    results = {}
+    for name in models:
+        model_predictions = np.concatenate(predictions[name]) if predictions[name] else np.empty(0, dtype=np.int8)
+        results[name] = dict(scores(counts[name]),
+                             postprocessed=scores(confusion(processed_labels, postprocessing.apply(model_predictions))))
+
+    return {
+        'patient': P_n,
+        'pid': os.getpid(),
+        'source': source,
+        'windows': int(labels.size),
+        'elapsed_s': time.perf_counter() - start_time,
+        'models': results,
+    }
+
+
+def summarize(reports):
+    """
+    Metriche complessive per modello (somma dei conteggi dei pazienti).
+    """
+    totals = {}
+    for report in reports:
+        for name, result in report['models'].items():
+            total = totals.setdefault(name, {'counts': {}, 'postprocessed': {}})
+            add_counts(total['counts'], {key: result[key] for key in ('tp', 'fp', 'fn', 'tn')})
+            add_counts(total['postprocessed'], {key: result['postprocessed'][key] for key in ('tp', 'fp', 'fn', 'tn')})
+
+    return {name: dict(scores(total['counts']), postprocessed=scores(total['postprocessed']))
+            for name, total in totals.items()}
+
+
+def _init_worker():
+    # un processo per paziente: BLAS/OpenMP a thread singolo per evitare oversubscription
+    threadpool_limits(1)
+    torch.set_num_threads(1)
+
+
+def _format(name, result):
+    post = result['postprocessed']
+    return (f'{name}: precision {result["precision"]:.4f}  recall {result["recall"]:.4f}  f1 {result["f1"]:.4f}  '
+            f'(after processing {post["precision"]:.4f} / {post["recall"]:.4f} / {post["f1"]:.4f})')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoints', nargs='+', default=checkpoints)
+    parser.add_argument('--patients', type=int, nargs='+', default=patients)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--wav-path', default=wav_path)
+    parser.add_argument('--meta-file', default=meta_file)
+    parser.add_argument('--spectrograms', default=None, help='cartella di output di make_spectrograms.py da riusare')
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--out', default=None, help='report JSON')
+    args = parser.parse_args()
+
+    events = load_events(args.meta_file, args.patients)
+    options = dict(wav_path=args.wav_path, cache_path=args.spectrograms, batch_size=args.batch_size,
+                   threshold=args.threshold, device=args.device)
+
+    reports = []
+    start_time = time.perf_counter()
+    if args.workers <= 1:
+        for P_n in args.patients:
+            reports.append(evaluate_patient(P_n, *events[P_n], args.checkpoints, **options))
+            print(f'Patient number {P_n} ({reports[-1]["source"]}, {reports[-1]["elapsed_s"]:.1f} s)')
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(evaluate_patient, P_n, *events[P_n], args.checkpoints, **options): P_n
+                       for P_n in args.patients}
+            for future in as_completed(futures):
+                try:
+                    report = future.result()
+                except Exception as e:
+                    print(f'Patient number {futures[future]} failed: {e}')
+                    continue
+                reports.append(report)
+                print(f'Patient number {report["patient"]} done (worker {report["pid"]}, {report["source"]}, '
+                      f'{report["elapsed_s"]:.1f} s)')
+    reports.sort(key=lambda report: args.patients.index(report['patient']))
+    elapsed = time.perf_counter() - start_time
+
+    for report in reports:
+        for name, result in report['models'].items():
+            print(f'P{report["patient"]} ' + _format(name, result))
+    summary = summarize(reports)
+    for name, result in summary.items():
+        print('total ' + _format(name, result))
+    print(f'{len(reports)}/{len(args.patients)} patients, {sum(r["windows"] for r in reports)} windows '
+          f'in {elapsed:.1f} s')
+
+    if args.out:
+        with open(args.out + '.tmp', 'w') as f:
+            json.dump({'checkpoints': args.checkpoints, 'threshold': args.threshold, 'patients': reports,
+                       'models': summary, 'elapsed_s': elapsed}, f, indent=2)
+        os.replace(args.out + '.tmp', args.out)
+    if len(reports) < len(args.patients):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import torch
+import torch.nn.functional as F
+from torchmetrics.classification import Precision, Recall, BinaryF1Score
+
+# Validazione a blocchi con metriche in streaming: per ogni batch le metriche torchmetrics vengono
+# aggiornate con update() e le uscite scartate, senza accumulare tutte le predizioni. Lo stato viene
+# azzerato ad ogni evaluate(), quindi i valori si riferiscono solo all'epoca corrente.
+# Piu' modelli (es. i due modelli del Co-Teaching) vengono valutati con un solo passaggio sui dati.
+
+
+class Evaluator:
+    def __init__(self, runtime, num_models=1, threshold=0.5):
+        self.runtime = runtime
+        self.threshold = threshold
+        device = runtime.device
+        self.metrics = [{
+            'precision': Precision(task='binary', average='micro', threshold=threshold).to(device),
+            'recall': Recall(task='binary', average='micro', threshold=threshold).to(device),
+            'f1': BinaryF1Score(threshold=threshold).to(device),
+        } for _ in range(num_models)]
+
+    def reset(self):
+        for metrics in self.metrics:
+            for metric in metrics.values():
+                metric.reset()
+
+    @torch.inference_mode()
+    def evaluate(self, models, loader, tag='val'):
+        """
+        Valuta i modelli (lista, nello stesso ordine di num_models) su tutto il loader.
+        Restituisce per ogni modello {'precision', 'recall', 'f1', 'loss'} (loss = BCE media).
+        """
+        self.reset()
+        for model in models:
+            model.eval()
+        loss_sums = torch.zeros(len(models), device=self.runtime.device)
+        samples = 0
+
+        for data, label in self.runtime.batches(loader, tag=tag):
+            label = label.float().unsqueeze(1)
+            with self.runtime.autocast():
+                outputs = [model(data) for model in models]
+            for i, (metrics, output) in enumerate(zip(self.metrics, outputs)):
+                output = output.float()
+                loss_sums[i] += F.binary_cross_entropy(output, label, reduction='sum')
+                for metric in metrics.values():
+                    metric.update(output, label.int())
+            samples += label.shape[0]
+
+        results = []
+        losses = (loss_sums / max(samples, 1)).tolist()
+        for metrics, loss in zip(self.metrics, losses):
+            result = {name: metric.compute().item() for name, metric in metrics.items()}
+            result['loss'] = loss
+            results.append(result)
+
+        return results
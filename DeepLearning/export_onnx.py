@@ -0,0 +1,25 @@
+import argparse
+import os
+from backends import ONNX_DIR, export_onnx
+from model_registry import MODELS, ModelRegistry
+
+# Esporta i checkpoint CRNN_2 in ONNX (asse batch dinamico), uno per modelId.
+# Con INFERENCE_BACKEND=onnxruntime il registry lo fa comunque da solo al primo caricamento.
+# Esempio: python export_onnx.py --out model/onnx
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=list(MODELS))
+    parser.add_argument('--out', default=ONNX_DIR)
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(variants={}, backend='torch')
+    for model_id in args.models:
+        path = os.path.join(args.out, f'{model_id}.onnx')
+        export_onnx(registry.get(model_id).net, path, args.opset)
+        print(f'{model_id} -> {path}')
+
+
+if __name__ == '__main__':
+    main()
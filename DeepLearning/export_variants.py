@@ -0,0 +1,100 @@
+import argparse
+import glob
+import json
+import os
+import time
+import warnings
+import torch
+from image_utils import decode_images_to_batch
+from model_registry import MODELS, ModelRegistry
+from model_variants import VARIANTS, build_variant, to_torchscript
+
+# Esporta le varianti ottimizzate di ogni checkpoint come TorchScript in model/variants/
+# e ne misura latenza e scostamento dalla rete fp32 su un insieme di spettrogrammi PNG.
+# Esempio: python export_variants.py --samples ../ApplicazioneNode/Data --variants fused int8 script
+# Il report (model/variants/report.json) indica quale variante scegliere con MODEL_VARIANTS.
+
+DEFAULT_SAMPLES = os.path.join('..', 'ApplicazioneNode', 'Data')
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model', 'variants')
+
+
+def load_samples(folder):
+    files = sorted(glob.glob(os.path.join(folder, '**', '*.png'), recursive=True))
+    buffers = []
+    for path in files:
+        with open(path, 'rb') as f:
+            buffers.append(f.read())
+    batch, errors = decode_images_to_batch(buffers)
+    skipped = sum(error is not None for error in errors)
+    if batch.shape[0] == 0:
+        raise SystemExit(f'No valid 64x519 spectrogram found in {folder}')
+
+    return batch, skipped
+
+
+def latency_ms(net, batch, repeats):
+    with torch.inference_mode():
+        net(batch)  # warm-up (e compilazione per torch.compile)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            net(batch)
+
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=list(MODELS))
+    parser.add_argument('--variants', nargs='+', default=[v for v in VARIANTS if v not in ('fp32', 'compiled')])
+    parser.add_argument('--samples', default=DEFAULT_SAMPLES, help='cartella con gli spettrogrammi PNG di riferimento')
+    parser.add_argument('--out', default=EXPORT_DIR)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    os.makedirs(args.out, exist_ok=True)
+    samples, skipped = load_samples(args.samples)
+    print(f'{samples.shape[0]} spettrogrammi di riferimento ({skipped} scartati)')
+
+    registry = ModelRegistry(variants={}, backend='torch')
+    report = {}
+    for model_id in args.models:
+        net = registry.get(model_id).net
+        with torch.inference_mode():
+            reference = net(samples).view(-1)
+        base_ms = latency_ms(net, samples, args.repeats)
+        report[model_id] = {'fp32': {'latency_ms': base_ms}}
+        print(f'{model_id}: fp32 {base_ms:.1f} ms/batch')
+
+        for variant in args.variants:
+            optimised = build_variant(net, variant)
+            with torch.inference_mode():
+                outputs = optimised(samples).view(-1)
+            delta = (outputs - reference).abs()
+            agreement = ((outputs >= args.threshold) == (reference >= args.threshold)).float().mean().item()
+            ms = latency_ms(optimised, samples, args.repeats)
+
+            path = None
+            if variant != 'compiled':
+                exported = optimised if isinstance(optimised, torch.jit.ScriptModule) else to_torchscript(optimised)
+                path = os.path.join(args.out, f'{model_id}.{variant}.pt')
+                torch.jit.save(exported, path)
+
+            report[model_id][variant] = {
+                'latency_ms': ms,
+                'speedup': base_ms / ms,
+                'max_abs_delta': delta.max().item(),
+                'mean_abs_delta': delta.mean().item(),
+                'label_agreement': agreement,
+                'path': path,
+            }
+            print(f'{model_id}: {variant:<12} {ms:8.1f} ms/batch  x{base_ms / ms:.2f}  '
+                  f'max|d|={delta.max().item():.2e}  agreement={agreement:.4f}')
+
+    with open(os.path.join(args.out, 'report.json'), 'w') as f:
+        json.dump({'samples': samples.shape[0], 'threshold': args.threshold, 'models': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
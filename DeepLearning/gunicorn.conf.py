@@ -0,0 +1,37 @@
+import os
+import multiprocessing
+
+# Configurazione di produzione: python -m gunicorn -c gunicorn.conf.py app:app
+# I modelli vengono caricati nel master (preload_app) e condivisi copy-on-write dai worker;
+# ogni worker usa un numero limitato di thread torch per non sovraccaricare i core.
+
+bind = f"0.0.0.0:{os.environ.get('FLASK_PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 600))
+preload_app = True
+
+os.environ.setdefault("PRELOAD_MODELS", "1")
+
+
+def torch_threads(num_workers):
+    if "TORCH_NUM_THREADS" in os.environ:
+        return int(os.environ["TORCH_NUM_THREADS"])
+
+    return max(1, multiprocessing.cpu_count() // max(1, num_workers))
+
+
+def on_starting(server):
+    server.log.info(f"Torch threads per worker: {torch_threads(server.cfg.workers)}")
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(torch_threads(server.cfg.workers))
+    try:
+        torch.set_num_interop_threads(int(os.environ.get("TORCH_INTEROP_THREADS", 1)))
+    except RuntimeError:
+        # gia' impostato (il pool inter-op e' stato avviato prima del fork)
+        pass
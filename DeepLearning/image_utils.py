@@ -1,14 +1,19 @@
 import wave
 from PIL import Image
 import io
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 
 def decode_image_from_buffer(buffer):
     byte_array = buffer['data']
     
-    # Converte l'array di byte in un oggetto BytesIO
-    bytes_io = io.BytesIO(bytearray(byte_array))
+    # Converte l'array di byte (formato JSON {type:'Buffer', data:[...]}) in byte
+    return decode_image_from_bytes(bytearray(byte_array))
+
+def decode_image_from_bytes(data):
+    # Accetta bytes, bytearray o memoryview (es. un frame del formato binario di transport.py)
+    bytes_io = io.BytesIO(data)
 
     # Apre l'immagine usando PIL (Pillow)
     image = Image.open(bytes_io)
@@ -25,4 +30,48 @@ def decode_image_from_buffer(buffer):
     image_tensor = torch.tensor(image_array, dtype=torch.float32)
     tensor_image = image_tensor.unsqueeze(0).unsqueeze(0)
 
-    return tensor_image
\ No newline at end of file
+    return tensor_image
+
+SPECTROGRAM_SHAPE = (64, 519)
+
+def _decode_into(out, data):
+    # Decodifica un PNG direttamente nella riga out ([64, 519] float32) del batch preallocato
+    image = Image.open(io.BytesIO(data))
+    if image.mode == 'P':
+        image = image.convert('RGB')
+    if len(image.getbands()) > 1:
+        # RGB/RGBA/LA: gli spettrogrammi sono salvati in scala di grigi, basta il primo canale
+        image = image.getchannel(0)
+
+    image_array = np.asarray(image)
+    if image_array.shape != out.shape:
+        raise ValueError(f'Unexpected spectrogram shape {image_array.shape}, expected {out.shape}')
+    out[...] = image_array
+
+def decode_images_to_batch(buffers, num_threads=0):
+    """
+    Decodifica N PNG (bytes, bytearray o memoryview) in un unico batch float32 [N, 1, 64, 519].
+    Restituisce (tensore, errori): il tensore contiene solo le immagini decodificate, nell'ordine
+    di ingresso; errori e' allineato a buffers, None se l'immagine e' valida altrimenti il messaggio.
+    Con num_threads > 0 la decodifica e' distribuita su un thread pool (PIL rilascia il GIL).
+    """
+    batch = np.empty((len(buffers), 1) + SPECTROGRAM_SHAPE, dtype=np.float32)
+    errors = [None] * len(buffers)
+
+    def decode(i):
+        try:
+            _decode_into(batch[i, 0], buffers[i])
+        except Exception as e:
+            errors[i] = str(e)
+
+    if num_threads and len(buffers) > 1:
+        with ThreadPoolExecutor(max_workers=num_threads) as pool:
+            list(pool.map(decode, range(len(buffers))))
+    else:
+        for i in range(len(buffers)):
+            decode(i)
+
+    if any(error is not None for error in errors):
+        batch = batch[[error is None for error in errors]]
+
+    return torch.from_numpy(batch), errors
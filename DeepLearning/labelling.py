@@ -0,0 +1,78 @@
+import numpy as np
+
+# Etichettatura delle finestre di context_s secondi a partire dagli intervalli di apnea di meta.csv,
+# senza costruire la maschera a livello di campione. Riproduce le regole di make_spectrograms.py:
+# finestra di non apnea se nessun campione e' coperto da un evento, di apnea se sono coperti tutti
+# i context_s*SR campioni, mista altrimenti (l'ultima finestra, se incompleta, non e' mai apnea).
+
+NON_APNEA = 0
+APNEA = 1
+MIXED = -1
+
+
+def event_intervals(starts, durations, sr, n_samples):
+    """
+    Intervalli [inizio, fine) in campioni, come li scriveva la maschera originale
+    (int(Start*SR) : int(Start*SR) + int(Duration*SR)), tagliati a n_samples e uniti se sovrapposti.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    begin = (starts * sr).astype(np.int64)
+    end = begin + (durations * sr).astype(np.int64)
+    begin = np.clip(begin, 0, n_samples)
+    end = np.clip(end, 0, n_samples)
+    keep = end > begin
+    begin, end = begin[keep], end[keep]
+    if begin.size == 0:
+        return begin, end
+
+    order = np.argsort(begin, kind='stable')
+    begin, end = begin[order], end[order]
+    # unione degli intervalli sovrapposti o adiacenti
+    running_end = np.maximum.accumulate(end)
+    new_group = np.empty(begin.size, dtype=bool)
+    new_group[0] = True
+    new_group[1:] = begin[1:] > running_end[:-1]
+    group = np.cumsum(new_group) - 1
+    merged_begin = begin[new_group]
+    merged_end = np.zeros(merged_begin.size, dtype=np.int64)
+    np.maximum.at(merged_end, group, end)
+
+    return merged_begin, merged_end
+
+
+def covered_samples(begin, end, points):
+    """
+    Numero di campioni coperti dagli intervalli (disgiunti e ordinati) in [0, p) per ogni p di points.
+    """
+    points = np.asarray(points, dtype=np.int64)
+    if begin.size == 0:
+        return np.zeros(points.shape, dtype=np.int64)
+    lengths = np.concatenate(([0], np.cumsum(end - begin)))
+    # intervalli che iniziano prima di p
+    k = np.searchsorted(begin, points, side='left')
+    covered = lengths[k]
+    # l'ultimo di questi puo' essere coperto solo in parte
+    last = np.maximum(k - 1, 0)
+    overshoot = np.where(k > 0, np.maximum(end[last] - points, 0), 0)
+
+    return covered - overshoot
+
+
+def classify_windows(starts, durations, sr, n_samples, window, hop=None):
+    """
+    Classifica tutte le finestre di window campioni (passo hop, default window) che iniziano
+    in range(0, n_samples, hop). Restituisce (inizi delle finestre, etichette) con etichette
+    NON_APNEA, APNEA o MIXED.
+    """
+    hop = hop or window
+    begin, end = event_intervals(starts, durations, sr, n_samples)
+    window_starts = np.arange(0, n_samples, hop, dtype=np.int64)
+    window_ends = np.minimum(window_starts + window, n_samples)
+    covered = covered_samples(begin, end, window_ends) - covered_samples(begin, end, window_starts)
+
+    labels = np.full(window_starts.shape, MIXED, dtype=np.int8)
+    labels[covered == 0] = NON_APNEA
+    labels[covered == window] = APNEA
+
+    return window_starts, labels
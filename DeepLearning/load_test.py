@@ -0,0 +1,100 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from transport import FRAMES_MIMETYPE, encode_frames
+
+# Load test di /inference: per ogni numero di worker avvia gunicorn con gunicorn.conf.py,
+# invia richieste concorrenti e riporta p50/p99 della latenza e richieste/s.
+# Esempio: python load_test.py --workers 1 2 4 --concurrency 8 --requests 64
+# Con --url si misura un server gia' avviato (es. il container) invece di avviarne uno.
+
+def build_body(folder, model_id, images_per_request):
+    files = sorted(glob.glob(os.path.join(folder, '*.png')))
+    if not files:
+        raise SystemExit(f'No PNG found in {folder}')
+    frames = []
+    for i in range(images_per_request):
+        with open(files[i % len(files)], 'rb') as f:
+            frames.append((f'{i}.png', f.read()))
+
+    return encode_frames(model_id, frames)
+
+
+def post(url, body):
+    req = urllib.request.Request(url + '/inference', data=body, headers={'Content-Type': FRAMES_MIMETYPE})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        json.loads(resp.read())
+
+    return time.perf_counter() - start
+
+
+def wait_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/healthz') as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'Server at {url} not ready after {timeout}s')
+
+
+def run_load(url, body, concurrency, requests):
+    post(url, body)  # warm-up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda _: post(url, body), range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=None, help='server gia\' avviato, es. http://localhost:5000')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--model', default='20_patients_model')
+    parser.add_argument('--images', default=os.path.join('..', 'ApplicazioneNode', 'Data', 'apnea'))
+    parser.add_argument('--images-per-request', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64)
+    args = parser.parse_args()
+
+    body = build_body(args.images, args.model, args.images_per_request)
+    print(f'{"workers":>8} {"p50 ms":>9} {"p99 ms":>9} {"req/s":>8}')
+
+    if args.url:
+        p50, p99, rps = run_load(args.url, body, args.concurrency, args.requests)
+        print(f'{"-":>8} {p50:>9.1f} {p99:>9.1f} {rps:>8.2f}')
+        return
+
+    for num_workers in args.workers:
+        url = f'http://127.0.0.1:{args.port}'
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(num_workers),
+             '-b', f'127.0.0.1:{args.port}', 'app:app'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(url, timeout=120)
+            p50, p99, rps = run_load(url, body, args.concurrency, args.requests)
+            print(f'{num_workers:>8} {p50:>9.1f} {p99:>9.1f} {rps:>8.2f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
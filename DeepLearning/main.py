@@ -7,10 +7,12 @@ import os
 from torch.utils.data import DataLoader, random_split
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
-from dataset import CoTeachingDataset  
+from dataset import ShardDataset
 from networks import CRNN_2 
-from coteaching_loss import loss_coteaching 
-from torchmetrics.classification import Precision, Recall, BinaryF1Score
+from coteaching_loss import coteaching_step
+from training_runtime import TrainingRuntime
+from evaluation import Evaluator
+from checkpointing import CheckpointManager, MetricsLog, export_excel
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 import gc
 from datetime import datetime
@@ -19,6 +21,7 @@ import pandas as pd
 
 # Parametri di addestramento
 batch_size = 64
+val_batch_size = 256 # la validazione non calcola gradienti: batch piu' grandi
 epochs = 150
 num_gradual = 30  # Numero di epoche in cui si raggiunge il forget_rate
 exponent = 1
@@ -26,7 +29,13 @@ learning_rate = 0.01
 forget_rate = 0.3
 print_freq = 1
 logs_path = "/home/adanna/Codice/apnea_detection_v3/model"
+resume = False # True per riprendere dall'ultimo stato salvato in logs_path/checkpoints (altrimenti si riparte da zero)
+keep_last = 3 # epoche di cui tenere i pesi dei due modelli
+keep_best = 3 # migliori modelli da tenere
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# worker, prefetch, AMP e channels-last configurabili con le variabili TRAIN_* (vedi training_runtime.py)
+runtime = TrainingRuntime(device)
+print(runtime)
 
 # Elenco dei pazienti
 training_patients = ["P1097","P1000", "P1006", "P1008", "P1010", "P1014", "P1016", "P1018", "P1020", "P1022","P1028","P1037", "P1039", "P1041", "P1043", "P1057", "P1059", "P1069",  "P1071","P1073"]  # 65% - 20 pazienti
@@ -39,14 +48,14 @@ na_lbls_total=[]
 
 data_path = f"/disks/disk1/adanna/MELSP_6S"
 
-dataset_training = CoTeachingDataset(data_path, training_patients)
-dataset_validation = CoTeachingDataset(data_path, validation_patients, val=True)
+dataset_training = ShardDataset(data_path, training_patients)
+dataset_validation = ShardDataset(data_path, validation_patients, val=True)
 
 print(f'Dimensione dataset: {len(dataset_training)}')
 print(f'Dimensione dataset: {len(dataset_validation)}')
 
-train_loader = DataLoader(dataset_training, batch_size=batch_size, shuffle=True)
-val_loader = DataLoader(dataset_validation, batch_size=1, shuffle=True)
+train_loader = runtime.loader(dataset_training, batch_size=batch_size, shuffle=True)
+val_loader = runtime.loader(dataset_validation, batch_size=val_batch_size)
 
 def set_seed(seed):
     torch.manual_seed(seed)
@@ -58,12 +67,12 @@ def set_seed(seed):
 #modello1 inizializzazione
 seed_1 = 128
 set_seed(seed_1)
-model_1 = CRNN_2().to(device)
+model_1 = runtime.prepare_model(CRNN_2())
 
 #modello2 inizializzazione
 seed_2 = 12
 set_seed(seed_2)
-model_2 = CRNN_2().to(device)
+model_2 = runtime.prepare_model(CRNN_2())
 
 # Definisci ottimizzatori
 optimizer_1 = optim.Adam(model_1.parameters(), lr=learning_rate)
@@ -71,18 +80,46 @@ scheduler_1 = ReduceLROnPlateau(optimizer_1, mode='min', factor=0.1, patience=5,
 
 optimizer_2 = optim.Adam(model_2.parameters(), lr=learning_rate)
 scheduler_2 = ReduceLROnPlateau(optimizer_2, mode='min', factor=0.1, patience=5, verbose=True)
+scaler = runtime.grad_scaler() # solo con TRAIN_AMP=fp16
 
 # Calcola il rate schedule
 rate_schedule = np.ones(epochs) * forget_rate
 rate_schedule[:num_gradual] = np.linspace(0, forget_rate ** exponent, num_gradual)
 
-# Metriche per la valutazione
-precision_1_metric = Precision(task='binary', average='micro').to(device)
-recall_1_metric = Recall(task='binary', average='micro').to(device)
-f1_1_metric = BinaryF1Score().to(device)
-precision_2_metric = Precision(task='binary', average='micro').to(device)
-recall_2_metric = Recall(task='binary', average='micro').to(device)
-f1_2_metric = BinaryF1Score().to(device)
+# Metriche per la valutazione (precision, recall e F1 per ciascun modello)
+evaluator = Evaluator(runtime, num_models=2)
+
+# Checkpoint e metriche scritti in background (report Excel esportato a fine addestramento)
+checkpoints = CheckpointManager(os.path.join(logs_path, 'checkpoints'), resume_name='1706_resume.pth',
+                                keep_last=keep_last, keep_best=keep_best)
+metrics_log = MetricsLog('training_metrics.csv')
+
+def training_state(epoch, best_loss, best_f1):
+    # tutto cio' che serve per riprendere l'addestramento dall'epoca successiva
+    return {
+        'epoch': epoch,
+        'best_loss': best_loss,
+        'best_f1': best_f1,
+        'model_1': model_1.state_dict(),
+        'model_2': model_2.state_dict(),
+        'optimizer_1': optimizer_1.state_dict(),
+        'optimizer_2': optimizer_2.state_dict(),
+        'scheduler_1': scheduler_1.state_dict(),
+        'scheduler_2': scheduler_2.state_dict(),
+        'scaler': scaler.state_dict() if scaler is not None else None,
+    }
+
+def restore_training_state(state):
+    model_1.load_state_dict(state['model_1'])
+    model_2.load_state_dict(state['model_2'])
+    optimizer_1.load_state_dict(state['optimizer_1'])
+    optimizer_2.load_state_dict(state['optimizer_2'])
+    scheduler_1.load_state_dict(state['scheduler_1'])
+    scheduler_2.load_state_dict(state['scheduler_2'])
+    if scaler is not None and state['scaler'] is not None:
+        scaler.load_state_dict(state['scaler'])
+
+    return state['epoch'] + 1, state['best_loss'], state['best_f1']
 
 def approximate_value(value, threshold):
     if value >= threshold:
@@ -99,35 +136,13 @@ def training(train_loader, epoch, model_1, optimizer_1, model_2, optimizer_2, be
     total_batches = 0
 
     print(f'Inizio epoca {epoch} con num_remember {rate_schedule[epoch]}')
-    for batch_idx, (data, target) in enumerate(tqdm(train_loader)):
-        data, target = data.to(device), target.to(device)
+    for batch_idx, (data, target) in enumerate(tqdm(runtime.batches(train_loader, writer), total=len(train_loader))):
         target = target.float().unsqueeze(1)   
     
-        # Forward pass
-        output_1 = model_1(data)
-        output_2 = model_2(data)
-
-        # Calcola la loss di Co-Teaching
-        ind_1_update, ind_2_update = loss_coteaching(output_1, output_2, target, rate_schedule[epoch], batch_idx)
-
-        # Ottimizza model_1
-        optimizer_1.zero_grad()
-        selected_data2 = data[ind_2_update].to(device)
-        selected_target_data2 = target[ind_2_update].to(device) 
-        output_1_selected = model_1(selected_data2)
-        loss1_selected = F.binary_cross_entropy(output_1_selected, selected_target_data2)
-        loss1_selected.backward()
-        optimizer_1.step()
-
-        # Ottimizza model_2
-        optimizer_2.zero_grad()
-        selected_data1 = data[ind_1_update].to(device)
-        selected_target_data1 = target[ind_1_update].to(device) 
-        output_2_selected = model_2(selected_data1)
-        loss2_selected = F.binary_cross_entropy(output_2_selected, selected_target_data1)
-        loss2_selected.backward()
-        optimizer_2.step()
-
+        # Co-Teaching: una forward per modello, ognuno aggiornato sui campioni a piccola loss scelti dall'altro
+        loss1_selected, loss2_selected = coteaching_step(model_1, optimizer_1, model_2, optimizer_2,
+                                                         data, target, rate_schedule[epoch],
+                                                         autocast=runtime.autocast, scaler=scaler)
 
         total_loss_1 += loss1_selected.item()
         total_loss_2 += loss2_selected.item()
@@ -144,66 +159,32 @@ def training(train_loader, epoch, model_1, optimizer_1, model_2, optimizer_2, be
     scheduler_1.step(avg_loss_1)
     scheduler_2.step(avg_loss_2)
 
-    #valutazione al termine di ogni epoca su validation set
-    model_1.eval()
-    model_2.eval()
-    all_predictions_1 = []
-    all_predictions_2 = []
-    all_labels = []
-    
-    for data, label in val_loader:
-        data, label = data.to(device), label.to(device)
-        label = label.float().unsqueeze(1)
-        with torch.no_grad():
-            prediction1 = model_1(data)
-            prediction2 = model_2(data)
-        
-        all_predictions_1.append(prediction1)
-        all_predictions_2.append(prediction2)
-        all_labels.append(label)
-    
-    all_predictions_1 = torch.cat(all_predictions_1)
-    all_predictions_2 = torch.cat(all_predictions_2)
-    all_labels = torch.cat(all_labels)
-
-    precision_1_metric(all_predictions_1, all_labels)
-    recall_1_metric(all_predictions_1, all_labels)
-    f1_1_metric(all_predictions_1, all_labels)
-    precision_2_metric(all_predictions_2, all_labels)
-    recall_2_metric(all_predictions_2, all_labels)
-    f1_2_metric(all_predictions_2, all_labels)
-
-    # Calcola le metriche medie
-    avg_precision_1 = precision_1_metric.compute().item()
-    avg_recall_1 = recall_1_metric.compute().item()
-    avg_f1_1= f1_1_metric.compute().item()
-    avg_precision_2 = precision_2_metric.compute().item()
-    avg_recall_2 = recall_2_metric.compute().item()
-    avg_f1_2= f1_2_metric.compute().item()
+    #valutazione al termine di ogni epoca su validation set: un solo passaggio per i due modelli,
+    #metriche aggiornate per batch e azzerate ad ogni epoca
+    results_1, results_2 = evaluator.evaluate([model_1, model_2], val_loader)
+    avg_precision_1, avg_recall_1, avg_f1_1 = results_1['precision'], results_1['recall'], results_1['f1']
+    avg_precision_2, avg_recall_2, avg_f1_2 = results_2['precision'], results_2['recall'], results_2['f1']
     print(f'Precision_1: {avg_precision_1}, Recall_1: {avg_recall_1}')
     print(f'Precision_1: {avg_precision_2}, Recall_2: {avg_recall_2}')
     print(f'F1_1: {avg_f1_1}, F1_2: {avg_f1_2}')
 
-    # Aggiorna e sakva il miglior modello
+    # Aggiorna e salva il miglior modello
     training_losses = [avg_loss_1, avg_loss_2]
     training_f1s = [avg_f1_1, avg_f1_2]
-    for i in range(2):
+    for i, model in enumerate([model_1, model_2]):
         training_loss = training_losses[i]
         training_f1 = training_f1s[i]
-        torch.save(model_1.state_dict(), os.path.join(logs_path, 'checkpoints', f'1706_model1_{epoch}.pth'))
-        torch.save(model_2.state_dict(), os.path.join(logs_path, 'checkpoints', f'1706_model2_{epoch}.pth'))
         if  training_f1 > best_f1:
-            if i == 0:
-                model = model_1
-            else:
-                model = model_2
             best_loss = training_loss
             best_f1 = training_f1
             print(f'new_best_model_{best_loss}_{datetime.today().strftime("%Y-%m-%d")}.pth')
-            torch.save(model.state_dict(), os.path.join(logs_path, 'checkpoints', f'1706_best_model_{epoch}.pth'))
+            checkpoints.save_best(epoch, model, best_f1, '1706_best_model')
             print("best loss aggiornata")
         print("train_loss", training_loss, batch_idx) 
         print("best_loss: ", best_loss)
+    # pesi dei due modelli per questa epoca e stato per la ripresa (scritti in background)
+    checkpoints.save_epoch(epoch, {'1706_model1': model_1, '1706_model2': model_2},
+                           training_state(epoch, best_loss, best_f1))
     print(f'Ending epoch {epoch} with num_remember {rate_schedule[epoch]}')
 
     # Aggiorna i risultati su TensorBoard
@@ -216,29 +197,18 @@ def training(train_loader, epoch, model_1, optimizer_1, model_2, optimizer_2, be
     writer.add_scalar("train_loss1", loss1_selected, epoch)
     writer.add_scalar("train_loss2", loss2_selected, epoch)
     
-    #creazione file excel con report training
-    data = {
-        'epoch': [epoch],
-        'precision_1': [avg_precision_1],
-        'recall_1': [avg_recall_1],
-        'f1_1': [avg_f1_1],
-        'precision_2': [avg_precision_2],
-        'recall_2': [avg_recall_2],
-        'f1_2': [avg_f1_2],
-        'train_loss1': [loss1_selected.item()],
-        'train_loss2': [loss2_selected.item()]
-    }
-
-    # Crea un DataFrame
-    df = pd.DataFrame(data)
-
-    # Scrive il DataFrame su un file Excel
-    if not os.path.isfile('training_metrics.xlsx'):
-        df.to_excel('training_metrics.xlsx', index=False)
-    else:
-        df_existing = pd.read_excel('training_metrics.xlsx')
-        df_combined = pd.concat([df_existing, df], ignore_index=True)
-        df_combined.to_excel('training_metrics.xlsx', index=False)
+    #report training: una riga per epoca in append, l'Excel viene esportato a fine addestramento
+    metrics_log.append({
+        'epoch': epoch,
+        'precision_1': avg_precision_1,
+        'recall_1': avg_recall_1,
+        'f1_1': avg_f1_1,
+        'precision_2': avg_precision_2,
+        'recall_2': avg_recall_2,
+        'f1_2': avg_f1_2,
+        'train_loss1': loss1_selected.item(),
+        'train_loss2': loss2_selected.item()
+    })
 
     writer.flush()
     
@@ -247,10 +217,21 @@ def training(train_loader, epoch, model_1, optimizer_1, model_2, optimizer_2, be
 def main():
     best_loss = 1e6
     best_f1 = 0.001
-    for epoch in range(epochs):
+    start_epoch = 0
+    state = checkpoints.load_resume(map_location=device) if resume else None
+    if state is not None:
+        start_epoch, best_loss, best_f1 = restore_training_state(state)
+        print(f'Ripresa dall\'epoca {start_epoch} (best_loss: {best_loss} best_f1: {best_f1})')
+    # le righe delle epoche che verranno ripetute (tutte, se si riparte da zero) non finiscono nel report
+    metrics_log.truncate(start_epoch)
+
+    for epoch in range(start_epoch, epochs):
         best_loss, best_f1 = training(train_loader, epoch, model_1, optimizer_1, model_2, optimizer_2, best_loss, best_f1, writer)
         print(f'Epoch [{epoch+1}/{epochs}] best_loss: {best_loss} best_fi: {best_f1}')
 
+    checkpoints.close()
+    metrics_log.close()
+    export_excel('training_metrics.csv', 'training_metrics.xlsx')
     writer.close()
 
 if __name__ == "__main__":
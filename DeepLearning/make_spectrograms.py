@@ -1,11 +1,17 @@
+import argparse
+import json
 import os, sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import torch
 import librosa
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE
+from threadpoolctl import threadpool_limits
 from tqdm import tqdm
+from labelling import classify_windows, NON_APNEA, APNEA
+from audio_stream import WINDOW_BATCH, recording_files, stream_windows
+from spectrogram_engine import melspectrogram_batch
 torch.manual_seed(184)
 torch.cuda.manual_seed(184)
 
@@ -23,66 +29,147 @@ patients = [ 1014, 1106, 1037,1008,1120, 1045, 1016, 1059, 1041,
 
 E_type = ['ObstructiveApnea', 'CentralApnea', 'MixedApnea', 'Hypopnea'] # desired apnea type(s)
 context_s = 6 # secondi di contesto
+DONE_MARKER = '.done' # written in the patient folder once all its spectrograms are saved
 
 
-for P_n in patients:
-    print(f'Patient number {P_n}')
-    # create destination folders or rise error if already exist
+def load_events(meta_file, patients, types=E_type):
+    """
+    Parse meta.csv once and return {patient: (starts, durations)} of the desired apnea events.
+    """
+    meta_df = pd.read_csv(meta_file, usecols=['Patient_ID', 'Type', 'Start', 'Duration'], low_memory=False)
+    apnea_df = meta_df.loc[meta_df['Type'].isin(types) & meta_df['Patient_ID'].isin(patients)]
+    events = {P_n: (np.empty(0), np.empty(0)) for P_n in patients}
+    for P_n, df in apnea_df.groupby('Patient_ID'):
+        events[P_n] = (df['Start'].to_numpy(), df['Duration'].to_numpy())
+
+    return events
+
+
+def is_done(P_n, dest_path=dest_path):
+    return os.path.exists(os.path.join(dest_path, 'P'+str(P_n), DONE_MARKER))
+
+
+def make_patient_spectrograms(P_n, starts, durations, wav_path=wav_path, dest_path=dest_path, progress=False):
+    """
+    Save the MEL spectrograms of one patient into P<n>/apnea and P<n>/nonapnea and write the
+    completion marker. A folder left incomplete by an interrupted run is overwritten.
+    """
+    start_time = time.perf_counter()
+    # create destination folders (already existing only if a previous run was interrupted)
     patient_dest_path = os.path.join(dest_path, 'P'+str(P_n))
     apnea_dest_path = os.path.join(dest_path, 'P'+str(P_n), 'apnea')
     nonapnea_dest_path = os.path.join(dest_path, 'P'+str(P_n), 'nonapnea')
-    if not os.path.exists(patient_dest_path):
-        os.makedirs(patient_dest_path)
-        os.makedirs(apnea_dest_path)
-        os.makedirs(nonapnea_dest_path)
-    else:
-        raise Exception(f'Destination folder for patient {str(P_n)} already exists!')
+    os.makedirs(apnea_dest_path, exist_ok=True)
+    os.makedirs(nonapnea_dest_path, exist_ok=True)
 
-    meta_df = pd.read_csv(meta_file, low_memory=False)
-    apnea_df = meta_df.loc[(meta_df['Type'] == E_type[0])|(meta_df['Type'] == E_type[1])|(meta_df['Type'] == E_type[2])|(meta_df['Type'] == E_type[3])]
-    apnea_df = apnea_df.loc[apnea_df["Patient_ID"] == P_n]
-
-
-    wav_files = os.listdir(os.path.join(wav_path, ("0000" + str(P_n))))
+    wav_files = recording_files(os.path.join(wav_path, ("0000" + str(P_n))))
     s_len = 0.0
     for wf in wav_files:
         # get wav file duration without opening
-        d = librosa.get_duration(path = os.path.join(wav_path, ("0000" + str(P_n)), wf))
+        d = librosa.get_duration(path = wf)
         s_len += d
 
-    #BUILD LABEL MASK
-    apneas_mask = torch.zeros(int(s_len*SR))
-    for idx, row in apnea_df.iterrows():
-        start = int(row['Start']*SR)
-        dur = int(row['Duration']*SR)
-        apneas_mask[start:start + dur] = 1.0
-
-    #concatenate 1-hour audio files into a single array
-    y_block = np.zeros((len(wav_files), 3600*SR))
-    for w in range(len(wav_files)):
-        fname = "0000" + str(P_n) + "-100507[00" + str(w+1) + "].wav"
-        y, _ = librosa.load(os.path.join(wav_path, ("0000" + str(P_n)), fname), sr=SR)
-        y_block[w,0:y.shape[0]] += y
-    y_all = y_block.reshape(-1)
-
-
-    #save MEL spectrograms into two separate folders: apnea and nonapnea
-    for n, c in enumerate(tqdm(range(0,apneas_mask.shape[0],(context_s*SR)))):
-        if sum(apneas_mask[c:c+(context_s*SR)]) == 0: # IF NON APNEA
-            try:
-                y_chunk = y_all[c:c+(context_s*SR)]
-                S2 = librosa.feature.melspectrogram(y=y_chunk, sr=SR, hop_length=185, n_mels=64)
-                S2_dB = librosa.power_to_db(S2, ref=np.max) # shape [64,519]
-                S2_dB = torch.from_numpy(S2_dB).float()
-                torch.save(S2_dB, os.path.join(nonapnea_dest_path, str(n) + '.pth'))
-            except:
-                print(f'error')
-        elif sum(apneas_mask[c:c+(context_s*SR)]) == (context_s*SR): # IF FULL 6s APNEA
-            try:
-                y_chunk = y_all[c:c+(context_s*SR)]
-                S2 = librosa.feature.melspectrogram(y=y_chunk, sr=SR, hop_length=185, n_mels=64)
-                S2_dB = librosa.power_to_db(S2, ref=np.max) # shape [64,519]
-                S2_dB = torch.from_numpy(S2_dB).float()
-                torch.save(S2_dB, os.path.join(apnea_dest_path, str(n) + '.pth'))
-            except:
-                print(f'error')
+    #CLASSIFY WINDOWS (non apnea / full apnea / mixed) directly from the event intervals
+    window_starts, window_labels = classify_windows(starts, durations, SR, int(s_len*SR), context_s*SR)
+
+    #stream the 1-hour audio files as 6s float32 windows (bounded memory, each file padded to one hour
+    #as in the old y_block), compute MEL spectrograms in batch for the non apnea / full apnea windows
+    #and save them into two separate folders: apnea and nonapnea
+    #(the last window of the night is zero padded, as y_all was, so it is kept when it is non apnea)
+    saved = 0
+    for indices, windows in tqdm(stream_windows(wav_files, context_s*SR, sr=SR, max_samples=int(s_len*SR)),
+                                 total=-(-len(window_labels) // WINDOW_BATCH), disable=not progress):
+        keep = np.isin(window_labels[indices], (NON_APNEA, APNEA))
+        if not keep.any():
+            continue
+        specs = torch.from_numpy(melspectrogram_batch(windows[keep], SR)) # shape [k,64,519]
+        for n, S2_dB in zip(indices[keep], specs):
+            dest = apnea_dest_path if window_labels[n] == APNEA else nonapnea_dest_path
+            # write + rename: rewriting an existing window also changes the folder mtime (see manifest.py)
+            path = os.path.join(dest, str(n) + '.pth')
+            torch.save(S2_dB.clone(), path + '.tmp')
+            os.replace(path + '.tmp', path)
+        saved += int(keep.sum())
+
+    stats = {
+        'patient': P_n,
+        'pid': os.getpid(),
+        'windows': len(window_labels),
+        'saved': saved,
+        'audio_s': s_len,
+        'elapsed_s': time.perf_counter() - start_time,
+    }
+    # the marker is written last and atomically: its presence means the patient is complete
+    marker = os.path.join(patient_dest_path, DONE_MARKER)
+    with open(marker + '.tmp', 'w') as f:
+        json.dump(stats, f)
+    os.replace(marker + '.tmp', marker)
+
+    return stats
+
+
+def _init_worker():
+    # one process per patient: keep BLAS/OpenMP single threaded to avoid oversubscription
+    threadpool_limits(1)
+    torch.set_num_threads(1)
+
+
+def _throughput(windows, audio_s, elapsed_s):
+    elapsed_s = max(elapsed_s, 1e-9)
+    return f'{windows / elapsed_s:8.1f} windows/s  {audio_s / 3600 / elapsed_s:6.3f} audio h/s'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, nargs='+', default=patients)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--wav-path', default=wav_path)
+    parser.add_argument('--dest-path', default=dest_path)
+    parser.add_argument('--meta-file', default=meta_file)
+    args = parser.parse_args()
+
+    todo = [P_n for P_n in args.patients if not is_done(P_n, args.dest_path)]
+    for P_n in args.patients:
+        if P_n not in todo:
+            print(f'Patient number {P_n} already done, skipping')
+    if not todo:
+        return
+    events = load_events(args.meta_file, todo)
+
+    results = []
+    start_time = time.perf_counter()
+    if args.workers <= 1:
+        for P_n in todo:
+            print(f'Patient number {P_n}')
+            results.append(make_patient_spectrograms(P_n, *events[P_n], args.wav_path, args.dest_path, progress=True))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(make_patient_spectrograms, P_n, *events[P_n], args.wav_path, args.dest_path): P_n
+                       for P_n in todo}
+            for future in as_completed(futures):
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    # the patient stays without marker and is retried by the next run
+                    print(f'Patient number {futures[future]} failed: {e}')
+                    continue
+                results.append(stats)
+                print(f'Patient number {stats["patient"]} done (worker {stats["pid"]}): '
+                      + _throughput(stats['windows'], stats['audio_s'], stats['elapsed_s']))
+    elapsed = time.perf_counter() - start_time
+
+    workers = {}
+    for stats in results:
+        workers.setdefault(stats['pid'], []).append(stats)
+    for pid, done in sorted(workers.items()):
+        print(f'worker {pid}: {len(done)} patients  ' + _throughput(sum(s['windows'] for s in done),
+                                                                   sum(s['audio_s'] for s in done),
+                                                                   sum(s['elapsed_s'] for s in done)))
+    print(f'total: {len(results)}/{len(todo)} patients in {elapsed:.1f} s  '
+          + _throughput(sum(s['windows'] for s in results), sum(s['audio_s'] for s in results), elapsed))
+    if len(results) < len(todo):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import json
+import os
+
+# Manifest persistente dei file di un paziente (P<n>/manifest.json): per ogni classe i nomi degli
+# spettrogrammi, nell'ordine di os.listdir, e l'mtime della cartella. Viene costruito una volta e
+# rivalidato in modo incrementale: una cartella di classe viene riletta solo se il suo mtime e' cambiato
+# (aggiunta, rimozione o rinomina di file), altrimenti basta una stat per classe.
+# make_spectrograms.py scrive ogni file con un rename, quindi anche la riscrittura di uno spettrogramma
+# esistente cambia l'mtime della cartella; un file modificato sul posto da altri strumenti non viene
+# rilevato (in quel caso va cancellato manifest.json).
+
+CLASSES = ["nonapnea", "apnea"]
+MANIFEST_FILE = 'manifest.json'
+
+
+def scan_class(class_dir):
+    """
+    Nomi degli spettrogrammi .pth della cartella, nell'ordine di os.listdir, e mtime della cartella
+    (i .tmp lasciati da un make_spectrograms.py interrotto sono esclusi).
+    """
+    dir_mtime_ns = os.stat(class_dir).st_mtime_ns
+
+    return {'dir_mtime_ns': dir_mtime_ns, 'files': [name for name in os.listdir(class_dir) if name.endswith('.pth')]}
+
+
+def patient_manifest(patient_folder, classes=CLASSES):
+    """
+    Manifest del paziente {classe: {'dir_mtime_ns', 'files'}}, aggiornato
+    su disco solo se qualche cartella di classe e' cambiata.
+    """
+    path = os.path.join(patient_folder, MANIFEST_FILE)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    changed = False
+    for class_name in classes:
+        class_dir = os.path.join(patient_folder, class_name)
+        cached = manifest.get(class_name)
+        if cached is None or cached['dir_mtime_ns'] != os.stat(class_dir).st_mtime_ns:
+            manifest[class_name] = scan_class(class_dir)
+            changed = True
+
+    if changed:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    return manifest
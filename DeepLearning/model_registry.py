@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import OrderedDict
+import torch
+from networks import CRNN_2
+from model_variants import build_variant, parse_variants
+from backends import BACKENDS, OnnxRuntimeBackend, TorchBackend, export_onnx, onnx_path
+from ensemble import CRNN_2Ensemble
+from cascade import parse_cascades
+
+CHECKPOINTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "checkpoints")
+
+# modelId accettati dal servizio -> file del checkpoint in model/checkpoints
+MODELS = {
+    "10_patients_model": "10_patients_model.pth",
+    "20_patients_model": "20_patients_model.pth",
+}
+
+# architettura dei checkpoint che non sono CRNN_2 (es. un primo stadio leggero per le cascate)
+ARCHITECTURES = {}
+
+# modelId di ensemble -> modelId dei membri, valutati insieme con una sola forward (vedi ensemble.py)
+ENSEMBLES = {
+    "ensemble_model": ["10_patients_model", "20_patients_model"],
+}
+
+# modelId di cascata -> [primo stadio, secondo stadio] (vedi cascade.py); gli stadi sono modelId
+# normali, quindi hanno la propria cache, le proprie varianti e passano dal micro-batching.
+# Vuoto di default: nessun checkpoint attuale e' un primo stadio piu' economico di CRNN_2 (benchmark_cascade.py);
+# si abilita con MODEL_CASCADES, es. MODEL_CASCADES="cascade_model=<primo stadio>+20_patients_model"
+CASCADES = parse_cascades(os.environ.get("MODEL_CASCADES"))
+
+
+class UnknownModelError(Exception):
+    def __init__(self, model_id, allowed):
+        super(UnknownModelError, self).__init__(f"Unknown modelId '{model_id}' {sorted(allowed)}")
+        self.model_id = model_id
+
+
+class LoadedModel:
+    """
+    Rete gia' caricata e in modalita' eval, insieme alla versione del checkpoint
+    da cui proviene (mtime e dimensione del file) e al backend che la esegue.
+    Con il backend onnxruntime net e' None. Per un ensemble members e' la lista dei modelId
+    dei membri (path la lista dei loro checkpoint) e il backend restituisce [N, M].
+    """
+    def __init__(self, model_id, path, net, version, variant="fp32", backend=None, members=None):
+        self.model_id = model_id
+        self.path = path
+        self.net = net
+        self.version = version
+        self.variant = variant
+        self.backend = backend if backend is not None else TorchBackend(net)
+        self.members = members
+
+
+class ModelRegistry:
+    """
+    Carica ogni checkpoint una sola volta per processo e restituisce la stessa
+    istanza a tutte le richieste. Se il file cambia su disco il modello viene
+    ricaricato; oltre max_models vengono scartati quelli usati meno di recente.
+    Per ogni modelId si puo' scegliere una variante ottimizzata (vedi model_variants),
+    ad esempio MODEL_VARIANTS="20_patients_model=int8". Con INFERENCE_BACKEND=onnxruntime
+    i checkpoint vengono esportati in ONNX (model/onnx) ed eseguiti con ONNX Runtime.
+    Gli ensemble vengono ricaricati quando cambia uno dei checkpoint dei membri e usano
+    sempre il backend torch (le varianti si applicano anche a loro).
+    """
+    def __init__(self, checkpoints_dir=CHECKPOINTS_DIR, models=MODELS, max_models=None, device=None, variants=None, backend=None,
+                 ensembles=ENSEMBLES, cascades=CASCADES, architectures=ARCHITECTURES):
+        self.checkpoints_dir = checkpoints_dir
+        self.models = dict(models)
+        self.ensembles = {model_id: list(members) for model_id, members in ensembles.items()}
+        self.cascades = {model_id: list(stages) for model_id, stages in cascades.items()}
+        self.architectures = dict(architectures)
+        if max_models is None:
+            max_models = int(os.environ.get("MODEL_REGISTRY_MAX_MODELS", len(self.loadable_ids())))
+        self.max_models = max(1, max_models)
+        self.device = device or torch.device('cpu')
+        if variants is None:
+            variants = parse_variants(os.environ.get("MODEL_VARIANTS"))
+        self.variants = dict(variants)
+        self.backend = backend or os.environ.get("INFERENCE_BACKEND", "torch")
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{self.backend}' {BACKENDS}")
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        # listener(model_id) viene chiamato quando un checkpoint cambia o viene ricaricato/rimosso esplicitamente
+        self._listeners.append(listener)
+
+    def _notify(self, model_id):
+        for listener in self._listeners:
+            listener(model_id)
+
+    def loadable_ids(self):
+        # modelId con una rete propria (le cascate usano quelle dei loro stadi)
+        return list(self.models) + list(self.ensembles)
+
+    def model_ids(self):
+        return self.loadable_ids() + list(self.cascades)
+
+    def _check(self, model_id):
+        if model_id not in self.models and model_id not in self.ensembles:
+            raise UnknownModelError(model_id, self.model_ids())
+
+    def path_for(self, model_id):
+        if model_id not in self.models:
+            raise UnknownModelError(model_id, self.model_ids())
+        return os.path.join(self.checkpoints_dir, self.models[model_id])
+
+    def paths_for(self, model_id):
+        # checkpoint da cui dipende il modelId: uno solo, oppure quelli dei membri dell'ensemble
+        self._check(model_id)
+        if model_id in self.ensembles:
+            return [self.path_for(member) for member in self.ensembles[model_id]]
+        return [self.path_for(model_id)]
+
+    def variant_for(self, model_id):
+        return self.variants.get(model_id, "fp32")
+
+    def _file_version(self, model_id, paths):
+        # variante e backend fanno parte della versione: le loro predizioni non si mescolano
+        stats = [os.stat(path) for path in paths]
+        version = "+".join(f"{st.st_mtime_ns}-{st.st_size}" for st in stats)
+        if self.backend != "torch" and model_id not in self.ensembles:
+            return f"{version}-{self.backend}"
+        variant = self.variant_for(model_id)
+        return version if variant == "fp32" else f"{version}-{variant}"
+
+    def _load_net(self, path, model_id=None):
+        net = self.architectures.get(model_id, CRNN_2)()
+        net.load_state_dict(torch.load(path, map_location=self.device))
+        net = net.to(self.device)
+        net.eval()
+        return net
+
+    def _load_ensemble(self, model_id, paths, version):
+        # i membri sono letti direttamente dai checkpoint, indipendentemente dalla cache dei singoli modelli
+        net = CRNN_2Ensemble([self._load_net(path) for path in paths]).to(self.device).eval()
+        variant = self.variant_for(model_id)
+        net = build_variant(net, variant)
+        return LoadedModel(model_id, paths, net, version, variant, members=list(self.ensembles[model_id]))
+
+    def _load(self, model_id, path, version):
+        net = self._load_net(path, model_id)
+        if self.backend == "onnxruntime":
+            return LoadedModel(model_id, path, None, version, "onnx", self._onnx_backend(model_id, path, net))
+        variant = self.variant_for(model_id)
+        net = build_variant(net, variant)
+        return LoadedModel(model_id, path, net, version, variant)
+
+    def _onnx_backend(self, model_id, path, net):
+        # il file ONNX e' derivato dal checkpoint: viene (ri)esportato se manca o e' piu' vecchio
+        onnx_file = onnx_path(model_id)
+        if not os.path.exists(onnx_file) or os.stat(onnx_file).st_mtime_ns < os.stat(path).st_mtime_ns:
+            tmp_file = f"{onnx_file}.{os.getpid()}.tmp"
+            export_onnx(net, tmp_file)
+            os.replace(tmp_file, onnx_file)
+        return OnnxRuntimeBackend(onnx_file)
+
+    def get(self, model_id):
+        paths = self.paths_for(model_id)
+        version = self._file_version(model_id, paths)
+        with self._lock:
+            loaded = self._cache.get(model_id)
+            if loaded is None or loaded.version != version:
+                # primo utilizzo oppure checkpoint modificato: (ri)carica
+                if loaded is not None:
+                    self._notify(model_id)
+                if model_id in self.ensembles:
+                    loaded = self._load_ensemble(model_id, paths, version)
+                else:
+                    loaded = self._load(model_id, paths[0], version)
+                self._cache[model_id] = loaded
+            self._cache.move_to_end(model_id)
+            while len(self._cache) > self.max_models:
+                self._cache.popitem(last=False)
+            return loaded
+
+    def reload(self, model_id):
+        self.evict(model_id)
+        return self.get(model_id)
+
+    def evict(self, model_id):
+        self._check(model_id)
+        with self._lock:
+            if self._cache.pop(model_id, None) is None:
+                return False
+            self._notify(model_id)
+            return True
+
+    def preload(self):
+        # carica in anticipo tutti i modelli noti (fino a max_models), es. nel master
+        # di gunicorn prima del fork, cosi' i pesi sono condivisi copy-on-write tra i worker
+        for model_id in self.loadable_ids()[:self.max_models]:
+            self.get(model_id)
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._cache.keys())
+
+
+registry = ModelRegistry()
@@ -0,0 +1,82 @@
+import copy
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from networks import conv_block
+from ensemble import pooled_conv_block
+
+# Varianti CPU ottimizzate di CRNN_2, costruite a partire dalla rete fp32 gia' caricata:
+#   fp32        rete originale
+#   fused       BatchNorm fusa nei pesi delle convoluzioni
+#   int8        fused + quantizzazione dinamica int8 di GRU e Linear
+#   script      fused, compilata con TorchScript (trace + freeze)
+#   int8_script int8, compilata con TorchScript
+#   compiled    fused, torch.compile (richiede un compilatore C per il backend inductor)
+
+VARIANTS = ["fp32", "fused", "int8", "script", "int8_script", "compiled"]
+
+
+def fuse_conv_bn(net):
+    net = copy.deepcopy(net).eval()
+    for module in net.modules():
+        if isinstance(module, conv_block) and isinstance(module.bn, nn.BatchNorm2d):
+            module.conv = fuse_conv_bn_eval(module.conv, module.bn)
+            module.bn = nn.Identity()
+        elif isinstance(module, pooled_conv_block) and isinstance(module.bn, nn.BatchNorm2d):
+            # blocchi dell'ensemble, con il MaxPool prima della BatchNorm: la fusione nella convoluzione
+            # (BatchNorm prima del MaxPool) e' esatta solo se la scala di ogni canale e' non negativa,
+            # come garantisce ensemble._fuse_blocks
+            if (module.bn.weight < 0).any():
+                raise ValueError("Cannot fuse a pooled_conv_block with negative BatchNorm scales")
+            module.conv = fuse_conv_bn_eval(module.conv, module.bn)
+            module.bn = nn.Identity()
+
+    return net
+
+
+def quantize_int8(net):
+    return torch.ao.quantization.quantize_dynamic(net, {nn.GRU, nn.Linear}, dtype=torch.qint8)
+
+
+def to_torchscript(net, example=None):
+    if example is None:
+        example = torch.zeros(2, 1, 64, 519)
+    with torch.inference_mode():
+        traced = torch.jit.trace(net, example)
+
+    return torch.jit.freeze(traced.eval())
+
+
+def build_variant(net, variant):
+    """
+    Restituisce la variante richiesta della rete fp32 net (in modalita' eval).
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}' {VARIANTS}")
+    if variant == "fp32":
+        return net
+
+    fused = fuse_conv_bn(net)
+    if variant == "fused":
+        return fused
+    if variant == "int8":
+        return quantize_int8(fused)
+    if variant == "script":
+        return to_torchscript(fused)
+    if variant == "int8_script":
+        return to_torchscript(quantize_int8(fused))
+
+    return torch.compile(fused, dynamic=True)
+
+
+def parse_variants(spec):
+    """
+    "20_patients_model=int8,10_patients_model=fused" -> {"20_patients_model": "int8", ...}
+    """
+    variants = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            model_id, variant = item.split("=", 1)
+            variants[model_id.strip()] = variant.strip()
+
+    return variants
@@ -54,3 +54,35 @@ class CRNN_2(nn.Module):
         x = self.dense(x)         #[B,1]
         x = self.sigmoid(x)       #[B,1]
         return x 
+
+
+class CRNN_3conv(nn.Module):
+    """
+    CRNN_2 con tre blocchi convolutivi, con la struttura dei pesi di model/checkpoints/3_conv_layer_model.pth.
+    Il checkpoint non fissa i pooling (load_state_dict con strict=True riesce per qualsiasi pool_sizes che riduca
+    le 64 bande a 1), quindi pool_sizes e' un'ipotesi e il modello non e' registrato nel servizio. Inoltre costa
+    quanto CRNN_2 (conv4 e' il blocco piu' leggero), quindi non serve come primo stadio di una cascata.
+    input: [Batch, Channels, Frequency, Time]
+    output: [Batch, 1]
+    """
+    def __init__(self, in_chan=1, pool_sizes=((4, 2), (4, 2), (4, 2))):
+        super(CRNN_3conv, self).__init__()
+        # pooling ipotizzati: in frequenza riducono le 64 bande MEL a 1 come in CRNN_2 (senza conv4)
+        self.conv1 = conv_block(in_chan, 96, ker_size=(5, 5), stride=1, pool_size=pool_sizes[0])
+        self.conv2 = conv_block(96, 128, ker_size=(5, 5), stride=1, pool_size=pool_sizes[1])
+        self.conv3 = conv_block(128, 128, ker_size=(5, 5), stride=1, pool_size=pool_sizes[2])
+        self.rnn1 = nn.GRU(input_size=128, hidden_size=64, num_layers=2, batch_first=True, bidirectional=True)
+        self.dense = nn.Linear(128, 1)
+        self.sigmoid = nn.Sigmoid()
+
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.conv2(x)
+        x = self.conv3(x)
+        x = x.squeeze(2)
+        x = x.permute(0, 2, 1)
+        x, _ = self.rnn1(x)
+        x = x[:, -1, :]          #[B, 128]
+        x = self.dense(x)         #[B,1]
+        x = self.sigmoid(x)       #[B,1]
+        return x
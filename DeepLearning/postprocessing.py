@@ -0,0 +1,123 @@
+import numpy as np
+
+# Post-processing temporale delle sequenze di predizioni binarie (una per finestra, in ordine di tempo).
+# Le regole lavorano sulle run (sequenze di valori uguali) calcolate con NumPy in un solo passaggio:
+# - rimozione dei picchi isolati: una run di 1 lunga al massimo spike_max_len, preceduta e seguita da
+#   almeno spike_min_gap zeri, diventa 0 (con 1 e 2 e' la regola storica di test.py; l'inizio e la fine
+#   della sequenza non contano come zeri);
+# - unione degli eventi: le run di 0 interne lunghe al massimo merge_gap diventano 1;
+# - durata minima: le run di 1 piu' corte di min_event_len diventano 0.
+# StreamingPostProcessing applica le stesse regole a blocchi di predizioni, con lo stesso risultato
+# della sequenza intera.
+
+
+def run_lengths(labels):
+    """
+    Run di una sequenza binaria: (valori, inizi, lunghezze).
+    """
+    labels = np.asarray(labels).astype(bool)
+    if labels.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return np.empty(0, dtype=bool), empty, empty
+    starts = np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1))
+    lengths = np.diff(np.append(starts, labels.size))
+
+    return labels[starts], starts, lengths
+
+
+def _from_runs(values, lengths):
+    return np.repeat(values, lengths)
+
+
+def remove_spikes(labels, max_len=1, min_gap=2):
+    values, _, lengths = run_lengths(labels)
+    # le run si alternano: i vicini di una run di 1 sono run di 0, se esistono
+    has_before = np.arange(values.size) > 0
+    has_after = np.arange(values.size) < values.size - 1
+    before = np.where(has_before, np.roll(lengths, 1), 0)
+    after = np.where(has_after, np.roll(lengths, -1), 0)
+    spikes = values & (lengths <= max_len) & has_before & has_after & (before >= min_gap) & (after >= min_gap)
+
+    return _from_runs(values & ~spikes, lengths)
+
+
+def merge_gaps(labels, max_gap):
+    values, _, lengths = run_lengths(labels)
+    interior = (np.arange(values.size) > 0) & (np.arange(values.size) < values.size - 1)
+    gaps = ~values & interior & (lengths <= max_gap)
+
+    return _from_runs(values | gaps, lengths)
+
+
+def drop_short_events(labels, min_len):
+    values, _, lengths = run_lengths(labels)
+
+    return _from_runs(values & (lengths >= min_len), lengths)
+
+
+class PostProcessing:
+    def __init__(self, spike_max_len=1, spike_min_gap=2, merge_gap=0, min_event_len=1, threshold=0.5):
+        self.spike_max_len = spike_max_len
+        self.spike_min_gap = spike_min_gap
+        self.merge_gap = merge_gap
+        self.min_event_len = min_event_len
+        self.threshold = threshold
+
+    def binarize(self, predictions):
+        """
+        Etichette 0/1: le probabilita' (float) vengono confrontate con threshold, le etichette restano tali.
+        """
+        predictions = np.asarray(predictions)
+        if predictions.dtype.kind == 'f':
+            return predictions >= self.threshold
+
+        return predictions.astype(bool)
+
+    def apply(self, predictions):
+        """
+        Applica le regole in ordine (picchi, unione, durata minima) e restituisce etichette int8.
+        """
+        labels = self.binarize(predictions)
+        if self.spike_max_len > 0:
+            labels = remove_spikes(labels, self.spike_max_len, self.spike_min_gap)
+        if self.merge_gap > 0:
+            labels = merge_gaps(labels, self.merge_gap)
+        if self.min_event_len > 1:
+            labels = drop_short_events(labels, self.min_event_len)
+
+        return labels.astype(np.int8)
+
+    def stream(self):
+        return StreamingPostProcessing(self)
+
+
+class StreamingPostProcessing:
+    """
+    Post-processing incrementale: push(blocco) restituisce le etichette diventate definitive,
+    flush() quelle rimanenti alla fine della sequenza.
+    Una sequenza viene chiusa solo all'interno di una run di zeri abbastanza lunga da dare la stessa
+    decisione a tutte le regole su entrambi i lati del taglio; finche' non ne arriva una le predizioni
+    restano in attesa.
+    """
+    def __init__(self, postprocessing):
+        self.postprocessing = postprocessing
+        # zeri richiesti a sinistra e a destra del taglio
+        self.margin = max(postprocessing.spike_min_gap, 1)
+        self.min_zeros = max(2 * self.margin, postprocessing.merge_gap + 1)
+        self.pending = np.empty(0, dtype=bool)
+
+    def push(self, predictions):
+        self.pending = np.concatenate((self.pending, self.postprocessing.binarize(predictions).reshape(-1)))
+        values, starts, lengths = run_lengths(self.pending)
+        cuts = np.flatnonzero(~values & (lengths >= self.min_zeros))
+        if cuts.size == 0:
+            return np.empty(0, dtype=np.int8)
+        cut = starts[cuts[-1]] + self.margin
+        done, self.pending = self.pending[:cut], self.pending[cut:]
+
+        return self.postprocessing.apply(done)
+
+    def flush(self):
+        done, self.pending = self.pending, np.empty(0, dtype=bool)
+
+        return self.postprocessing.apply(done)
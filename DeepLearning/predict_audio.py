@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+import sys
+import time
+from audio_inference import DEFAULT_THRESHOLD, audio_timeline, order_sources
+from audio_stream import recording_files
+from basic_test import Inference
+from spectrogram_engine import CONTEXT_S
+
+# Timeline di apnea di una registrazione notturna direttamente dai file wav orari (senza PNG intermedi):
+#   python predict_audio.py registrazione/ --model 10_patients_model --hop 3 --out timeline.json
+# Accetta una cartella (file ordinati per indice [NNN]) o un elenco di file wav.
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='+', help='cartella della registrazione o file wav')
+    parser.add_argument('--model', default='10_patients_model')
+    parser.add_argument('--hop', type=float, default=CONTEXT_S, help='passo tra finestre in secondi')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--out', help='file JSON di output (default stdout)')
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.inputs:
+        paths.extend(recording_files(path) if os.path.isdir(path) else [path])
+    paths, _ = order_sources(paths)
+    if not paths:
+        sys.exit('no wav files found')
+
+    inferenceObj = Inference(args.model)
+    start_time = time.perf_counter()
+    # ensemble e cascate restituiscono piu' colonne: la probabilita' per finestra passa da Inference.probabilities
+    predict = lambda batch: inferenceObj.probabilities(inferenceObj.inference_batch(batch, args.batch_size))
+    timeline = audio_timeline(paths, predict, args.hop, args.batch_size, args.threshold)
+    elapsed = time.perf_counter() - start_time
+    result = {'modelId': args.model, 'version': inferenceObj.version, 'files': paths, **timeline}
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f)
+    else:
+        json.dump(result, sys.stdout)
+        print()
+    print(f'{len(paths)} files, {timeline["windows"]} windows, {len(timeline["events"])} events '
+          f'in {elapsed:.1f} s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
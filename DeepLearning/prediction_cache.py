@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # il livello Redis e' opzionale
+    redis = None
+
+
+def redis_from_env():
+    """
+    Client Redis per il secondo livello della cache, se redis-py e' installato e REDIS_HOST
+    e' impostato (lo stesso Redis di docker-compose usato da BullMQ). PREDICTION_CACHE_REDIS=0
+    lo disattiva.
+    """
+    if redis is None or os.environ.get("PREDICTION_CACHE_REDIS", "1") == "0":
+        return None
+    host = os.environ.get("REDIS_HOST", "").strip()
+    if not host:
+        return None
+    port = int(os.environ.get("REDIS_PORT", "6379").strip())
+
+    return redis.Redis(host=host, port=port, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+class PredictionCache:
+    """
+    Cache delle predizioni indicizzata da (hash SHA-256 dei byte PNG, modelId, versione del checkpoint).
+    Primo livello LRU in memoria, secondo livello Redis opzionale. Un checkpoint ricaricato ha una
+    nuova versione, quindi le vecchie chiavi non vengono piu' usate; invalidate_model libera subito
+    quelle in memoria, su Redis scadono con il TTL.
+    """
+    PREFIX = "prediction:"
+
+    def __init__(self, max_entries=100000, redis_client=None, ttl=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.ttl = ttl
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def key(data, model_id, version):
+        return f"{model_id}:{version}:{hashlib.sha256(data).hexdigest()}"
+
+    def get_many(self, keys):
+        """
+        Restituisce una lista allineata a keys: la predizione in cache oppure None.
+        """
+        values = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    values[i] = self._lru[key]
+                else:
+                    missing.append(i)
+            self.memory_hits += len(keys) - len(missing)
+
+        if missing and self.redis is not None:
+            try:
+                found = self.redis.mget([self.PREFIX + keys[i] for i in missing])
+            except Exception:
+                self.redis_errors += 1
+                found = [None] * len(missing)
+            promoted = {}
+            still_missing = []
+            for i, value in zip(missing, found):
+                if value is None:
+                    still_missing.append(i)
+                else:
+                    values[i] = json.loads(value)
+                    promoted[keys[i]] = values[i]
+            self.redis_hits += len(promoted)
+            self._put_memory(promoted)
+            missing = still_missing
+
+        self.misses += len(missing)
+
+        return values
+
+    def _put_memory(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._lru[key] = value
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def put_many(self, items):
+        """
+        items: dizionario chiave -> predizione (float, o lista di float per un ensemble).
+        """
+        if not items:
+            return
+        self._put_memory(items)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in items.items():
+                    pipe.set(self.PREFIX + key, json.dumps(value), ex=self.ttl)
+                pipe.execute()
+            except Exception:
+                self.redis_errors += 1
+
+    def invalidate_model(self, model_id):
+        prefix = f"{model_id}:"
+        with self._lock:
+            for key in [k for k in self._lru if k.startswith(prefix)]:
+                del self._lru[key]
+
+    def metrics(self):
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "redis": self.redis is not None,
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": (self.memory_hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import torch
+from numpy.lib.format import open_memmap
+from manifest import CLASSES, patient_manifest
+
+# Shard per paziente: gli spettrogrammi .pth scritti da make_spectrograms.py (P<n>/apnea, P<n>/nonapnea)
+# vengono impacchettati in un unico array contiguo memory-mapped, cosi' il dataset legge ogni campione
+# con una slice della mappa invece di aprire e deserializzare un file per campione.
+# Struttura di P<n>/shard/:
+#   spectrograms.npy  float32 [N, 64, 519], prima i nonapnea poi gli apnea
+#   labels.npy        int8 [N] (0 non apnea, 1 apnea)
+#   index.json        per ogni classe riga iniziale, numero di righe e nomi dei file (ordine di os.listdir),
+#                     piu' l'mtime delle cartelle sorgente ('source'): se cambia, lo shard viene riscritto
+# Esempio: python shards.py --data-path /disks/disk1/adanna/MELSP_6S --patients P1014 P1106
+
+SHARD_DIR = 'shard'
+INDEX_FILE = 'index.json'
+SPECTROGRAMS_FILE = 'spectrograms.npy'
+LABELS_FILE = 'labels.npy'
+
+
+def shard_path(patient_folder):
+    return os.path.join(patient_folder, SHARD_DIR)
+
+
+def has_shard(patient_folder):
+    return os.path.exists(os.path.join(shard_path(patient_folder), INDEX_FILE))
+
+
+def source_fingerprint(patient_folder):
+    """
+    mtime delle cartelle delle classi (una stat per classe, senza elencare i file); None se non esistono piu'.
+    Cambia a ogni aggiunta, rimozione o rinomina di file: make_spectrograms.py scrive ogni spettrogramma
+    con un rename, quindi anche la sua riscrittura. Per file modificati sul posto da altri strumenti
+    si usa write_shard(force=True) (shards.py --force).
+    """
+    class_dirs = [os.path.join(patient_folder, class_name) for class_name in CLASSES]
+    if not all(os.path.isdir(class_dir) for class_dir in class_dirs):
+        return None
+
+    return {class_name: os.stat(class_dir).st_mtime_ns for class_name, class_dir in zip(CLASSES, class_dirs)}
+
+
+def is_current(patient_folder, fingerprint=None):
+    """
+    True se lo shard esiste ed e' stato scritto dagli stessi file sorgente (o se i sorgenti sono stati rimossi).
+    """
+    if not has_shard(patient_folder):
+        return False
+    fingerprint = source_fingerprint(patient_folder) if fingerprint is None else fingerprint
+
+    return fingerprint is None or read_index(patient_folder).get('source') == fingerprint
+
+
+def write_shard(patient_folder, force=False):
+    """
+    Impacchetta gli spettrogrammi del paziente in P<n>/shard/ e restituisce l'indice; uno shard esistente
+    viene riusato solo se i file sorgente non sono cambiati (vedi source_fingerprint).
+    La cartella viene scritta in un percorso temporaneo e rinominata solo a lavoro finito.
+    """
+    dest = shard_path(patient_folder)
+    fingerprint = source_fingerprint(patient_folder)
+    if not force and is_current(patient_folder, fingerprint):
+        return read_index(patient_folder)
+
+    manifest = patient_manifest(patient_folder)
+    files = {class_name: manifest[class_name]['files'] for class_name in CLASSES}
+    total = sum(len(names) for names in files.values())
+    first = next((os.path.join(patient_folder, c, names[0]) for c, names in files.items() if names), None)
+    shape = tuple(torch.load(first).shape) if first else (64, 519)
+
+    tmp = dest + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    spectrograms = open_memmap(os.path.join(tmp, SPECTROGRAMS_FILE), mode='w+', dtype=np.float32, shape=(total,) + shape)
+    labels = np.empty(total, dtype=np.int8)
+
+    index = {'shape': list(shape), 'source': fingerprint, 'classes': {}}
+    row = 0
+    for label, class_name in enumerate(CLASSES):
+        index['classes'][class_name] = {'start': row, 'count': len(files[class_name]), 'files': files[class_name]}
+        for file_name in files[class_name]:
+            spectrograms[row] = torch.load(os.path.join(patient_folder, class_name, file_name)).numpy()
+            labels[row] = label
+            row += 1
+    spectrograms.flush()
+    del spectrograms
+    np.save(os.path.join(tmp, LABELS_FILE), labels)
+    with open(os.path.join(tmp, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    shutil.rmtree(dest, ignore_errors=True)
+    os.replace(tmp, dest)
+
+    return index
+
+
+def read_index(patient_folder):
+    with open(os.path.join(shard_path(patient_folder), INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def open_shard(patient_folder):
+    """
+    Mappa spettrogrammi ed etichette del paziente senza caricarli in memoria
+    (copy-on-write: le slice sono tensori torch validi senza copie).
+    """
+    folder = shard_path(patient_folder)
+
+    return (np.load(os.path.join(folder, SPECTROGRAMS_FILE), mmap_mode='c'),
+            np.load(os.path.join(folder, LABELS_FILE), mmap_mode='r'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', required=True, help='cartella di output di make_spectrograms.py')
+    parser.add_argument('--patients', nargs='+', default=None, help='default: tutte le cartelle P*')
+    parser.add_argument('--force', action='store_true', help='riscrive anche gli shard gia\' presenti')
+    args = parser.parse_args()
+
+    patients = args.patients or sorted(name for name in os.listdir(args.data_path) if name.startswith('P'))
+    for patient in patients:
+        index = write_shard(os.path.join(args.data_path, patient), force=args.force)
+        counts = {class_name: info['count'] for class_name, info in index['classes'].items()}
+        print(f'{patient}: {counts}')
+
+
+if __name__ == '__main__':
+    main()
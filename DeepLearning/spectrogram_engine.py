@@ -0,0 +1,81 @@
+import numpy as np
+import librosa
+
+# Calcolo batch degli spettrogrammi MEL di tutta la notte. Il segnale viene visto come una matrice
+# [n_finestre, campioni] senza copie (stride) e gli spettrogrammi sono calcolati a blocchi di
+# chunk_size finestre con una sola chiamata a librosa per blocco, invece di una per finestra.
+# Il risultato coincide con il percorso originale per finestra:
+#   S2 = librosa.feature.melspectrogram(y=y_chunk, sr=SR, hop_length=185, n_mels=64)
+#   S2_dB = librosa.power_to_db(S2, ref=np.max)   # shape [64, 519]
+
+SR = 16000
+CONTEXT_S = 6
+HOP_LENGTH = 185
+N_MELS = 64
+CHUNK_SIZE = 64
+# livelli di grigio di plt.imsave(..., cmap='gray') (colormap gray a 256 livelli convertita in byte)
+GRAY_LUT = (np.linspace(0, 1, 256) * 255).astype(np.uint8)
+
+
+def frame_windows(y, window, hop=None):
+    """
+    Vista [n_finestre, window] (solo finestre complete) sul segnale y, senza copiare i dati.
+    """
+    hop = hop or window
+    if y.shape[0] < window:
+        return np.empty((0, window), dtype=y.dtype)
+
+    return np.lib.stride_tricks.sliding_window_view(y, window)[::hop]
+
+
+def power_to_db(S, amin=1e-10, top_db=80.0):
+    """
+    librosa.power_to_db(S[i], ref=np.max) applicata a ogni spettrogramma del batch S [k, mel, frame],
+    con riferimento e soglia top_db calcolati per finestra.
+    """
+    ref = np.max(S, axis=(-2, -1), keepdims=True)
+    log_spec = 10.0 * np.log10(np.maximum(amin, S))
+    log_spec -= 10.0 * np.log10(np.maximum(amin, ref))
+    if top_db is not None:
+        log_spec = np.maximum(log_spec, np.max(log_spec, axis=(-2, -1), keepdims=True) - top_db)
+
+    return log_spec
+
+
+def melspectrogram_batch(windows, sr=SR):
+    """
+    windows: [k, campioni] -> spettrogrammi in dB [k, 64, 519] float32.
+    """
+    S = librosa.feature.melspectrogram(y=np.ascontiguousarray(windows), sr=sr, hop_length=HOP_LENGTH, n_mels=N_MELS)
+
+    return power_to_db(S).astype(np.float32)
+
+
+def iter_melspectrograms(windows, indices=None, chunk_size=CHUNK_SIZE, sr=SR):
+    """
+    Genera (indici, spettrogrammi [k, 64, 519]) a blocchi di chunk_size finestre; con indices si
+    calcolano solo le finestre indicate, nell'ordine dato. La memoria e' limitata al blocco corrente.
+    """
+    if indices is None:
+        indices = np.arange(windows.shape[0])
+    indices = np.asarray(indices)
+    for start in range(0, indices.shape[0], chunk_size):
+        block = indices[start:start + chunk_size]
+        yield block, melspectrogram_batch(windows[block], sr)
+
+
+def to_image_scale(specs):
+    """
+    Spettrogrammi in dB [k, 64, 519] -> valori dei pixel (0-255, float32) che il servizio riceve oggi:
+    il PNG scritto con plt.imsave(..., cmap='gray') (normalizzazione min-max per spettrogramma) e
+    riletto da image_utils. Permette di inferire direttamente dall'audio con lo stesso input dei PNG.
+    """
+    specs = np.asarray(specs, dtype=np.float32)
+    low = specs.min(axis=(-2, -1), keepdims=True).astype(np.float64)
+    span = specs.max(axis=(-2, -1), keepdims=True) - low
+    # stessi arrotondamenti di matplotlib.colors.Normalize: operazioni in float64 riportate in float32
+    norm = (specs - low).astype(np.float32)
+    norm = np.where(span > 0, norm / np.where(span > 0, span, 1), 0).astype(np.float32)
+    levels = np.minimum((norm * np.float32(256)).astype(np.int64), 255)
+
+    return GRAY_LUT[levels].astype(np.float32)
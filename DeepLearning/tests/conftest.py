@@ -0,0 +1,4 @@
+import os, sys
+
+# i moduli del servizio si importano dalla cartella DeepLearning, come in app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
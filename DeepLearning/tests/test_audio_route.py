@@ -0,0 +1,47 @@
+import io
+import json
+import os
+import numpy as np
+import pytest
+import soundfile as sf
+
+os.environ.setdefault("MICROBATCH_MAX_WAIT_MS", "0")
+os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+
+from app import app  # noqa: E402
+from audio_stream import SR  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def wav_bytes(seconds):
+    buffer = io.BytesIO()
+    sf.write(buffer, np.random.default_rng(0).normal(0, 0.1, int(seconds * SR)).astype(np.float32), SR,
+             format='WAV')
+
+    return buffer.getvalue()
+
+
+def test_audio_stream(client):
+    r = client.post('/inference/audio?modelId=10_patients_model&stream=1&hop_s=6',
+                    data=wav_bytes(12), content_type='audio/wav')
+    lines = [json.loads(line) for line in r.data.decode().splitlines()]
+
+    assert r.status_code == 200
+    assert all('error' not in line for line in lines), lines
+    blocks, done = lines[:-1], lines[-1]
+    assert done['done'] and done['windows'] == 2
+    assert sum(len(block['probabilities']) for block in blocks) == 2
+    assert blocks[-1]['processed'] == blocks[-1]['total'] == 2
+    assert all(0.0 <= p <= 1.0 for block in blocks for p in block['probabilities'])
+
+
+def test_audio_timeline(client):
+    r = client.post('/inference/audio?modelId=10_patients_model&hop_s=6',
+                    data={'files': (io.BytesIO(wav_bytes(12)), 'p-1[001].wav')}, content_type='multipart/form-data')
+
+    assert r.status_code == 200
+    assert r.json['files'] == ['p-1[001].wav'] and r.json['duration_s'] == 12
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import soundfile as sf
+from audio_inference import count_windows
+from audio_stream import SR, stream_windows
+from labelling import classify_windows
+
+
+def write_recording(tmp_path, seconds):
+    y = np.random.default_rng(0).normal(0, 0.1, int(seconds * SR)).astype(np.float32)
+    path = str(tmp_path / 'p-1[001].wav')
+    sf.write(path, y, SR, subtype='FLOAT')
+
+    return path, y
+
+
+@pytest.mark.parametrize('hop_s', [6, 4, 2.5])
+def test_windows_match_y_all_including_the_tail(tmp_path, hop_s):
+    path, y = write_recording(tmp_path, 13)
+    window, hop = 6 * SR, int(hop_s * SR)
+    # y_all del preprocessing originale: audio completato con zeri fino all'ora
+    y_all = np.zeros(3600 * SR, dtype=np.float32)
+    y_all[:y.size] = y
+
+    indices, windows = zip(*stream_windows([path], window, hop, max_samples=y.size, batch_size=2))
+    indices, windows = np.concatenate(indices), np.concatenate(windows)
+
+    starts, _ = classify_windows([], [], SR, y.size, window, hop)
+    assert indices.tolist() == list(range(len(starts))) and len(starts) == count_windows(y.size, hop_s)
+    expected = np.stack([y_all[start:start + window] for start in starts])
+    np.testing.assert_allclose(windows, expected, atol=1e-6)
+
+
+def test_pad_last_false_keeps_complete_windows_only(tmp_path):
+    path, y = write_recording(tmp_path, 13)
+
+    indices = np.concatenate([i for i, _ in stream_windows([path], 6 * SR, max_samples=y.size, pad_last=False)])
+    assert indices.tolist() == [0, 1]
@@ -0,0 +1,31 @@
+import os
+import warnings
+import pytest
+import torch
+from backends import OnnxRuntimeBackend, export_onnx
+from model_registry import MODELS, ModelRegistry
+
+pytest.importorskip("onnxruntime")
+
+
+@pytest.fixture(scope="module")
+def registry():
+    return ModelRegistry(variants={}, backend="torch")
+
+
+@pytest.mark.parametrize("model_id", list(MODELS))
+def test_onnxruntime_matches_torch(registry, model_id, tmp_path):
+    loaded = registry.get(model_id)
+    path = os.path.join(tmp_path, f"{model_id}.onnx")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        export_onnx(loaded.net, path)
+    ort_backend = OnnxRuntimeBackend(path)
+
+    data = torch.rand(8, 1, 64, 519, generator=torch.Generator().manual_seed(0)) * 255
+    # batch di 1, dispari e > 1: l'asse batch dell'export e' dinamico
+    for batch_size in (1, 3, 8):
+        expected = loaded.backend.predict(data[:batch_size])
+        predicted = ort_backend.predict(data[:batch_size])
+        assert predicted.shape == expected.shape == (batch_size,)
+        torch.testing.assert_close(predicted, expected, atol=1e-4, rtol=0)
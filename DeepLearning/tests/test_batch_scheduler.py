@@ -0,0 +1,93 @@
+import os
+import threading
+import pytest
+import torch
+from batch_scheduler import MicroBatchScheduler
+
+
+class RecordingBackend:
+    # "modello" che restituisce il primo pixel di ogni spettrogramma e registra i batch eseguiti
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def predict(self, batch):
+        self.batches.append(batch[:, 0, 0, 0].tolist())
+        if self.fail:
+            raise RuntimeError('backend failure')
+        return batch[:, 0, 0, 0].clone()
+
+
+class FakeRegistry:
+    def __init__(self, backend):
+        self.loaded = type('Loaded', (), {'backend': backend})()
+
+    def get(self, model_id):
+        return self.loaded
+
+
+def request(values):
+    data = torch.zeros(len(values), 1, 2, 2)
+    data[:, 0, 0, 0] = torch.tensor(values, dtype=torch.float32)
+
+    return data
+
+
+def test_concurrent_requests_share_batches_and_get_their_own_rows():
+    backend = RecordingBackend()
+    scheduler = MicroBatchScheduler(FakeRegistry(backend), max_batch_size=4, max_wait_ms=200)
+    values = [[1, 2, 3], [10, 11, 12, 13, 14], [20]]
+    futures = [None] * len(values)
+    # le richieste arrivano insieme, come da thread diversi di gunicorn
+    barrier = threading.Barrier(len(values))
+
+    def submit(i):
+        barrier.wait()
+        futures[i] = scheduler.submit('model', request(values[i]))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(values))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for future, expected in zip(futures, values):
+        assert future.result(timeout=10).tolist() == expected
+    assert all(len(batch) <= 4 for batch in backend.batches)
+    assert sorted(sum(backend.batches, [])) == sorted(sum(values, []))
+    # almeno un batch contiene righe di richieste diverse
+    assert any(len({int(v) // 10 for v in batch}) > 1 for batch in backend.batches)
+
+
+def test_large_request_is_split_in_order():
+    backend = RecordingBackend()
+    scheduler = MicroBatchScheduler(FakeRegistry(backend), max_batch_size=4, max_wait_ms=1)
+
+    assert scheduler.submit('model', request(list(range(10)))).result(timeout=10).tolist() == list(range(10))
+    assert [len(batch) for batch in backend.batches] == [4, 4, 2]
+
+
+def test_empty_request_and_backend_errors():
+    scheduler = MicroBatchScheduler(FakeRegistry(RecordingBackend(fail=True)), max_batch_size=4, max_wait_ms=1)
+
+    assert scheduler.submit('model', request([])).result(timeout=1).numel() == 0
+    with pytest.raises(RuntimeError, match='backend failure'):
+        scheduler.submit('model', request([1, 2])).result(timeout=10)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='richiede os.fork')
+def test_thread_restarts_after_fork():
+    scheduler = MicroBatchScheduler(FakeRegistry(RecordingBackend()), max_batch_size=4, max_wait_ms=1)
+    # thread avviato nel processo padre, come con il preload di gunicorn
+    assert scheduler.submit('model', request([1])).result(timeout=10).tolist() == [1]
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = scheduler.submit('model', request([7, 8])).result(timeout=10).tolist() == [7, 8]
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
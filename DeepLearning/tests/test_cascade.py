@@ -0,0 +1,20 @@
+import pytest
+import torch
+from cascade import cascade_predict, parse_cascades
+
+
+def test_parse_cascades():
+    assert parse_cascades(None) == {}
+    assert parse_cascades("c=10_patients_model+20_patients_model, ") == {
+        "c": ["10_patients_model", "20_patients_model"]}
+    with pytest.raises(ValueError):
+        parse_cascades("c=10_patients_model")
+
+
+def test_cascade_predict_escalates_uncertain():
+    first = lambda batch: torch.tensor([0.05, 0.5, 0.95])[:batch.shape[0]]
+    second = lambda batch: torch.full((batch.shape[0],), 0.7)
+
+    outputs = cascade_predict(torch.zeros(3, 1, 64, 519), first, second, 0.1, 0.9)
+    assert outputs[:, 0].tolist() == pytest.approx([0.05, 0.7, 0.95])
+    assert outputs[:, 1].tolist() == [1, 2, 1]
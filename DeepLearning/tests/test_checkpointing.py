@@ -0,0 +1,26 @@
+import csv
+from checkpointing import MetricsLog
+
+
+def read_epochs(path):
+    with open(path, newline='') as f:
+        return [int(row['epoch']) for row in csv.DictReader(f)]
+
+
+def test_truncate_drops_epochs_to_repeat(tmp_path):
+    path = str(tmp_path / 'metrics.csv')
+    log = MetricsLog(path)
+    for epoch in range(4):
+        log.append({'epoch': epoch, 'loss': 1.0 / (epoch + 1)})
+
+    # ripresa dall'epoca 2: le epoche 2 e 3 vengono ripetute con nuovi valori
+    log.truncate(2)
+    log.append({'epoch': 2, 'loss': 0.1})
+    log.flush()
+    assert read_epochs(path) == [0, 1, 2]
+
+    # nuovo addestramento da zero: nessuna riga dell'esecuzione precedente
+    log.truncate(0)
+    log.append({'epoch': 0, 'loss': 0.5})
+    log.close()
+    assert read_epochs(path) == [0]
@@ -0,0 +1,52 @@
+import copy
+import torch
+from benchmark_coteaching import make_models, max_delta, reference_step, run
+from coteaching_loss import coteaching_step
+from networks import CRNN_2
+
+
+def batch(size=6):
+    generator = torch.Generator().manual_seed(0)
+
+    return (torch.randn(size, 1, 64, 519, generator=generator),
+            torch.randint(0, 2, (size, 1), generator=generator).float())
+
+
+def test_eval_mode_matches_reference():
+    data, target = batch()
+    models = make_models(128)
+    reference_models = copy.deepcopy(models)
+
+    ref_losses, ref_grads = run(reference_step, reference_models, data, target, 0.3, train=False)
+    losses, grads = run(coteaching_step, models, data, target, 0.3, train=False)
+
+    torch.testing.assert_close(losses, ref_losses, atol=1e-6, rtol=0)
+    assert max_delta(grads, ref_grads) <= 1e-5
+
+
+def test_train_mode_updates_batchnorm_once_per_step():
+    data, target = batch()
+    models = make_models(128)
+    reference_models = copy.deepcopy(models)
+
+    run(reference_step, reference_models, data, target, 0.3, train=True)
+    run(coteaching_step, models, data, target, 0.3, train=True)
+
+    assert models[0].conv1.bn.num_batches_tracked.item() == 1
+    assert reference_models[0].conv1.bn.num_batches_tracked.item() == 2
+
+
+def test_small_last_batch_keeps_weights_finite():
+    # batch di un solo campione con forget_rate 0.5: int(0.5 * 1) == 0 campioni da ricordare
+    data, target = batch(size=1)
+    torch.manual_seed(0)
+    model_1, model_2 = CRNN_2(), CRNN_2()
+    optimizer_1 = torch.optim.Adam(model_1.parameters(), lr=1e-3)
+    optimizer_2 = torch.optim.Adam(model_2.parameters(), lr=1e-3)
+    model_1.train()
+    model_2.train()
+
+    losses = coteaching_step(model_1, optimizer_1, model_2, optimizer_2, data, target, 0.5)
+
+    assert all(torch.isfinite(loss) for loss in losses)
+    assert all(torch.isfinite(p).all() for p in list(model_1.parameters()) + list(model_2.parameters()))
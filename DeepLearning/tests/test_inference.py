@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import soundfile as sf
+import torch
+from audio_inference import predict_windows
+from audio_stream import SR
+from basic_test import Inference
+from model_registry import ModelRegistry
+
+MEMBERS = ["10_patients_model", "20_patients_model"]
+
+
+@pytest.fixture(scope="module")
+def registry():
+    return ModelRegistry(ensembles={"ensemble_model": MEMBERS}, cascades={"cascade_model": MEMBERS})
+
+
+@pytest.fixture(scope="module")
+def data():
+    return torch.rand(3, 1, 64, 519, generator=torch.Generator().manual_seed(0)) * 255
+
+
+def test_ensemble_probabilities(registry, data):
+    ensemble = Inference("ensemble_model", registry)
+    members = [Inference(model_id, registry).inference_data(data) for model_id in MEMBERS]
+
+    assert ensemble.inference_batch(data).shape == (3, 2)
+    torch.testing.assert_close(ensemble.inference_data(data), (members[0] + members[1]) / 2, atol=1e-5, rtol=0)
+
+
+def test_cascade_probabilities(registry, data):
+    cascade = Inference("cascade_model", registry, band=(0.0, 1.0))
+    second = Inference(MEMBERS[1], registry)
+
+    assert cascade.inference_batch(data)[:, 1].tolist() == [2, 2, 2]
+    torch.testing.assert_close(cascade.inference_data(data), second.inference_data(data))
+
+
+def test_predict_windows_one_probability_per_window(registry, tmp_path):
+    ensemble = Inference("ensemble_model", registry)
+    audio = [str(tmp_path / "p-1[001].wav")]
+    sf.write(audio[0], np.random.default_rng(0).normal(0, 0.1, 12 * SR).astype(np.float32), SR)
+
+    blocks = list(predict_windows(audio, lambda batch: ensemble.probabilities(ensemble.inference_batch(batch)),
+                                  n_samples=12 * SR))
+    assert sum(len(block) for _, block in blocks) == 2
+
+    with pytest.raises(ValueError, match="one probability per window"):
+        list(predict_windows(audio, ensemble.inference_batch, n_samples=12 * SR))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from labelling import APNEA, MIXED, NON_APNEA, classify_windows
+
+SR = 100  # frequenza ridotta: stesse regole, maschere piccole
+
+
+def reference_labels(starts, durations, sr, n_samples, window, hop):
+    # ciclo originale di make_spectrograms.py / test.py: maschera per campione e somma per finestra
+    mask = np.zeros(n_samples)
+    for start_s, duration_s in zip(starts, durations):
+        start = int(start_s * sr)
+        mask[start:start + int(duration_s * sr)] = 1.0
+    labels = []
+    for c in range(0, n_samples, hop):
+        covered = mask[c:c + window].sum()
+        labels.append(NON_APNEA if covered == 0 else APNEA if covered == window else MIXED)
+
+    return np.array(labels, dtype=np.int8)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('hop_s', [6, 3, 2.5])
+def test_matches_per_window_loop(seed, hop_s):
+    rng = np.random.default_rng(seed)
+    n_samples = int(rng.integers(300, 600)) * SR // 10 * 10 + int(rng.integers(0, SR))
+    # eventi sovrapposti, adiacenti, oltre la fine e di durata nulla (Start >= 0 come in meta.csv,
+    # vedi test_negative_start_is_clipped)
+    starts = rng.uniform(0, n_samples / SR + 5, 40)
+    durations = rng.choice([0.0, 0.5, 6.0, 10.0, 25.0], 40)
+    window, hop = 6 * SR, int(hop_s * SR)
+
+    window_starts, labels = classify_windows(starts, durations, SR, n_samples, window, hop)
+
+    assert window_starts.tolist() == list(range(0, n_samples, hop))
+    np.testing.assert_array_equal(labels, reference_labels(starts, durations, SR, n_samples, window, hop))
+
+
+def test_incomplete_last_window_is_never_apnea():
+    # evento che copre tutta la registrazione: l'ultima finestra (3 s su 6) e' mista
+    _, labels = classify_windows([0.0], [100.0], SR, 15 * SR, 6 * SR)
+
+    assert labels.tolist() == [APNEA, APNEA, MIXED]
+
+
+def test_negative_start_is_clipped():
+    # con Start < 0 la maschera originale (slice con indice negativo) marcava la fine della registrazione;
+    # qui l'evento viene tagliato all'inizio
+    _, labels = classify_windows([-2.0], [8.0], SR, 18 * SR, 6 * SR)
+
+    assert labels.tolist() == [APNEA, NON_APNEA, NON_APNEA]
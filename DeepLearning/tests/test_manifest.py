@@ -0,0 +1,35 @@
+import json
+import os
+from manifest import MANIFEST_FILE, patient_manifest
+
+
+def make_patient(folder):
+    for class_name, names in (('nonapnea', ['0.pth']), ('apnea', ['1.pth'])):
+        os.makedirs(os.path.join(folder, class_name))
+        for name in names:
+            open(os.path.join(folder, class_name, name), 'wb').close()
+
+
+def test_manifest_lists_spectrograms_only(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+    open(os.path.join(folder, 'apnea', '3.pth.tmp'), 'wb').close()
+
+    manifest = patient_manifest(folder)
+
+    assert manifest['nonapnea']['files'] == ['0.pth'] and manifest['apnea']['files'] == ['1.pth']
+    with open(os.path.join(folder, MANIFEST_FILE)) as f:
+        assert set(json.load(f)['apnea']) == {'dir_mtime_ns', 'files'}
+
+
+def test_manifest_follows_renamed_files(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+    patient_manifest(folder)
+
+    # nuova finestra scritta come in make_spectrograms.py (file temporaneo + rename)
+    path = os.path.join(folder, 'apnea', '5.pth')
+    open(path + '.tmp', 'wb').close()
+    os.replace(path + '.tmp', path)
+
+    assert sorted(patient_manifest(folder)['apnea']['files']) == ['1.pth', '5.pth']
@@ -0,0 +1,16 @@
+import torch
+import torch.nn as nn
+from model_registry import ModelRegistry
+
+MEMBERS = ["10_patients_model", "20_patients_model"]
+
+
+def test_fused_ensemble_has_no_batchnorm():
+    data = torch.rand(2, 1, 64, 519, generator=torch.Generator().manual_seed(0)) * 255
+    ensembles = {"ensemble_model": MEMBERS}
+    fp32 = ModelRegistry(ensembles=ensembles, variants={}).get("ensemble_model")
+    fused = ModelRegistry(ensembles=ensembles, variants={"ensemble_model": "fused"}).get("ensemble_model")
+
+    assert fused.version.endswith("-fused")
+    assert not any(isinstance(module, nn.BatchNorm2d) for module in fused.net.modules())
+    torch.testing.assert_close(fused.backend.predict(data), fp32.backend.predict(data), atol=1e-5, rtol=0)
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+from postprocessing import PostProcessing, drop_short_events, merge_gaps, remove_spikes, run_lengths
+
+
+def legacy_rule(labels):
+    # ciclo originale di test.py: un 1 preceduto e seguito da almeno 2 zeri diventa 0
+    labels = list(labels)
+    i = 0
+    while i < len(labels):
+        if labels[i] == 1:
+            count_zeros_before = 0
+            j = i - 1
+            while j >= 0 and labels[j] == 0:
+                count_zeros_before += 1
+                j -= 1
+            count_zeros_after = 0
+            k = i + 1
+            while k < len(labels) and labels[k] == 0:
+                count_zeros_after += 1
+                k += 1
+
+            if count_zeros_before >= 2 and count_zeros_after >= 2:
+                labels[i] = 0
+                i += 3
+            else:
+                i += 1
+        else:
+            i += 1
+
+    return labels
+
+
+def random_labels(rng, size, p):
+    return (rng.random(size) < p).astype(np.int64)
+
+
+def test_run_lengths():
+    values, starts, lengths = run_lengths([0, 0, 1, 1, 1, 0, 1])
+
+    assert values.tolist() == [False, True, False, True]
+    assert starts.tolist() == [0, 2, 5, 6] and lengths.tolist() == [2, 3, 1, 1]
+    assert [a.size for a in run_lengths([])] == [0, 0, 0]
+
+
+@pytest.mark.parametrize('labels, expected', [
+    ([0, 0, 1, 0, 0], [0, 0, 0, 0, 0]),
+    ([1, 0, 0], [1, 0, 0]),                 # l'inizio della sequenza non conta come zero
+    ([0, 0, 1], [0, 0, 1]),                 # nemmeno la fine
+    ([0, 1, 0, 0], [0, 1, 0, 0]),
+    ([0, 0, 1, 1, 0, 0], [0, 0, 1, 1, 0, 0]),
+    ([0, 0, 1, 0, 0, 1, 0, 0], [0] * 8),
+])
+def test_default_rule_examples(labels, expected):
+    assert PostProcessing().apply(labels).tolist() == expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('p', [0.1, 0.3, 0.6])
+def test_default_rule_matches_legacy_loop(seed, p):
+    rng = np.random.default_rng(seed)
+    for size in [0, 1, 2, 5, 17, 300]:
+        labels = random_labels(rng, size, p)
+        assert PostProcessing().apply(labels).tolist() == legacy_rule(labels)
+
+
+def test_probabilities_are_thresholded():
+    probabilities = np.array([0.1, 0.7, 0.5, 0.2, 0.0, 0.0, 0.9, 0.0, 0.0])
+
+    assert PostProcessing().binarize(probabilities).astype(int).tolist() == [0, 1, 1, 0, 0, 0, 1, 0, 0]
+    assert PostProcessing().apply(probabilities).tolist() == [0, 1, 1, 0, 0, 0, 0, 0, 0]
+    assert PostProcessing(threshold=0.8).apply(probabilities).tolist() == [0] * 9
+
+
+def test_wider_spikes_and_gaps():
+    labels = [0, 0, 0, 1, 1, 0, 0, 0, 1, 0, 0]
+
+    assert remove_spikes(labels, max_len=2, min_gap=3).astype(int).tolist() == [0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0]
+    assert remove_spikes(labels, max_len=2, min_gap=2).astype(int).tolist() == [0] * 11
+
+
+def test_merge_gaps_keeps_the_edges():
+    labels = [0, 1, 0, 0, 1, 0, 0, 0, 1, 0]
+
+    assert merge_gaps(labels, 2).astype(int).tolist() == [0, 1, 1, 1, 1, 0, 0, 0, 1, 0]
+    assert merge_gaps(labels, 3).astype(int).tolist() == [0, 1, 1, 1, 1, 1, 1, 1, 1, 0]
+
+
+def test_drop_short_events():
+    labels = [1, 0, 1, 1, 0, 1, 1, 1]
+
+    assert drop_short_events(labels, 2).astype(int).tolist() == [0, 0, 1, 1, 0, 1, 1, 1]
+    assert drop_short_events(labels, 3).astype(int).tolist() == [0, 0, 0, 0, 0, 1, 1, 1]
+
+
+def test_rules_are_applied_in_order():
+    # il picco viene rimosso prima dell'unione, quindi non unisce i due eventi
+    labels = [1, 1, 0, 0, 1, 0, 0, 1, 1]
+
+    assert PostProcessing(merge_gap=2).apply(labels).tolist() == [1, 1, 0, 0, 0, 0, 0, 1, 1]
+    assert PostProcessing(spike_max_len=0, merge_gap=2).apply(labels).tolist() == [1] * 9
+    assert PostProcessing(spike_max_len=0, min_event_len=3).apply(labels).tolist() == [0] * 9
+
+
+PARAMETERS = [
+    {},
+    {'spike_max_len': 0},
+    {'spike_max_len': 2, 'spike_min_gap': 3},
+    {'merge_gap': 3},
+    {'min_event_len': 3},
+    {'spike_max_len': 2, 'spike_min_gap': 4, 'merge_gap': 5, 'min_event_len': 2},
+]
+
+
+@pytest.mark.parametrize('params', PARAMETERS)
+@pytest.mark.parametrize('seed', range(4))
+def test_streaming_matches_whole_sequence(params, seed):
+    rng = np.random.default_rng(seed)
+    postprocessing = PostProcessing(**params)
+    for p in [0.05, 0.2, 0.5]:
+        labels = random_labels(rng, 500, p)
+        cuts = np.sort(rng.choice(np.arange(1, labels.size), size=rng.integers(1, 40), replace=False))
+
+        stream = postprocessing.stream()
+        out = [stream.push(block) for block in np.split(labels, cuts)]
+        out.append(stream.flush())
+        assert np.concatenate(out).tolist() == postprocessing.apply(labels).tolist()
+
+
+def test_streaming_with_probabilities_and_empty_blocks():
+    rng = np.random.default_rng(0)
+    postprocessing = PostProcessing(merge_gap=2)
+    probabilities = rng.random(200)
+
+    stream = postprocessing.stream()
+    out = []
+    for block in np.array_split(probabilities, 10):
+        out.append(stream.push(block))
+        out.append(stream.push(np.empty(0)))
+    out.append(stream.flush())
+    assert np.concatenate(out).tolist() == postprocessing.apply(probabilities).tolist()
+
+
+def test_streaming_releases_labels_after_a_long_silence():
+    stream = PostProcessing().stream()
+
+    assert stream.push([0, 1, 1, 0]).size == 0
+    released = stream.push([0, 0, 0, 0, 0])
+    assert released.tolist() == [0, 1, 1, 0, 0]
+    assert stream.flush().tolist() == [0, 0, 0, 0]
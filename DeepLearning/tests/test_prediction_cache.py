@@ -0,0 +1,90 @@
+import os
+import shutil
+from model_registry import CHECKPOINTS_DIR, ModelRegistry
+from prediction_cache import PredictionCache
+
+
+class DictRedis:
+    # client Redis minimale in memoria (mget / pipeline.set), per il secondo livello
+    def __init__(self):
+        self.store = {}
+
+    def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+    def pipeline(self, transaction=False):
+        redis = self
+
+        class Pipeline:
+            def set(self, key, value, ex=None):
+                redis.store[key] = value.encode()
+
+            def execute(self):
+                pass
+
+        return Pipeline()
+
+
+class BrokenRedis:
+    def mget(self, keys):
+        raise ConnectionError('redis down')
+
+    def pipeline(self, transaction=False):
+        raise ConnectionError('redis down')
+
+
+def test_key_depends_on_model_and_version():
+    png = b'\x89PNG data'
+
+    assert PredictionCache.key(png, 'm', 'v1') != PredictionCache.key(png, 'm', 'v2')
+    assert PredictionCache.key(png, 'm', 'v1') != PredictionCache.key(png, 'other', 'v1')
+    assert PredictionCache.key(png, 'm', 'v1') == PredictionCache.key(b'\x89PNG data', 'm', 'v1')
+
+
+def test_lru_eviction_and_invalidation():
+    cache = PredictionCache(max_entries=2)
+    cache.put_many({'a:v:1': 0.1, 'a:v:2': 0.2})
+    cache.get_many(['a:v:1'])
+    cache.put_many({'b:v:3': [0.3, 0.4]})
+
+    # a:v:2 era la meno usata di recente
+    assert cache.get_many(['a:v:1', 'a:v:2', 'b:v:3']) == [0.1, None, [0.3, 0.4]]
+    cache.invalidate_model('a')
+    assert cache.get_many(['a:v:1', 'b:v:3']) == [None, [0.3, 0.4]]
+
+
+def test_redis_second_level_is_shared_and_promoted():
+    redis = DictRedis()
+    PredictionCache(redis_client=redis).put_many({'m:v:1': 0.25, 'm:v:2': [0.5, 0.75]})
+    # un altro worker: memoria vuota, stesso Redis
+    cache = PredictionCache(redis_client=redis)
+
+    assert cache.get_many(['m:v:1', 'm:v:2', 'm:v:3']) == [0.25, [0.5, 0.75], None]
+    assert cache.get_many(['m:v:1']) == [0.25]
+    assert (cache.memory_hits, cache.redis_hits, cache.misses) == (1, 2, 1)
+
+
+def test_redis_errors_fall_back_to_memory():
+    cache = PredictionCache(redis_client=BrokenRedis())
+    cache.put_many({'m:v:1': 0.5})
+
+    assert cache.get_many(['m:v:1', 'm:v:2']) == [0.5, None]
+    assert cache.redis_errors == 2 and cache.misses == 1
+
+
+def test_reloaded_checkpoint_invalidates_cached_predictions(tmp_path):
+    shutil.copy(os.path.join(CHECKPOINTS_DIR, '10_patients_model.pth'), tmp_path)
+    registry = ModelRegistry(checkpoints_dir=str(tmp_path), models={'m': '10_patients_model.pth'},
+                             ensembles={}, cascades={}, variants={})
+    cache = PredictionCache()
+    registry.add_listener(cache.invalidate_model)
+
+    old_version = registry.get('m').version
+    cache.put_many({PredictionCache.key(b'png', 'm', old_version): 0.5})
+    stat = os.stat(tmp_path / '10_patients_model.pth')
+    os.utime(tmp_path / '10_patients_model.pth', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    new_version = registry.get('m').version
+
+    assert new_version != old_version
+    assert cache.get_many([PredictionCache.key(b'png', 'm', old_version)]) == [None]
+    assert cache.metrics()['entries'] == 0
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import torch
+from shards import is_current, open_shard, read_index, write_shard
+
+
+def make_patient(folder):
+    for class_name, names in (('nonapnea', ['0.pth', '2.pth']), ('apnea', ['1.pth'])):
+        os.makedirs(os.path.join(folder, class_name))
+        for name in names:
+            torch.save(torch.full((4, 5), float(name[0])), os.path.join(folder, class_name, name))
+
+
+def test_write_shard_reuses_unchanged_source(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+
+    index = write_shard(folder)
+    mtime = os.stat(os.path.join(folder, 'shard', 'index.json')).st_mtime_ns
+
+    assert is_current(folder)
+    assert write_shard(folder) == index
+    assert os.stat(os.path.join(folder, 'shard', 'index.json')).st_mtime_ns == mtime
+
+
+def test_write_shard_rebuilds_when_a_file_is_rewritten(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+    write_shard(folder)
+
+    # riscrittura come in make_spectrograms.py (file temporaneo + rename): cambia l'mtime della cartella
+    path = os.path.join(folder, 'apnea', '1.pth')
+    torch.save(torch.full((4, 5), 7.0), path + '.tmp')
+    os.replace(path + '.tmp', path)
+    assert not is_current(folder)
+
+    index = write_shard(folder)
+    spectrograms, labels = open_shard(folder)
+    row = index['classes']['apnea']['start']
+    assert np.all(spectrograms[row] == 7.0) and labels[row] == 1
+    assert is_current(folder)
+
+
+def test_in_place_rewrite_needs_force(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+    write_shard(folder)
+
+    torch.save(torch.full((4, 5), 7.0), os.path.join(folder, 'apnea', '1.pth'))
+    assert is_current(folder)
+
+    index = write_shard(folder, force=True)
+    spectrograms, _ = open_shard(folder)
+    assert np.all(spectrograms[index['classes']['apnea']['start']] == 7.0)
+
+
+def test_shard_without_sources_stays_current(tmp_path):
+    folder = str(tmp_path / 'P1')
+    make_patient(folder)
+    index = write_shard(folder)
+    for class_name in ('nonapnea', 'apnea'):
+        for name in os.listdir(os.path.join(folder, class_name)):
+            os.remove(os.path.join(folder, class_name, name))
+        os.rmdir(os.path.join(folder, class_name))
+
+    assert is_current(folder)
+    assert read_index(folder) == index
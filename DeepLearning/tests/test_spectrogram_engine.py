@@ -0,0 +1,100 @@
+import io
+import librosa
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from image_utils import decode_image_from_bytes
+from spectrogram_engine import (CONTEXT_S, HOP_LENGTH, N_MELS, SR, frame_windows, iter_melspectrograms,
+                                melspectrogram_batch, power_to_db, to_image_scale)
+
+WINDOW = CONTEXT_S * SR
+
+
+def signal(n_windows, seed=0):
+    # rumore + tono modulato, come benchmark_spectrograms.synthetic_signal
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_windows * WINDOW) / SR
+    y = 0.05 * rng.standard_normal(t.shape[0])
+    y += 0.3 * np.sin(2 * np.pi * (200 + 150 * np.sin(2 * np.pi * t / 37)) * t)
+
+    return y * (1 + 0.5 * np.sin(2 * np.pi * t / 11))
+
+
+def reference(y_chunk):
+    # percorso originale per finestra del preprocessing
+    S2 = librosa.feature.melspectrogram(y=y_chunk, sr=SR, hop_length=HOP_LENGTH, n_mels=N_MELS)
+
+    return librosa.power_to_db(S2, ref=np.max).astype(np.float32)
+
+
+def test_frame_windows_is_a_view_of_complete_windows():
+    y = np.arange(2 * WINDOW + 10, dtype=np.float64)
+
+    windows = frame_windows(y, WINDOW)
+    assert windows.shape == (2, WINDOW) and np.shares_memory(windows, y)
+    np.testing.assert_array_equal(windows[1], y[WINDOW:2 * WINDOW])
+    assert frame_windows(y[:WINDOW - 1], WINDOW).shape == (0, WINDOW)
+
+
+def test_batch_matches_librosa_per_window():
+    windows = frame_windows(signal(3), WINDOW)
+
+    specs = melspectrogram_batch(windows)
+    assert specs.shape == (3, 64, 519) and specs.dtype == np.float32
+    for spec, y_chunk in zip(specs, windows):
+        np.testing.assert_allclose(spec, reference(y_chunk), atol=1e-3)
+
+
+def test_db_reference_is_per_window():
+    # finestre di ampiezza molto diversa: ogni spettrogramma e' normalizzato sul proprio massimo
+    windows = frame_windows(signal(2), WINDOW).copy()
+    windows[0] *= 1e-3
+    windows[1, :WINDOW // 2] = 0
+
+    specs = melspectrogram_batch(windows)
+    for spec, y_chunk in zip(specs, windows):
+        assert spec.max() == 0
+        np.testing.assert_allclose(spec, reference(y_chunk), atol=1e-3)
+
+
+def test_power_to_db_matches_librosa_on_silence():
+    S = np.zeros((2, N_MELS, 519))
+    S[1, 3, 7] = 1.0
+
+    for batch, single in zip(power_to_db(S), S):
+        np.testing.assert_allclose(batch, librosa.power_to_db(single, ref=np.max))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 64])
+def test_iter_melspectrograms_chunks_and_indices(chunk_size):
+    windows = frame_windows(signal(3), WINDOW)
+    full = melspectrogram_batch(windows)
+
+    blocks = list(iter_melspectrograms(windows, chunk_size=chunk_size))
+    assert all(len(block) <= chunk_size for block, _ in blocks)
+    np.testing.assert_array_equal(np.concatenate([block for block, _ in blocks]), [0, 1, 2])
+    np.testing.assert_allclose(np.concatenate([specs for _, specs in blocks]), full, atol=1e-4)
+
+    blocks = list(iter_melspectrograms(windows, indices=[2, 0], chunk_size=chunk_size))
+    np.testing.assert_array_equal(np.concatenate([block for block, _ in blocks]), [2, 0])
+    np.testing.assert_allclose(np.concatenate([specs for _, specs in blocks]), full[[2, 0]], atol=1e-4)
+
+
+def test_image_scale_matches_the_saved_png():
+    specs = melspectrogram_batch(frame_windows(signal(2), WINDOW))
+
+    pixels = to_image_scale(specs)
+    for spec, expected in zip(specs, pixels):
+        # stesso percorso di make_spectrograms + image_utils: PNG in scala di grigi e rilettura
+        buffer = io.BytesIO()
+        plt.imsave(buffer, spec, cmap='gray', format='png')
+        png = decode_image_from_bytes(buffer.getvalue())[0, 0].numpy()
+        np.testing.assert_array_equal(expected, png)
+
+
+def test_image_scale_of_a_constant_spectrogram_is_black():
+    pixels = to_image_scale(np.full((1, N_MELS, 519), -80.0, dtype=np.float32))
+
+    assert pixels.shape == (1, N_MELS, 519) and not pixels.any()
@@ -0,0 +1,27 @@
+import struct
+import pytest
+from transport import FrameFormatError, decode_frames, encode_frames
+
+
+def test_roundtrip():
+    body = encode_frames('10_patients_model', [('a.png', b'\x89PNG1'), ('b.png', b'')])
+    model_id, frames = decode_frames(body)
+
+    assert model_id == '10_patients_model'
+    assert [(name, bytes(data)) for name, data in frames] == [('a.png', b'\x89PNG1'), ('b.png', b'')]
+
+
+def test_invalid_utf8_name():
+    name = b'\xff\xfe.png'
+    body = (b'SPF1' + struct.pack('>H', 5) + b'model' + struct.pack('>I', 1)
+            + struct.pack('>H', len(name)) + name + struct.pack('>I', 3) + b'png')
+
+    with pytest.raises(FrameFormatError, match='utf-8'):
+        decode_frames(body)
+
+
+def test_truncated_payload():
+    body = encode_frames('model', [('a.png', b'png')])
+
+    with pytest.raises(FrameFormatError):
+        decode_frames(body[:-1])
@@ -7,9 +7,11 @@ import os
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
-from dataset import CoTeachingDataset  # Assicurati che questo import sia corretto
+from dataset import ShardDataset
 from networks import CRNN_2
-from torchmetrics.classification import Precision, Recall, BinaryF1Score
+from training_runtime import TrainingRuntime
+from evaluation import Evaluator
+from checkpointing import CheckpointManager, MetricsLog, export_excel
 import gc
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 from datetime import datetime
@@ -17,11 +19,18 @@ import pandas as pd
 
 # Parametri di addestramento
 batch_size = 64
+val_batch_size = 256 # la validazione non calcola gradienti: batch piu' grandi
 epochs = 150
 learning_rate = 0.01
 print_freq = 1
 logs_path = "/home/adanna/Codice/apnea_detection_v3/model"
+resume = False # True per riprendere dall'ultimo stato salvato in logs_path/checkpoints (altrimenti si riparte da zero)
+keep_last = 3 # epoche di cui tenere i pesi del modello
+keep_best = 3 # migliori modelli da tenere
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# worker, prefetch, AMP e channels-last configurabili con le variabili TRAIN_* (vedi training_runtime.py)
+runtime = TrainingRuntime(device)
+print(runtime)
 
 # Elenco dei pazienti con cui lavorare
 training_patients = ["P1097","P1000", "P1006", "P1008", "P1010", "P1014", "P1016", "P1018", "P1020", "P1022","P1028","P1037", "P1039", "P1041", "P1043", "P1057", "P1059", "P1069",  "P1071","P1073"]  # 65%
@@ -32,46 +41,76 @@ writer = SummaryWriter(log_dir=os.path.join(logs_path, 'tensorboard'))
 
 data_path = "/disks/disk1/adanna/MELSP_6S"
 
-dataset_training = CoTeachingDataset(data_path, training_patients)
-dataset_validation = CoTeachingDataset(data_path, validation_patients, val=True)
+dataset_training = ShardDataset(data_path, training_patients)
+dataset_validation = ShardDataset(data_path, validation_patients, val=True)
 
 print(f'Dimensione dataset di training: {len(dataset_training)}')
 print(f'Dimensione dataset di validazione: {len(dataset_validation)}')
 
-train_loader = DataLoader(dataset_training, batch_size=batch_size, shuffle=True)
-val_loader = DataLoader(dataset_validation, batch_size=1, shuffle=True)
+train_loader = runtime.loader(dataset_training, batch_size=batch_size, shuffle=True)
+val_loader = runtime.loader(dataset_validation, batch_size=val_batch_size)
 
 # Inizializza il modello
 
-model = CRNN_2().to(device)
+model = runtime.prepare_model(CRNN_2())
 
 # Definisci l'ottimizzatore
 optimizer = optim.Adam(model.parameters(), lr=learning_rate)
 scheduler = ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5, verbose=True)
+scaler = runtime.grad_scaler() # solo con TRAIN_AMP=fp16
 
 # Metriche per la valutazione
-precision_metric = Precision(task='binary', average='micro').to(device)
-recall_metric = Recall(task='binary', average='micro').to(device)
-f1_metric = BinaryF1Score().to(device)
+evaluator = Evaluator(runtime)
+
+# Checkpoint e metriche scritti in background (report Excel esportato a fine addestramento)
+checkpoints = CheckpointManager(os.path.join(logs_path, 'checkpoints'), resume_name='baseline_resume.pth',
+                                keep_last=keep_last, keep_best=keep_best)
+metrics_log = MetricsLog('training_crnn.csv')
+
+def training_state(epoch, best_loss, best_f1):
+    # tutto cio' che serve per riprendere l'addestramento dall'epoca successiva
+    return {
+        'epoch': epoch,
+        'best_loss': best_loss,
+        'best_f1': best_f1,
+        'model': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'scheduler': scheduler.state_dict(),
+        'scaler': scaler.state_dict() if scaler is not None else None,
+    }
+
+def restore_training_state(state):
+    model.load_state_dict(state['model'])
+    optimizer.load_state_dict(state['optimizer'])
+    scheduler.load_state_dict(state['scheduler'])
+    if scaler is not None and state['scaler'] is not None:
+        scaler.load_state_dict(state['scaler'])
+
+    return state['epoch'] + 1, state['best_loss'], state['best_f1']
 
 def training(train_loader, epoch, model, optimizer, best_loss, best_f1, writer):
     model.train()
     total_loss = 0.0
     total_batches = 0
-    for batch_idx, (data, target) in enumerate(tqdm(train_loader)):
-        data, target = data.to(device), target.to(device)
+    for batch_idx, (data, target) in enumerate(tqdm(runtime.batches(train_loader, writer), total=len(train_loader))):
         target = target.float().unsqueeze(1)
         
-        # Forward pass
-        output = model(data)
+        # Forward pass (in mixed precision se abilitata)
+        with runtime.autocast():
+            output = model(data)
         
-        # Calcola la loss
-        loss = F.binary_cross_entropy(output, target)
+        # Calcola la loss (sempre in fp32)
+        loss = F.binary_cross_entropy(output.float(), target)
         
         # Backpropagation e ottimizzazione
         optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
+        if scaler is None:
+            loss.backward()
+            optimizer.step()
+        else:
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
         
         total_loss += loss.item()
         total_batches += 1
@@ -83,38 +122,20 @@ def training(train_loader, epoch, model, optimizer, best_loss, best_f1, writer):
     avg_loss = total_loss / total_batches
     scheduler.step(avg_loss)
     
-    model.eval()
-    all_predictions = []
-    all_labels = []
-    
-    with torch.no_grad():
-        for data, label in val_loader:
-            data, label = data.to(device), label.to(device)
-            label = label.float().unsqueeze(1)
-            prediction = model(data)
-            all_predictions.append(prediction)
-            all_labels.append(label)
-    
-    all_predictions = torch.cat(all_predictions)
-    all_labels = torch.cat(all_labels)
-    
-    precision_metric(all_predictions, all_labels)
-    recall_metric(all_predictions, all_labels)
-    f1_metric(all_predictions, all_labels)
-    
-    avg_precision = precision_metric.compute().item()
-    avg_recall = recall_metric.compute().item()
-    avg_f1 = f1_metric.compute().item()
+    # validazione a blocchi con metriche azzerate ad ogni epoca
+    results = evaluator.evaluate([model], val_loader)[0]
+    avg_precision, avg_recall, avg_f1 = results['precision'], results['recall'], results['f1']
     
     print(f'Precision: {avg_precision}, Recall: {avg_recall}, F1: {avg_f1}')
-    torch.save(model.state_dict(), os.path.join(logs_path, 'checkpoints', f'baseline_model_{epoch}.pth'))
     
     # Aggiorna il miglior modello
     if avg_f1 > best_f1:
         best_loss = avg_loss
         best_f1 = avg_f1
-        torch.save(model.state_dict(), os.path.join(logs_path, 'checkpoints', f'baseline_best_model_{epoch}.pth'))
+        checkpoints.save_best(epoch, model, best_f1, 'baseline_best_model')
         print(f'Best model saved with loss {best_loss} and F1 {best_f1}')
+    # pesi per questa epoca e stato per la ripresa (scritti in background)
+    checkpoints.save_epoch(epoch, {'baseline_model': model}, training_state(epoch, best_loss, best_f1))
     
     # Aggiorna i risultati su TensorBoard
     writer.add_scalar("precision", avg_precision, epoch)
@@ -122,23 +143,14 @@ def training(train_loader, epoch, model, optimizer, best_loss, best_f1, writer):
     writer.add_scalar("f1", avg_f1, epoch)
     writer.add_scalar("train_loss", avg_loss, epoch)
     
-    # Salva le metriche in un file Excel
-    data = {
-        'epoch': [epoch],
-        'precision': [avg_precision],
-        'recall': [avg_recall],
-        'f1': [avg_f1],
-        'train_loss': [avg_loss]
-    }
-
-    df = pd.DataFrame(data)
-    
-    if not os.path.isfile('training_crnn.xlsx'):
-        df.to_excel('training_crnn.xlsx', index=False)
-    else:
-        df_existing = pd.read_excel('training_crnn.xlsx')
-        df_combined = pd.concat([df_existing, df], ignore_index=True)
-        df_combined.to_excel('training_crnn.xlsx', index=False)
+    # Salva le metriche: una riga per epoca in append, l'Excel viene esportato a fine addestramento
+    metrics_log.append({
+        'epoch': epoch,
+        'precision': avg_precision,
+        'recall': avg_recall,
+        'f1': avg_f1,
+        'train_loss': avg_loss
+    })
     
     writer.flush()
     
@@ -147,10 +159,21 @@ def training(train_loader, epoch, model, optimizer, best_loss, best_f1, writer):
 def main():
     best_loss = 1e6
     best_f1 = 0.0
-    for epoch in range(epochs):
+    start_epoch = 0
+    state = checkpoints.load_resume(map_location=device) if resume else None
+    if state is not None:
+        start_epoch, best_loss, best_f1 = restore_training_state(state)
+        print(f'Ripresa dall\'epoca {start_epoch} (best_loss: {best_loss} best_f1: {best_f1})')
+    # le righe delle epoche che verranno ripetute (tutte, se si riparte da zero) non finiscono nel report
+    metrics_log.truncate(start_epoch)
+
+    for epoch in range(start_epoch, epochs):
         best_loss, best_f1 = training(train_loader, epoch, model, optimizer, best_loss, best_f1, writer)
         print(f'Epoch [{epoch+1}/{epochs}] best_loss: {best_loss} best_f1: {best_f1}')
     
+    checkpoints.close()
+    metrics_log.close()
+    export_excel('training_crnn.csv', 'training_crnn.xlsx')
     writer.close()
 
 if __name__ == "__main__":
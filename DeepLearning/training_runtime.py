@@ -0,0 +1,133 @@
+import os
+import time
+from contextlib import nullcontext
+import torch
+from torch.utils.data import DataLoader
+
+# Runtime di addestramento condiviso da main.py e training_crnn_baseline.py: DataLoader con worker
+# persistenti, prefetch e pinned memory, mixed precision opzionale (bf16 anche su CPU), layout
+# channels-last per le convoluzioni e log del throughput (campioni/s e quota di tempo in attesa dei dati).
+# Configurazione da variabili d'ambiente:
+#   TRAIN_NUM_WORKERS    processi di caricamento (default: numero di CPU, max 8; 0 = nel processo principale)
+#   TRAIN_PREFETCH       batch preparati in anticipo da ogni worker (default 4)
+#   TRAIN_AMP            off | bf16 | fp16 (fp16 solo su CUDA, con GradScaler)
+#   TRAIN_CHANNELS_LAST  1 per usare torch.channels_last
+#   TRAIN_LOG_EVERY      passi tra due righe di log del throughput (default 50, 0 = disattivato)
+
+AMP_MODES = ['off', 'bf16', 'fp16']
+
+
+class ThroughputMeter:
+    """
+    Campioni/s e frazione del tempo passata ad aspettare il DataLoader, su finestre di log_every passi.
+    Se la quota di attesa e' alta l'addestramento e' limitato dall'I/O e non dal calcolo.
+    """
+    def __init__(self, log_every=50, writer=None, tag='train'):
+        self.log_every = log_every
+        self.writer = writer
+        self.tag = tag
+        self.global_step = 0
+        self.restart()
+
+    def restart(self, now=None):
+        now = time.perf_counter() if now is None else now
+        self.window_start = now
+        self.samples = 0
+        self.steps = 0
+        self.data_wait = 0.0
+
+    def wait(self, seconds):
+        self.data_wait += seconds
+
+    def step(self, batch_size):
+        self.samples += batch_size
+        self.steps += 1
+        self.global_step += 1
+        if not self.log_every or self.steps < self.log_every:
+            return
+        now = time.perf_counter()
+        elapsed = max(now - self.window_start, 1e-9)
+        samples_per_s = self.samples / elapsed
+        wait_share = self.data_wait / elapsed
+        print(f'[{self.tag}] step {self.global_step}: {samples_per_s:.1f} samples/s, '
+              f'data wait {wait_share * 100:.1f}%')
+        if self.writer is not None:
+            self.writer.add_scalar(f'{self.tag}_samples_per_s', samples_per_s, self.global_step)
+            self.writer.add_scalar(f'{self.tag}_data_wait', wait_share, self.global_step)
+        self.restart(now)
+
+
+class TrainingRuntime:
+    def __init__(self, device, num_workers=None, prefetch_factor=None, amp=None, channels_last=None,
+                 log_every=None):
+        self.device = torch.device(device)
+        self.num_workers = int(os.environ.get('TRAIN_NUM_WORKERS', min(8, os.cpu_count() or 1))) \
+            if num_workers is None else num_workers
+        self.prefetch_factor = int(os.environ.get('TRAIN_PREFETCH', 4)) if prefetch_factor is None else prefetch_factor
+        self.amp = os.environ.get('TRAIN_AMP', 'off') if amp is None else amp
+        if self.amp not in AMP_MODES:
+            raise ValueError(f'Unknown AMP mode {self.amp!r}, expected one of {AMP_MODES}')
+        if self.amp == 'fp16' and self.device.type != 'cuda':
+            raise ValueError('fp16 autocast requires CUDA, use bf16 on CPU')
+        self.channels_last = os.environ.get('TRAIN_CHANNELS_LAST', '0') == '1' if channels_last is None else channels_last
+        self.log_every = int(os.environ.get('TRAIN_LOG_EVERY', 50)) if log_every is None else log_every
+        self.pin_memory = self.device.type == 'cuda'
+        self.memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        self.meters = {}
+
+    def __repr__(self):
+        return (f'TrainingRuntime(device={self.device}, num_workers={self.num_workers}, '
+                f'prefetch_factor={self.prefetch_factor}, amp={self.amp}, channels_last={self.channels_last})')
+
+    def loader(self, dataset, batch_size, shuffle=False):
+        options = {}
+        if self.num_workers > 0:
+            # i worker restano vivi tra un'epoca e l'altra (e con loro gli shard gia' mappati)
+            options = {'persistent_workers': True, 'prefetch_factor': self.prefetch_factor}
+
+        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=self.num_workers,
+                          pin_memory=self.pin_memory, **options)
+
+    def prepare_model(self, model):
+        return model.to(self.device, memory_format=self.memory_format)
+
+    def to_device(self, data, target):
+        # una sola copia verso il device, asincrona se la memoria e' pinned
+        data = data.to(self.device, non_blocking=self.pin_memory, memory_format=self.memory_format)
+        target = target.to(self.device, non_blocking=self.pin_memory)
+
+        return data, target
+
+    def autocast(self):
+        if self.amp == 'off':
+            return nullcontext()
+        dtype = torch.bfloat16 if self.amp == 'bf16' else torch.float16
+
+        return torch.autocast(device_type=self.device.type, dtype=dtype)
+
+    def grad_scaler(self):
+        """
+        GradScaler per fp16 (None negli altri casi: bf16 ha lo stesso range di fp32).
+        """
+        if self.amp != 'fp16':
+            return None
+
+        return torch.amp.GradScaler(self.device.type)
+
+    def batches(self, loader, writer=None, tag='train'):
+        """
+        Itera il loader restituendo (data, target) gia' sul device e registra il throughput
+        (il contatore dei passi prosegue tra le epoche).
+        """
+        meter = self.meters.setdefault(tag, ThroughputMeter(self.log_every, writer, tag))
+        meter.restart()
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                data, target = next(iterator)
+            except StopIteration:
+                return
+            meter.wait(time.perf_counter() - start)
+            yield self.to_device(data, target)
+            meter.step(data.shape[0])
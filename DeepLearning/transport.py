@@ -0,0 +1,75 @@
+import struct
+
+# Formato binario per /inference (Content-Type: application/x-spectrogram-frames), big-endian:
+#   b'SPF1' | uint16 len(modelId) | modelId utf-8 | uint32 numero di frame
+#   per ogni frame: uint16 len(name) | name utf-8 | uint32 len(png) | byte PNG
+# I PNG vengono restituiti come memoryview sul corpo della richiesta, senza copie
+# e senza passare da liste di interi Python come nel formato JSON.
+
+FRAMES_MIMETYPE = 'application/x-spectrogram-frames'
+MAGIC = b'SPF1'
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+
+
+class FrameFormatError(ValueError):
+    pass
+
+
+def _text(raw, field):
+    try:
+        return str(raw, 'utf-8')
+    except UnicodeDecodeError as e:
+        raise FrameFormatError(f'Invalid utf-8 {field} at byte {e.start}') from None
+
+
+def _read(view, offset, size):
+    end = offset + size
+    if end > len(view):
+        raise FrameFormatError(f'Truncated frame payload at byte {offset}')
+    return view[offset:end], end
+
+
+def decode_frames(body):
+    """
+    Restituisce (model_id, [(name, memoryview_png), ...]) a partire dal corpo della richiesta.
+    """
+    view = memoryview(body)
+    magic, offset = _read(view, 0, len(MAGIC))
+    if magic != MAGIC:
+        raise FrameFormatError('Invalid frame payload (bad magic)')
+
+    raw, offset = _read(view, offset, _U16.size)
+    raw, offset = _read(view, offset, _U16.unpack(raw)[0])
+    model_id = _text(raw, 'modelId')
+
+    raw, offset = _read(view, offset, _U32.size)
+    count = _U32.unpack(raw)[0]
+
+    frames = []
+    for _ in range(count):
+        raw, offset = _read(view, offset, _U16.size)
+        raw, offset = _read(view, offset, _U16.unpack(raw)[0])
+        name = _text(raw, 'frame name')
+        raw, offset = _read(view, offset, _U32.size)
+        data, offset = _read(view, offset, _U32.unpack(raw)[0])
+        frames.append((name, data))
+
+    if offset != len(view):
+        raise FrameFormatError('Trailing bytes after the last frame')
+
+    return model_id, frames
+
+
+def encode_frames(model_id, frames):
+    """
+    Operazione inversa di decode_frames; frames e' una lista di (name, bytes).
+    """
+    model_id = model_id.encode('utf-8')
+    parts = [MAGIC, _U16.pack(len(model_id)), model_id, _U32.pack(len(frames))]
+    for name, data in frames:
+        name = name.encode('utf-8')
+        parts += [_U16.pack(len(name)), name, _U32.pack(len(data)), data]
+
+    return b''.join(parts)